@@ -0,0 +1,167 @@
+"""
+外部サイトへの取得の受付制御
+同時に実行する取得の数（スロット）を固定し、空きを待つ列の長さも制限する
+列が一杯・待ち時間の上限を超えた要求はAdmissionRejectedで断る（APIでは503とRetry-After、列の長さと順番のヘッダー）
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, List, Optional
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 実績が無い間に使う、1回の取得にかかる時間の見込み（秒）
+DEFAULT_HOLD_SECONDS = 5.0
+
+
+class AdmissionRejected(Exception):
+    """混雑のため取得を受け付けなかった"""
+
+    def __init__(self, reason: str, retry_after: float, queue_depth: int, queue_position: int = None):
+        super().__init__(
+            f"Scrape rejected ({reason}), queue position {queue_position}/{queue_depth}, retry after {retry_after:.0f}s"
+        )
+        self.reason = reason
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+        # 断られた時点での列の中の順番（列が一杯の場合は並んだとしたら付く順番）
+        self.queue_position = queue_position
+
+
+class AdmissionController:
+    """スロット数と待ち列の長さを制限した先着順の受付"""
+
+    def __init__(self, slots: int = None, queue_limit: int = None, queue_timeout: float = None):
+        self.slots = slots if slots is not None else settings.ADMISSION_MAX_CONCURRENT
+        self.queue_limit = queue_limit if queue_limit is not None else settings.ADMISSION_QUEUE_LIMIT
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ADMISSION_QUEUE_TIMEOUT
+        self.in_use = 0
+        # 空きを待つ要求（先頭から順にスロットを渡す）と、列に並んだ時刻
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._enqueued_at = {}
+        self._hold_seconds: Optional[float] = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        スロットを確保している間だけ取得を実行する（slots=0なら制限しない）
+
+        Raises:
+            AdmissionRejected: 待ち列が一杯、または待ち時間の上限を超えた
+        """
+        if self.slots <= 0:
+            yield
+            return
+        await self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._observe(time.monotonic() - start)
+            self._release()
+
+    def queue_waits(self) -> List[float]:
+        """列に並んでいる要求の待ち時間（秒、先頭から順。添字+1が列の中の順番）"""
+        now = time.monotonic()
+        return [round(now - self._enqueued_at[w], 1) for w in self._waiters if w in self._enqueued_at]
+
+    def retry_after(self) -> float:
+        """今並んだ場合にスロットが空くまでの見込み秒数（Retry-After用）"""
+        hold = self._hold_seconds or DEFAULT_HOLD_SECONDS
+        return max(1.0, (self.queue_depth + 1) / max(1, self.slots) * hold)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        oldest = min(self._enqueued_at.values(), default=None)
+        return {
+            'slots': self.slots,
+            'in_use': self.in_use,
+            'queue_depth': self.queue_depth,
+            'queue_limit': self.queue_limit,
+            'max_queue_depth': self.max_queue_depth,
+            'oldest_wait_seconds': round(now - oldest, 1) if oldest is not None else 0,
+            'queue_wait_seconds': self.queue_waits(),
+            'estimated_wait_seconds': round(self.retry_after(), 1),
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected_full': self.rejected_full,
+            'rejected_timeout': self.rejected_timeout,
+        }
+
+    async def _acquire(self):
+        if self.in_use < self.slots and not self._waiters:
+            self.in_use += 1
+            self.admitted += 1
+            return
+        if self.queue_depth >= self.queue_limit:
+            self.rejected_full += 1
+            raise AdmissionRejected('queue full', self.retry_after(), self.queue_depth, self.queue_depth + 1)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._enqueued_at[waiter] = time.monotonic()
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        logger.info(f"Scrape queued at position {self.queue_depth} ({self.in_use}/{self.slots} slots busy)")
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            position = self._position(waiter)
+            depth = self.queue_depth
+            self._abandon(waiter)
+            self.rejected_timeout += 1
+            raise AdmissionRejected('queue timeout', self.retry_after(), depth, position)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        finally:
+            self._enqueued_at.pop(waiter, None)
+        self.admitted += 1
+
+    def _position(self, waiter: asyncio.Future) -> Optional[int]:
+        """列の中の順番（1始まり。列に無ければNone）"""
+        try:
+            return self._waiters.index(waiter) + 1
+        except ValueError:
+            return None
+
+    def _abandon(self, waiter: asyncio.Future):
+        """待つのをやめた要求を列から外す（直前にスロットを渡されていたら返す）"""
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        if waiter.done() and not waiter.cancelled():
+            self._release()
+
+    def _release(self):
+        """スロットを列の先頭に渡す（待っている要求が無ければ空ける）"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+    def _observe(self, seconds: float):
+        """スロットの保持時間の移動平均（Retry-Afterの見積もり用）"""
+        if self._hold_seconds is None:
+            self._hold_seconds = seconds
+        else:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * seconds
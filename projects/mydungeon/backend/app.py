@@ -2,11 +2,15 @@
 My Dungeon FastAPI Application
 生年月日と時刻から運命のアイテムと必殺技を診断するWebアプリケーション
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from playwright.async_api import TimeoutError as PlaywrightTimeout
+import asyncio
+import math
 import logging
 import os
 import sys
@@ -15,6 +19,17 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.config import settings
+from backend.browser_pool import browser_pool
+from backend.page_pool import form_page_pool
+from backend.resource_filter import resource_filter
+from backend.scrape_backends import close_http_client
+from backend.result_cache import scrape_cache
+from backend.scraper import scrape_admission, scrape_executor, scrape_flights, upstream_breaker
+from backend.circuit_breaker import CircuitOpenError
+from backend.admission import AdmissionRejected
+from backend.diagnostics import current_request_id, diagnostics, new_request_id
+from backend.scraper_worker import ScraperWorkerClient, ScraperWorkerError
+from backend.readiness import signal_counts as readiness_signal_counts
 from backend.dungeon_service import DungeonService
 from backend.compatibility_service import CompatibilityService
 from backend.models import CompatibilityRequest
@@ -26,11 +41,75 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    起動時にブラウザプールとページプールを立ち上げ、終了時にドレインして閉じる
+    （スクレイパーワーカー設定時はブラウザをワーカー側が持つため、ワーカーへの接続だけを閉じる）
+    """
+    if settings.SCRAPER_WORKER_SOCKETS:
+        yield
+        for scraper in (service.scraper, compatibility_service.scraper):
+            await scraper.close()
+        return
+
+    await browser_pool.start()
+    await form_page_pool.start()
+    yield
+    await form_page_pool.stop()
+    await browser_pool.stop()
+    await close_http_client()
+    await diagnostics.drain()
+    scrape_cache.close()
+
+
+# ワーカーから返るタイムアウト系の例外クラス名
+UPSTREAM_TIMEOUT_ERROR_TYPES = {'TimeoutError', 'ReadinessTimeout'}
+
+# 混雑・障害で断った場合の例外クラス名と、ワーカーから再試行までの秒数が返らなかった場合の既定値
+SHED_ERROR_RETRY_AFTER = {
+    'CircuitOpenError': settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+    'AdmissionRejected': settings.ADMISSION_QUEUE_TIMEOUT,
+}
+
+
+def http_error(e: Exception) -> HTTPException:
+    """
+    例外をレスポンスに変換する
+
+    外部サイトの障害でブレーカーが開いている場合と、混雑で取得を受け付けなかった場合は
+    503（Retry-After付き。混雑の場合は待ち列の長さと順番をX-Queue-Depth・X-Queue-Positionで返す）、
+    再試行しても外部サイトが応答しない場合は504、それ以外は500
+    """
+    retry_after = None
+    if isinstance(e, (CircuitOpenError, AdmissionRejected)):
+        retry_after = e.retry_after
+    elif isinstance(e, ScraperWorkerError) and e.error_type in SHED_ERROR_RETRY_AFTER:
+        retry_after = e.retry_after or SHED_ERROR_RETRY_AFTER[e.error_type]
+    if retry_after is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+        for header, attr in (("X-Queue-Depth", 'queue_depth'), ("X-Queue-Position", 'queue_position')):
+            if getattr(e, attr, None) is not None:
+                headers[header] = str(getattr(e, attr))
+        return HTTPException(
+            status_code=503,
+            detail="外部サイトが混雑しています。しばらくしてから再度お試しください",
+            headers=headers
+        )
+    if isinstance(e, (PlaywrightTimeout, asyncio.TimeoutError)):
+        return HTTPException(status_code=504, detail=str(e))
+    if isinstance(e, ScraperWorkerError) and e.error_type in UPSTREAM_TIMEOUT_ERROR_TYPES:
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+
 # FastAPIアプリケーション
 app = FastAPI(
     title="My Dungeon API",
     description="生年月日から運命のアイテムと必殺技を診断",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -40,8 +119,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 混雑時の503で、フロントエンドから再試行までの秒数と待ち列の状況を読めるようにする
+    expose_headers=["Retry-After", "X-Queue-Depth", "X-Queue-Position"],
 )
 
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """リクエストIDを採番し（X-Request-IDがあれば引き継ぐ）、診断情報の記録とレスポンスヘッダーに使う"""
+    request_id = new_request_id(request.headers.get("x-request-id"))
+    token = current_request_id.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        current_request_id.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 # サービスのインスタンス
 service = DungeonService()
 compatibility_service = CompatibilityService()
@@ -114,7 +208,7 @@ async def generate_result(request: GenerateRequest):
 
     except Exception as e:
         logger.error(f"Error generating result: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 
 @app.post("/api/generate-compatibility")
@@ -168,7 +262,7 @@ async def generate_compatibility_result(request: CompatibilityRequest):
 
     except Exception as e:
         logger.error(f"Error generating compatibility result: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 
 @app.get("/api/health")
@@ -181,6 +275,29 @@ async def health_check():
     }
 
 
+@app.get("/api/scraper/stats")
+async def scraper_stats():
+    """スクレイパー（ブラウザプール・ページプール・リソース遮断・準備完了判定）の統計"""
+    if isinstance(service.scraper, ScraperWorkerClient):
+        return {
+            "workers": await service.scraper.stats(),
+            "failovers": service.scraper.failovers,
+        }
+    return {
+        "browser_pool": browser_pool.stats(),
+        "form_page_pool": form_page_pool.stats(),
+        "resource_filter": resource_filter.stats(),
+        "readiness_signals": dict(readiness_signal_counts),
+        "backend": service.scraper.backend.stats(),
+        "cache": scrape_cache.stats(),
+        "single_flight": scrape_flights.stats(),
+        "resilience": scrape_executor.stats(),
+        "circuit_breaker": upstream_breaker.stats(),
+        "admission": scrape_admission.stats(),
+        "diagnostics": diagnostics.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,382 @@
+"""
+Chromiumブラウザプール
+アプリ起動時にブラウザを常駐させ、リクエストごとに独立したコンテキストを払い出す
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Set
+from playwright.async_api import async_playwright, Browser, Page
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 日本のタイムゾーンとロケール（スクレイピング対象サイトに合わせる）
+CONTEXT_OPTIONS = {
+    'timezone_id': 'Asia/Tokyo',
+    'locale': 'ja-JP',
+}
+
+
+# プロセスツリーのRSSを測るため、起動したブラウザのコマンドラインに付ける目印
+# （Chromiumは未知のスイッチを無視する）
+BROWSER_MARKER_SWITCH = '--mydungeon-browser'
+
+
+def process_tree_rss(marker: str) -> Optional[int]:
+    """
+    コマンドラインに目印を含むプロセスとその子孫（レンダラーなど）のRSS合計（バイト）
+
+    /procが無い環境（Linux以外）ではNoneを返す。
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    children: Dict[int, List[int]] = {}
+    roots = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                # commに空白や括弧が入りうるため、最後の ')' の後ろから読む
+                fields = f.read().rsplit(b')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(pid)
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if marker.encode() in f.read().split(b'\0'):
+                    roots.append(pid)
+        except (OSError, IndexError, ValueError):
+            continue
+    if not roots:
+        return None
+
+    total = 0
+    stack = list(roots)
+    seen: Set[int] = set()
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f'/proc/{pid}/statm', 'rb') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class PooledBrowser:
+    """プール内の1つのブラウザと利用状況"""
+
+    def __init__(self, browser: Browser, marker: str = None):
+        self.browser = browser
+        self.marker = marker
+        self.active_contexts = 0
+        self.contexts_served = 0
+        self.pages_served = 0
+        self.rss_bytes: Optional[int] = None
+        self.retired = False
+        # 代わりのブラウザを起動中（同じブラウザの入れ替えを重ねて始めない）
+        self.replacing = False
+        self.launched_at = time.monotonic()
+
+    @property
+    def is_healthy(self) -> bool:
+        return self.browser.is_connected()
+
+
+class BrowserPool:
+    """常駐Chromiumブラウザのプール"""
+
+    def __init__(self, size: int = None):
+        self.size = size if size is not None else settings.BROWSER_POOL_SIZE
+        self._playwright = None
+        self._browsers: List[PooledBrowser] = []
+        self._lock = asyncio.Lock()
+        self._idle = asyncio.Condition()
+        self._health_task: Optional[asyncio.Task] = None
+        self._drain_tasks: Set[asyncio.Task] = set()
+        self._ids = itertools.count(1)
+        self._started = False
+        self._closing = False
+        self.relaunches = 0
+        self.recycles = 0
+        self.recycle_reasons: Counter = Counter()
+        # ブラウザを入れ替え対象にした直後に呼ぶ関数（ページプールが待機中のページを手放すため）
+        self.retire_listeners: List[Callable[[], None]] = []
+        self.max_pages = settings.BROWSER_RECYCLE_MAX_PAGES
+        self.max_rss_bytes = settings.BROWSER_RECYCLE_MAX_RSS_MB * 1024 * 1024
+
+    @property
+    def is_running(self) -> bool:
+        return self._started and not self._closing
+
+    async def start(self):
+        """Playwrightを起動し、プールサイズ分のブラウザを立ち上げる"""
+        if self.size <= 0:
+            logger.info("Browser pool disabled (BROWSER_POOL_SIZE=0), launching per request")
+            return
+
+        async with self._lock:
+            if self._started:
+                return
+            self._closing = False
+            self._playwright = await async_playwright().start()
+            for _ in range(self.size):
+                self._browsers.append(await self._launch())
+            self._started = True
+
+        if settings.BROWSER_HEALTH_CHECK_INTERVAL > 0:
+            self._health_task = asyncio.create_task(self._health_check_loop())
+
+        logger.info(f"Browser pool started with {self.size} browser(s)")
+
+    async def stop(self):
+        """新規払い出しを止め、使用中のコンテキストが閉じるのを待ってから全ブラウザを終了"""
+        if not self._started:
+            return
+        self._closing = True
+
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+        # 入れ替え中のブラウザも以下でまとめて閉じる
+        for task in list(self._drain_tasks):
+            task.cancel()
+        await asyncio.gather(*self._drain_tasks, return_exceptions=True)
+
+        # 使用中のコンテキストが返却されるまで待機（タイムアウト付き）
+        try:
+            async with self._idle:
+                await asyncio.wait_for(
+                    self._idle.wait_for(lambda: all(b.active_contexts == 0 for b in self._browsers)),
+                    timeout=settings.BROWSER_POOL_DRAIN_TIMEOUT
+                )
+        except asyncio.TimeoutError:
+            logger.warning("Browser pool drain timed out, closing browsers with active contexts")
+
+        async with self._lock:
+            for pooled in self._browsers:
+                await self._close_browser(pooled)
+            self._browsers = []
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+            self._started = False
+
+        logger.info("Browser pool stopped")
+
+    @asynccontextmanager
+    async def new_context(self):
+        """
+        独立したブラウザコンテキストを払い出す
+
+        プールが起動していない場合（スクリプトやテストから直接呼ばれた場合）は、
+        従来どおりその場でブラウザを起動して終了時に閉じる
+        """
+        if not self.is_running:
+            async with self._ephemeral_context() as context:
+                yield context
+            return
+
+        pooled = await self._checkout()
+        context = None
+        try:
+            context = await pooled.browser.new_context(**CONTEXT_OPTIONS)
+            yield context
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close browser context: {str(e)}")
+            await self._checkin(pooled)
+
+    async def health_check(self):
+        """
+        切断されたブラウザを検出して再起動する
+
+        代わりのブラウザの起動はロックの外で行い、差し替えるときだけロックを取る
+        （起動中も他のブラウザからコンテキストを払い出せるようにする）。
+        """
+        if not self.is_running:
+            return
+        for i, pooled in enumerate(list(self._browsers)):
+            if pooled.is_healthy or pooled.retired or pooled.replacing:
+                continue
+            logger.warning(f"Browser #{i} is disconnected, relaunching")
+            replacement = await self._launch_replacement(pooled)
+            async with self._lock:
+                swapped = self.is_running and pooled in self._browsers
+                if swapped:
+                    self._browsers[self._browsers.index(pooled)] = replacement
+                    self.relaunches += 1
+            await self._close_browser(pooled if swapped else replacement)
+
+    def record_page_use(self, page: Page):
+        """ページが1回スクレイピングに使われたことを記録し、使用回数の上限でブラウザを入れ替える"""
+        pooled = self._owner_of(page)
+        if pooled is None:
+            return
+        pooled.pages_served += 1
+        if self.max_pages > 0 and pooled.pages_served >= self.max_pages and not pooled.retired:
+            self._spawn_recycle(pooled, 'pages')
+
+    def is_retired(self, page: Page) -> bool:
+        """ページのブラウザが入れ替え対象になっているか（プール外のブラウザはFalse）"""
+        pooled = self._owner_of(page)
+        return pooled is not None and pooled.retired
+
+    async def recycle_check(self):
+        """各ブラウザのプロセスツリーのRSSを測り、上限を超えたものを入れ替える"""
+        if not self.is_running:
+            return
+        for pooled in list(self._browsers):
+            if pooled.retired or pooled.marker is None:
+                continue
+            pooled.rss_bytes = await asyncio.to_thread(process_tree_rss, pooled.marker)
+            if self.max_rss_bytes > 0 and pooled.rss_bytes is not None and pooled.rss_bytes >= self.max_rss_bytes:
+                self._spawn_recycle(pooled, 'memory')
+
+    async def recycle(self, pooled: PooledBrowser, reason: str):
+        """
+        ブラウザを入れ替える
+
+        先に代わりのブラウザを起動してプールに加え、古いブラウザには新しいコンテキストを
+        払い出さないようにしてから、使用中のコンテキストが返却されるのを待って閉じる。
+        代わりのブラウザの起動はロックの外で行い、プールに加えるときだけロックを取る。
+        """
+        if pooled.retired or pooled.replacing or pooled not in self._browsers or not self.is_running:
+            return
+        replacement = await self._launch_replacement(pooled)
+        async with self._lock:
+            if pooled not in self._browsers or not self.is_running:
+                await self._close_browser(replacement)
+                return
+            self._browsers.append(replacement)
+            pooled.retired = True
+            self.recycles += 1
+            self.recycle_reasons[reason] += 1
+        for listener in self.retire_listeners:
+            listener()
+        rss_mb = f"{pooled.rss_bytes / 1024 / 1024:.0f}MB" if pooled.rss_bytes is not None else "unknown"
+        logger.info(f"Recycling browser ({reason}): pages served {pooled.pages_served}, RSS {rss_mb}")
+
+        try:
+            async with self._idle:
+                await asyncio.wait_for(
+                    self._idle.wait_for(lambda: pooled.active_contexts == 0),
+                    timeout=settings.BROWSER_POOL_DRAIN_TIMEOUT
+                )
+        except asyncio.TimeoutError:
+            logger.warning("Retired browser drain timed out, closing it with active contexts")
+
+        async with self._lock:
+            if pooled in self._browsers:
+                self._browsers.remove(pooled)
+                await self._close_browser(pooled)
+
+    def stats(self) -> dict:
+        """プールの状態を返す"""
+        return {
+            'running': self.is_running,
+            'size': self.size,
+            'relaunches': self.relaunches,
+            'recycles': self.recycles,
+            'recycle_reasons': dict(self.recycle_reasons),
+            'browsers': [
+                {
+                    'healthy': pooled.is_healthy,
+                    'retired': pooled.retired,
+                    'active_contexts': pooled.active_contexts,
+                    'contexts_served': pooled.contexts_served,
+                    'pages_served': pooled.pages_served,
+                    'rss_mb': round(pooled.rss_bytes / 1024 / 1024, 1) if pooled.rss_bytes is not None else None,
+                    'uptime_seconds': round(time.monotonic() - pooled.launched_at, 1),
+                }
+                for pooled in self._browsers
+            ],
+        }
+
+    async def _launch(self) -> PooledBrowser:
+        # Codespaces環境ではXServerが無いため、常にヘッドレスモードを使用
+        marker = f"{BROWSER_MARKER_SWITCH}={os.getpid()}-{next(self._ids)}"
+        browser = await self._playwright.chromium.launch(headless=True, args=[marker])
+        return PooledBrowser(browser, marker)
+
+    async def _launch_replacement(self, pooled: PooledBrowser) -> PooledBrowser:
+        """pooledの代わりのブラウザを起動する（起動中はpooled.replacingを立てる）"""
+        pooled.replacing = True
+        try:
+            return await self._launch()
+        finally:
+            pooled.replacing = False
+
+    def _owner_of(self, page: Page) -> Optional[PooledBrowser]:
+        browser = page.context.browser
+        return next((pooled for pooled in self._browsers if pooled.browser is browser), None)
+
+    def _spawn_recycle(self, pooled: PooledBrowser, reason: str):
+        task = asyncio.create_task(self.recycle(pooled, reason))
+        self._drain_tasks.add(task)
+        task.add_done_callback(self._drain_tasks.discard)
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Failed to close browser: {str(e)}")
+
+    async def _checkout(self) -> PooledBrowser:
+        """使用中コンテキストが最も少ない健全なブラウザを選ぶ"""
+        async with self._lock:
+            active = [b for b in self._browsers if not b.retired] or self._browsers
+            candidates = [b for b in active if b.is_healthy] or active
+            pooled = min(candidates, key=lambda b: b.active_contexts)
+            pooled.active_contexts += 1
+            pooled.contexts_served += 1
+            return pooled
+
+    async def _checkin(self, pooled: PooledBrowser):
+        async with self._idle:
+            pooled.active_contexts -= 1
+            self._idle.notify_all()
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(settings.BROWSER_HEALTH_CHECK_INTERVAL)
+            try:
+                await self.health_check()
+                await self.recycle_check()
+            except Exception as e:
+                logger.error(f"Browser health check failed: {str(e)}")
+
+    @asynccontextmanager
+    async def _ephemeral_context(self):
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            context = await browser.new_context(**CONTEXT_OPTIONS)
+            try:
+                yield context
+            finally:
+                await context.close()
+                await browser.close()
+
+
+# アプリ全体で共有するブラウザプール
+browser_pool = BrowserPool()
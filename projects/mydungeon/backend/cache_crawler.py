@@ -0,0 +1,346 @@
+"""
+スクレイピング結果キャッシュの事前投入クローラー（オフラインツール）
+指定した期間の生年月日×時刻を並列数・アクセス間隔を制限しながら取得してキャッシュに保存する
+途中経過はチェックポイントに保存し、中断しても続きから再開できる
+
+使い方:
+    python -m backend.cache_crawler --start-year 1970 --end-year 2005 --step 60
+    python -m backend.cache_crawler --start-year 1970 --end-year 2005 --bucketed --concurrency 4 --rate 2
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import date, timedelta
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.browser_pool import browser_pool
+from backend.page_pool import form_page_pool
+from backend.key_buckets import MINUTES_PER_DAY, TimeBucketTable, key_buckets
+from backend.scraper import BatchItem, DungeonScraper
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def format_minute(minute_of_day: int) -> str:
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+
+def crawl_times(step: int = 60, table: TimeBucketTable = None) -> List[str]:
+    """
+    1日の中で取得する時刻の一覧
+
+    バケット表が有効な場合は各バケットの先頭（同じ結果になる時刻の代表）だけを取得する。
+    """
+    if table is not None and table.boundaries is not None:
+        return [format_minute(m) for m in table.boundaries]
+    return [format_minute(m) for m in range(0, MINUTES_PER_DAY, step)]
+
+
+def crawl_inputs(start: date, end: date, times: List[str], table: TimeBucketTable = None) -> Iterator[Tuple[str, str, str]]:
+    """
+    取得対象の (キー, 生年月日, 時刻) を日付順に列挙
+
+    同じキーにまとまる入力（時刻に依存しない日付など）は1回だけ返す。
+    """
+    table = table or TimeBucketTable()
+    day = start
+    while day <= end:
+        birthdate = day.isoformat()
+        seen: Set[str] = set()
+        for birthtime in times:
+            key = table.canonical_key(birthdate, birthtime)
+            if key not in seen:
+                seen.add(key)
+                yield key, birthdate, birthtime
+        day += timedelta(days=1)
+
+
+class RateLimiter:
+    """外部サイトへのアクセス間隔を全ワーカーで共有して制限する"""
+
+    def __init__(self, rate: float):
+        # rate: 1秒あたりの最大リクエスト数（0以下で無制限）
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if self.interval <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CrawlCheckpoint:
+    """
+    クローラーの進捗（ジョブ条件と、先頭から連続して成功した件数・失敗したキー）
+
+    取得済みの入力そのものはキャッシュに残るため、チェックポイントは先頭から連続して
+    成功した位置だけを持ち、再開時はその位置から先をキャッシュと照合して続ける。
+    失敗したキーも保存し、再開時は先に取得し直す（成功したキーは一覧から外す）。
+    """
+
+    def __init__(self, path: str, job: dict):
+        self.path = path
+        self.job = job
+        self.position = 0
+        self.failed: List[str] = []
+
+    def load(self) -> bool:
+        """同じ条件のチェックポイントがあれば読み込む"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load crawler checkpoint {self.path}: {str(e)}")
+            return False
+        if data.get('job') != self.job:
+            logger.info("Checkpoint belongs to a different job, starting over")
+            return False
+        self.position = data.get('position', 0)
+        self.failed = list(data.get('failed', []))
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'job': self.job,
+                'position': self.position,
+                'failed': self.failed,
+                'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class CacheCrawler:
+    """有界のワーカープールで入力を取得してキャッシュを埋めるクローラー（ワーカーはバッチ単位で1ページを使う）"""
+
+    def __init__(
+        self,
+        scraper: DungeonScraper = None,
+        concurrency: int = None,
+        rate: float = None,
+        progress_interval: float = None,
+        batch_size: int = None
+    ):
+        self.scraper = scraper or DungeonScraper()
+        self.concurrency = concurrency or settings.CRAWLER_CONCURRENCY
+        self.rate_limiter = RateLimiter(rate if rate is not None else settings.CRAWLER_RATE_LIMIT)
+        self.batch_size = max(1, batch_size or settings.CRAWLER_BATCH_SIZE)
+        self.progress_interval = progress_interval if progress_interval is not None else settings.CRAWLER_PROGRESS_INTERVAL
+        self.total = 0
+        self.fetched = 0
+        self.skipped = 0
+        self.failed = 0
+        self._started = 0.0
+        self._last_report = 0.0
+
+    async def run(self, inputs: List[Tuple[str, str, str]], checkpoint: CrawlCheckpoint = None) -> dict:
+        """
+        入力を取得してキャッシュに保存し、結果の統計を返す
+
+        チェックポイントを渡した場合は、前回失敗したキーを先に取得し直してから
+        その位置から再開し、進捗を随時保存する。
+        """
+        start = checkpoint.position if checkpoint else 0
+        retry_keys = set(checkpoint.failed) if checkpoint else set()
+        retry = [index for index, (key, _, _) in enumerate(inputs) if key in retry_keys]
+        order = retry + [index for index in range(start, len(inputs)) if inputs[index][0] not in retry_keys]
+        self.total = len(inputs)
+        self.skipped = start - sum(1 for index in retry if index < start)
+        self._started = self._last_report = time.monotonic()
+
+        # 各入力の成功状態（先頭から連続した成功位置をチェックポイントに書く）
+        done = [False] * len(inputs)
+        position = start
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        def finish(index: int, key: str, ok: bool):
+            nonlocal position
+            if checkpoint:
+                if not ok and key not in checkpoint.failed:
+                    checkpoint.failed.append(key)
+                elif ok and key in checkpoint.failed:
+                    checkpoint.failed.remove(key)
+            done[index] = ok
+            while position < len(done) and done[position]:
+                position += 1
+            if checkpoint:
+                checkpoint.position = position
+            self._report(checkpoint)
+
+        async def worker():
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                await self._crawl_batch(batch, finish)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            for offset in range(0, len(order), self.batch_size):
+                indexes = order[offset:offset + self.batch_size]
+                await queue.put([(index, inputs[index]) for index in indexes])
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            if checkpoint:
+                checkpoint.save()
+
+        return self.stats()
+
+    async def _crawl_batch(self, batch: List[Tuple[int, Tuple[str, str, str]]], finish: Callable[[int, str, bool], None]):
+        """
+        1バッチ分を1つのページでまとめて取得（キャッシュ済みなら外部サイトにはアクセスしない）
+
+        scrape_manyは次の結果を要求されるまで次の入力を送信しないため、
+        要求の前に待つことでアクセス間隔を制限する。
+        """
+        targets = []
+        for index, (key, birthdate, birthtime) in batch:
+            if await self.scraper.cache.contains_async(key):
+                self.skipped += 1
+                finish(index, key, True)
+            else:
+                targets.append((index, key, birthdate, birthtime))
+        if not targets:
+            return
+
+        results = self.scraper.scrape_many([(birthdate, birthtime) for _, _, birthdate, birthtime in targets])
+        remaining = {(birthdate, birthtime): (index, key) for index, key, birthdate, birthtime in targets}
+        try:
+            while True:
+                await self.rate_limiter.wait()
+                try:
+                    item = await results.__anext__()
+                except StopAsyncIteration:
+                    break
+                index, key = remaining.pop((item.birthdate, item.birthtime))
+                finish(index, key, self._record(key, item))
+        except Exception as e:
+            logger.warning(f"Batch failed: {str(e)}")
+        finally:
+            await results.aclose()
+            # バッチ全体が失敗した場合に返らなかった入力
+            for index, key in remaining.values():
+                self.failed += 1
+                finish(index, key, False)
+
+    def _record(self, key: str, item: BatchItem) -> bool:
+        if item.error is not None:
+            logger.warning(f"Failed to crawl {key}: {str(item.error)}")
+            self.failed += 1
+            return False
+        if not item.numbers:
+            logger.warning(f"No numbers for {key}")
+            self.failed += 1
+            return False
+        self.fetched += 1
+        return True
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        completed = self.fetched + self.skipped + self.failed
+        return {
+            'total': self.total,
+            'completed': completed,
+            'fetched': self.fetched,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'elapsed_seconds': round(elapsed, 1),
+            'fetch_rate': round(self.fetched / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    def _report(self, checkpoint: Optional[CrawlCheckpoint]):
+        """一定間隔で進捗を表示し、チェックポイントを保存"""
+        now = time.monotonic()
+        if now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        stats = self.stats()
+        remaining = self.total - stats['completed']
+        eta = remaining / stats['fetch_rate'] if stats['fetch_rate'] > 0 else 0
+        logger.info(
+            f"Progress {stats['completed']}/{self.total} "
+            f"(fetched {self.fetched}, skipped {self.skipped}, failed {self.failed}, "
+            f"{stats['fetch_rate']}/s, ETA {eta / 60:.0f}min)"
+        )
+        if checkpoint:
+            checkpoint.save()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="スクレイピング結果キャッシュを事前に埋める")
+    parser.add_argument('--start-year', type=int, default=1970)
+    parser.add_argument('--end-year', type=int, default=2005)
+    parser.add_argument('--start-date', help="開始日（YYYY-MM-DD、--start-yearより優先）")
+    parser.add_argument('--end-date', help="終了日（YYYY-MM-DD、--end-yearより優先）")
+    parser.add_argument('--step', type=int, default=60, help="時刻の間隔（分）")
+    parser.add_argument('--bucketed', action='store_true', help="バケット表の各バケットの先頭時刻だけを取得する")
+    parser.add_argument('--concurrency', type=int, default=settings.CRAWLER_CONCURRENCY)
+    parser.add_argument('--batch-size', type=int, default=settings.CRAWLER_BATCH_SIZE, help="1ページで続けて取得する件数")
+    parser.add_argument('--rate', type=float, default=settings.CRAWLER_RATE_LIMIT, help="1秒あたりの最大リクエスト数（0で無制限）")
+    parser.add_argument('--checkpoint', default=settings.CRAWLER_CHECKPOINT_FILE)
+    parser.add_argument('--restart', action='store_true', help="チェックポイントを無視して最初から実行")
+    args = parser.parse_args()
+
+    scraper = DungeonScraper()
+    if not scraper.cache_enabled:
+        print("キャッシュが無効（SCRAPE_CACHE_ENABLED=false、または再生モードでSCRAPE_CACHE_IN_REPLAY=false）のため保存できません")
+        return
+
+    start = date.fromisoformat(args.start_date) if args.start_date else date(args.start_year, 1, 1)
+    end = date.fromisoformat(args.end_date) if args.end_date else date(args.end_year, 12, 31)
+    if args.bucketed and key_buckets.boundaries is None:
+        logger.warning("Key bucket table is not available, falling back to --step")
+    times = crawl_times(args.step, key_buckets if args.bucketed else None)
+    inputs = list(crawl_inputs(start, end, times, key_buckets))
+
+    job = {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'times': times,
+        'cache_version': settings.SCRAPE_CACHE_VERSION,
+    }
+    checkpoint = CrawlCheckpoint(args.checkpoint, job)
+    if not args.restart and checkpoint.load():
+        logger.info(f"Resuming from checkpoint at {checkpoint.position}/{len(inputs)}")
+
+    logger.info(f"Crawling {len(inputs)} inputs ({start} - {end}, {len(times)} times/day)")
+    await browser_pool.start()
+    await form_page_pool.start()
+    try:
+        crawler = CacheCrawler(scraper, concurrency=args.concurrency, rate=args.rate, batch_size=args.batch_size)
+        stats = await crawler.run(inputs, checkpoint)
+    finally:
+        await form_page_pool.stop()
+        await browser_pool.stop()
+
+    print("=" * 60)
+    for name, value in stats.items():
+        print(f"{name}: {value}")
+    if checkpoint.failed:
+        print(f"失敗したキー（{len(checkpoint.failed)}件）は再実行すると再取得されます")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""
+外部サイト向けのサーキットブレーカー
+直近の呼び出しのエラー率・遅い呼び出しの割合が閾値を超えたら開き、一定時間は即座に失敗させる
+時間が経つと半開状態になり、少数の試行が成功すれば閉じる
+"""
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているため呼び出さなかった"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """エラー率・遅延で開くサーキットブレーカー"""
+
+    def __init__(
+        self,
+        name: str = 'upstream',
+        enabled: bool = None,
+        window: int = None,
+        min_calls: int = None,
+        failure_rate: float = None,
+        slow_call_seconds: float = None,
+        slow_call_rate: float = None,
+        open_seconds: float = None,
+        half_open_probes: int = None
+    ):
+        self.name = name
+        self.enabled = enabled if enabled is not None else settings.CIRCUIT_BREAKER_ENABLED
+        self.min_calls = min_calls or settings.CIRCUIT_BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or settings.CIRCUIT_BREAKER_FAILURE_RATE
+        self.slow_call_seconds = slow_call_seconds or settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS
+        self.slow_call_rate = slow_call_rate or settings.CIRCUIT_BREAKER_SLOW_CALL_RATE
+        self.open_seconds = open_seconds or settings.CIRCUIT_BREAKER_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or settings.CIRCUIT_BREAKER_HALF_OPEN_PROBES
+        # 直近の呼び出し結果 (成功したか, 遅かったか)
+        self._outcomes = deque(maxlen=window or settings.CIRCUIT_BREAKER_WINDOW)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.trips = 0
+        self.last_trip_reason: Optional[str] = None
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        ブレーカー越しにfnを呼ぶ
+
+        Raises:
+            CircuitOpenError: ブレーカーが開いている（半開で試行枠が埋まっている場合も含む）
+        """
+        if not self.enabled:
+            return await fn()
+        probe = self._admit()
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except Exception:
+            self._record(probe, False, time.monotonic() - start)
+            raise
+        except BaseException:
+            # キャンセルされた試行は結果に数えず、半開状態の試行枠だけ返す
+            if probe and self.state == HALF_OPEN:
+                self._probes_in_flight -= 1
+            raise
+        self._record(probe, True, time.monotonic() - start)
+        return result
+
+    @property
+    def retry_after(self) -> float:
+        """開いている場合、半開になるまでの秒数"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allows_calls(self) -> bool:
+        """今呼び出せば拒否されないか（状態は変えない）"""
+        if not self.enabled or self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self.retry_after <= 0
+        return self._probes_in_flight < self.half_open_probes
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'state': self.state,
+            'retry_after_seconds': round(self.retry_after, 1),
+            'calls': self.calls,
+            'failures': self.failures,
+            'slow_calls': self.slow_calls,
+            'rejected': self.rejected,
+            'trips': self.trips,
+            'last_trip_reason': self.last_trip_reason,
+        }
+
+    def _admit(self) -> bool:
+        """呼び出しを通すか判定し、半開状態の試行ならTrueを返す"""
+        if self.state == OPEN:
+            if self.retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.retry_after)
+            logger.info(f"Circuit '{self.name}' half-open, probing upstream")
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 1.0)
+            self._probes_in_flight += 1
+            self.calls += 1
+            return True
+        self.calls += 1
+        return False
+
+    def _record(self, probe: bool, ok: bool, elapsed: float):
+        slow = elapsed >= self.slow_call_seconds
+        if not ok:
+            self.failures += 1
+        if slow:
+            self.slow_calls += 1
+
+        if probe and self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+            if not ok or slow:
+                self._trip('probe failed' if not ok else 'probe slow')
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                logger.info(f"Circuit '{self.name}' closed")
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        if self.state != CLOSED:
+            return
+
+        self._outcomes.append((ok, slow))
+        if len(self._outcomes) < self.min_calls:
+            return
+        total = len(self._outcomes)
+        failure_rate = sum(1 for o, _ in self._outcomes if not o) / total
+        slow_rate = sum(1 for _, s in self._outcomes if s) / total
+        if failure_rate >= self.failure_rate:
+            self._trip(f"failure rate {failure_rate:.0%}")
+        elif slow_rate >= self.slow_call_rate:
+            self._trip(f"slow call rate {slow_rate:.0%}")
+
+    def _trip(self, reason: str):
+        logger.warning(f"Circuit '{self.name}' opened ({reason}) for {self.open_seconds:.0f}s")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+        self.last_trip_reason = reason
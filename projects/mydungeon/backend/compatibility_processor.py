@@ -2,14 +2,12 @@
 相性診断プロセッサー
 2人の数字から相性必殺技を3つのカテゴリに分類
 """
-import pandas as pd
 from typing import List, Dict, Set, Tuple
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from backend.models import HissatsuInfo
 from backend.data_processor import DataProcessor
-from backend.config import settings
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -61,61 +59,56 @@ class CompatibilityProcessor:
         # 処理済みペアを記録（重複防止）
         processed_pairs: Set[Tuple[int, int, int]] = set()
 
-        # item_dfの全行をループ
-        for _, item_row in self.data_processor.item_df.iterrows():
-            if pd.notna(item_row['対No']) and pd.notna(item_row['必殺No']):
-                num_a = int(item_row['No'])
-                num_b = int(item_row['対No'])
-                hissatsu_no = int(item_row['必殺No'])
-
-                # 重複チェック（小さい番号を先にして正規化）
-                pair_key = tuple(sorted([num_a, num_b]) + [hissatsu_no])
-                if pair_key in processed_pairs:
-                    continue
-
-                # person1とperson2が各数字を持っているかチェック
-                person1_has_a = num_a in person1_set
-                person1_has_b = num_b in person1_set
-                person2_has_a = num_a in person2_set
-                person2_has_b = num_b in person2_set
-
-                # カテゴリ1: 二人で発動する必殺技
-                # person1がAのみ、person2がBのみ（または逆）
-                if ((person1_has_a and not person1_has_b and person2_has_b and not person2_has_a) or
-                    (person1_has_b and not person1_has_a and person2_has_a and not person2_has_b)):
-
-                    hissatsu_info = self._get_hissatsu_info(hissatsu_no)
-                    if hissatsu_info and hissatsu_info not in joint_hissatsus:
-                        joint_hissatsus.append(hissatsu_info)
-                        processed_pairs.add(pair_key)
-                        logger.info(f"Joint hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
-
-                # カテゴリ2: お互いが持っている必殺技（相乗効果×2）
-                # person1もperson2もA+B（両方）を持っている
-                elif person1_has_a and person1_has_b and person2_has_a and person2_has_b:
-                    hissatsu_info = self._get_hissatsu_info(hissatsu_no)
-                    if hissatsu_info and hissatsu_info not in both_have_hissatsus:
-                        both_have_hissatsus.append(hissatsu_info)
-                        processed_pairs.add(pair_key)
-                        logger.info(f"Both have hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
-
-                # カテゴリ3: person1の相乗効果
-                # person1がA+B、person2がAまたはB（ただしperson2がA+Bではない）
-                elif person1_has_a and person1_has_b and (person2_has_a or person2_has_b) and not (person2_has_a and person2_has_b):
-                    hissatsu_info = self._get_hissatsu_info(hissatsu_no)
-                    if hissatsu_info and hissatsu_info not in person1_synergy_hissatsus:
-                        person1_synergy_hissatsus.append(hissatsu_info)
-                        processed_pairs.add(pair_key)
-                        logger.info(f"Person1 synergy hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
-
-                # カテゴリ4: person2の相乗効果
-                # person2がA+B、person1がAまたはB（ただしperson1がA+Bではない）
-                elif person2_has_a and person2_has_b and (person1_has_a or person1_has_b) and not (person1_has_a and person1_has_b):
-                    hissatsu_info = self._get_hissatsu_info(hissatsu_no)
-                    if hissatsu_info and hissatsu_info not in person2_synergy_hissatsus:
-                        person2_synergy_hissatsus.append(hissatsu_info)
-                        processed_pairs.add(pair_key)
-                        logger.info(f"Person2 synergy hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
+        # 対Noと必殺Noを持つ全行をCSVの順にループ
+        for num_a, num_b, hissatsu_no in self.data_processor.pair_rows:
+            # 重複チェック（小さい番号を先にして正規化）
+            pair_key = tuple(sorted([num_a, num_b]) + [hissatsu_no])
+            if pair_key in processed_pairs:
+                continue
+
+            # person1とperson2が各数字を持っているかチェック
+            person1_has_a = num_a in person1_set
+            person1_has_b = num_b in person1_set
+            person2_has_a = num_a in person2_set
+            person2_has_b = num_b in person2_set
+
+            # カテゴリ1: 二人で発動する必殺技
+            # person1がAのみ、person2がBのみ（または逆）
+            if ((person1_has_a and not person1_has_b and person2_has_b and not person2_has_a) or
+                (person1_has_b and not person1_has_a and person2_has_a and not person2_has_b)):
+
+                hissatsu_info = self._get_hissatsu_info(hissatsu_no)
+                if hissatsu_info and hissatsu_info not in joint_hissatsus:
+                    joint_hissatsus.append(hissatsu_info)
+                    processed_pairs.add(pair_key)
+                    logger.info(f"Joint hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
+
+            # カテゴリ2: お互いが持っている必殺技（相乗効果×2）
+            # person1もperson2もA+B（両方）を持っている
+            elif person1_has_a and person1_has_b and person2_has_a and person2_has_b:
+                hissatsu_info = self._get_hissatsu_info(hissatsu_no)
+                if hissatsu_info and hissatsu_info not in both_have_hissatsus:
+                    both_have_hissatsus.append(hissatsu_info)
+                    processed_pairs.add(pair_key)
+                    logger.info(f"Both have hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
+
+            # カテゴリ3: person1の相乗効果
+            # person1がA+B、person2がAまたはB（ただしperson2がA+Bではない）
+            elif person1_has_a and person1_has_b and (person2_has_a or person2_has_b) and not (person2_has_a and person2_has_b):
+                hissatsu_info = self._get_hissatsu_info(hissatsu_no)
+                if hissatsu_info and hissatsu_info not in person1_synergy_hissatsus:
+                    person1_synergy_hissatsus.append(hissatsu_info)
+                    processed_pairs.add(pair_key)
+                    logger.info(f"Person1 synergy hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
+
+            # カテゴリ4: person2の相乗効果
+            # person2がA+B、person1がAまたはB（ただしperson1がA+Bではない）
+            elif person2_has_a and person2_has_b and (person1_has_a or person1_has_b) and not (person1_has_a and person1_has_b):
+                hissatsu_info = self._get_hissatsu_info(hissatsu_no)
+                if hissatsu_info and hissatsu_info not in person2_synergy_hissatsus:
+                    person2_synergy_hissatsus.append(hissatsu_info)
+                    processed_pairs.add(pair_key)
+                    logger.info(f"Person2 synergy hissatsu detected: {hissatsu_info.name} (No.{num_a}, No.{num_b})")
 
         logger.info(f"Categorized hissatsus: joint={len(joint_hissatsus)}, "
                    f"both_have={len(both_have_hissatsus)}, "
@@ -192,52 +185,21 @@ class CompatibilityProcessor:
 
     def _get_hissatsu_info(self, hissatsu_no: int) -> HissatsuInfo:
         """必殺技番号からHissatsuInfoを取得"""
-        hissatsu_row = self.data_processor.hissatsu_df[
-            self.data_processor.hissatsu_df['必殺No'] == hissatsu_no
-        ]
+        hissatsu = self.data_processor.hissatsus_by_no.get(hissatsu_no)
 
-        if len(hissatsu_row) == 0:
+        if hissatsu is None:
             logger.warning(f"Hissatsu not found: {hissatsu_no}")
             return None
 
-        row = hissatsu_row.iloc[0]
-
-        # 画像パスを取得
-        image_path = self.data_processor._find_image_path(
-            hissatsu_no,
-            settings.HISSATSU_IMAGES_DIR,
-            suffix='_h'
-        )
-
-        return HissatsuInfo(
-            hissatsu_no=int(row['必殺No']),
-            name=row['必殺技名'],
-            color=row['色'],
-            meaning=row['意味'],
-            movement=row['動き方'],
-            basic_posture=row['基本姿勢'],
-            talent=row['才能'],
-            characteristics=row['特性'],
-            advice=row['アドバイス'],
-            on_state=row['ON'],
-            off_state=row['OFF'],
-            image_path=image_path
-        )
+        return hissatsu
 
     def _extract_numbers_from_hissatsus(self, hissatsus: List[HissatsuInfo]) -> Set[int]:
         """必殺技リストから関連する数字を抽出"""
         numbers = set()
 
         for hissatsu in hissatsus:
-            # item_dfから必殺技に関連する数字を取得
-            related_items = self.data_processor.item_df[
-                self.data_processor.item_df['必殺No'] == hissatsu.hissatsu_no
-            ]
-
-            for _, item_row in related_items.iterrows():
-                numbers.add(int(item_row['No']))
-                if pd.notna(item_row['対No']):
-                    numbers.add(int(item_row['対No']))
+            # 必殺技に関連する数字（アイテムと対No）を索引から取得
+            numbers.update(self.data_processor.hissatsu_numbers_by_no.get(hissatsu.hissatsu_no, ()))
 
         return numbers
 
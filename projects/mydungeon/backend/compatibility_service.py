@@ -5,11 +5,10 @@
 import logging
 import asyncio
 from typing import Dict, List
-from backend.scraper import DungeonScraper
+from backend.scraper_worker import create_scraper
 from backend.data_processor import DataProcessor
 from backend.compatibility_processor import CompatibilityProcessor
 from backend.compatibility_image_processor import CompatibilityImageProcessor
-from backend.models import ItemInfo, HissatsuInfo
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,7 +18,8 @@ class CompatibilityService:
     """相性診断の完全なサービス"""
 
     def __init__(self):
-        self.scraper = DungeonScraper()
+        # ワーカー設定時は別プロセスのワーカーに要求を送るクライアント
+        self.scraper = create_scraper()
         self.data_processor = DataProcessor()
         self.compatibility_processor = CompatibilityProcessor(self.data_processor)
         self.compatibility_image_processor = CompatibilityImageProcessor()
@@ -60,16 +60,15 @@ class CompatibilityService:
         logger.info(f"Person1 numbers ({len(person1_numbers)}): {person1_numbers}")
         logger.info(f"Person2 numbers ({len(person2_numbers)}): {person2_numbers}")
 
-        # Step 2: アイテム情報取得
-        logger.info("Step 2: Getting item information for both people...")
-        person1_items = self.data_processor.get_items_by_numbers(person1_numbers)
-        person2_items = self.data_processor.get_items_by_numbers(person2_numbers)
+        # Step 2-3: アイテム情報取得と単独必殺技検出（1人ずつまとめて分析）
+        logger.info("Step 2-3: Analyzing numbers for both people...")
+        person1_analysis = self.data_processor.analyze(person1_numbers)
+        person2_analysis = self.data_processor.analyze(person2_numbers)
+        person1_items = person1_analysis.items
+        person2_items = person2_analysis.items
+        person1_solo_hissatsus = person1_analysis.hissatsus
+        person2_solo_hissatsus = person2_analysis.hissatsus
         logger.info(f"Person1 items: {len(person1_items)}, Person2 items: {len(person2_items)}")
-
-        # Step 3: 単独必殺技検出
-        logger.info("Step 3: Detecting solo hissatsuwaza for both people...")
-        person1_solo_hissatsus = self.data_processor.detect_hissatsuwaza(person1_numbers)
-        person2_solo_hissatsus = self.data_processor.detect_hissatsuwaza(person2_numbers)
         logger.info(f"Person1 solo hissatsus: {len(person1_solo_hissatsus)}, "
                    f"Person2 solo hissatsus: {len(person2_solo_hissatsus)}")
 
@@ -108,21 +107,6 @@ class CompatibilityService:
         # Step 9: レスポンス構築
         logger.info("Step 9: Building response...")
 
-        # 画像パスをWeb URLに変換するヘルパー関数
-        def convert_image_path_to_url(image_path: str) -> str:
-            if not image_path:
-                return ""
-            # 絶対パスからファイル名を抽出し、/images/配下のパスに変換
-            import os
-            # database/images/item/1.jpg -> /images/item/1.jpg
-            # database/images/Hissatsuwaza/1_h.jpg -> /images/Hissatsuwaza/1_h.jpg
-            parts = image_path.split(os.sep)
-            if 'images' in parts:
-                idx = parts.index('images')
-                relative_path = '/'.join(parts[idx:])
-                return f'/{relative_path}'
-            return ""
-
         result = {
             'image_path': image_path,
             'person1': {
@@ -135,8 +119,8 @@ class CompatibilityService:
                 'person1_synergy_numbers': list(person1_colored.get('person1_synergy', set())),
                 'person2_synergy_numbers': list(person1_colored.get('person2_synergy', set())),
                 'solo_hissatsu_numbers': list(person1_colored.get('solo', set())),
-                'items': [{**item.dict(), 'image_url': convert_image_path_to_url(item.image_path)} for item in person1_items],
-                'solo_hissatsus': [{**h.dict(), 'image_url': convert_image_path_to_url(h.image_path)} for h in person1_solo_hissatsus]
+                'items': [item.as_dict() for item in person1_items],
+                'solo_hissatsus': [h.as_dict() for h in person1_solo_hissatsus]
             },
             'person2': {
                 'name': person2_name,
@@ -148,13 +132,13 @@ class CompatibilityService:
                 'person1_synergy_numbers': list(person2_colored.get('person1_synergy', set())),
                 'person2_synergy_numbers': list(person2_colored.get('person2_synergy', set())),
                 'solo_hissatsu_numbers': list(person2_colored.get('solo', set())),
-                'items': [{**item.dict(), 'image_url': convert_image_path_to_url(item.image_path)} for item in person2_items],
-                'solo_hissatsus': [{**h.dict(), 'image_url': convert_image_path_to_url(h.image_path)} for h in person2_solo_hissatsus]
+                'items': [item.as_dict() for item in person2_items],
+                'solo_hissatsus': [h.as_dict() for h in person2_solo_hissatsus]
             },
-            'joint_hissatsus': [{**h.dict(), 'image_url': convert_image_path_to_url(h.image_path)} for h in categorized['joint']],
-            'both_have_hissatsus': [{**h.dict(), 'image_url': convert_image_path_to_url(h.image_path)} for h in categorized['both_have']],
-            'person1_synergy_hissatsus': [{**h.dict(), 'image_url': convert_image_path_to_url(h.image_path)} for h in categorized['person1_synergy']],
-            'person2_synergy_hissatsus': [{**h.dict(), 'image_url': convert_image_path_to_url(h.image_path)} for h in categorized['person2_synergy']],
+            'joint_hissatsus': [h.as_dict() for h in categorized['joint']],
+            'both_have_hissatsus': [h.as_dict() for h in categorized['both_have']],
+            'person1_synergy_hissatsus': [h.as_dict() for h in categorized['person1_synergy']],
+            'person2_synergy_hissatsus': [h.as_dict() for h in categorized['person2_synergy']],
             'color_counts': color_counts,
             'actions': actions
         }
@@ -4,7 +4,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Settings:
-    # 外部サイト
+    # 外部サイト（record+https://... で取得結果を記録、replay:[記録ファイル] で記録を返す代替サーバーに接続）
     TARGET_URL = os.getenv("TARGET_URL", "https://dungeon.humanjp.com/")
 
     # ディレクトリパス
@@ -24,10 +24,123 @@ class Settings:
     ITEM_IMAGES_DIR = os.path.join(IMAGES_DIR, "item")
     HISSATSU_IMAGES_DIR = os.path.join(IMAGES_DIR, "Hissatsuwaza")
 
+    # 外部サイトの代替サーバー（記録ファイル、待ち受けポート、結果の応答の遅延、記録に無い入力に疑似的な結果を返すか）
+    UPSTREAM_RECORDINGS_FILE = os.getenv("UPSTREAM_RECORDINGS_FILE", os.path.join(BASE_DIR, "cache", "upstream_recordings.jsonl"))
+    UPSTREAM_STANDIN_PORT = int(os.getenv("UPSTREAM_STANDIN_PORT", "8765"))
+    UPSTREAM_STANDIN_LATENCY_MS = float(os.getenv("UPSTREAM_STANDIN_LATENCY_MS", "0"))
+    UPSTREAM_STANDIN_SYNTHESIZE = os.getenv("UPSTREAM_STANDIN_SYNTHESIZE", "false").lower() == "true"
+
+    # 診断情報（スクリーンショット・HTML）の記録。公開しないディレクトリに、サンプリング対象と失敗時だけ記録し、件数の上限を超えたら古いものから消す
+    DIAGNOSTICS_DIR = os.getenv("DIAGNOSTICS_DIR", os.path.join(BASE_DIR, "cache", "diagnostics"))
+    DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("DIAGNOSTICS_SAMPLE_RATE", "0.01"))
+    DIAGNOSTICS_ON_FAILURE = os.getenv("DIAGNOSTICS_ON_FAILURE", "true").lower() == "true"
+    DIAGNOSTICS_MAX_CAPTURES = int(os.getenv("DIAGNOSTICS_MAX_CAPTURES", "200"))
+
     # スクレイピング設定
     SCRAPING_TIMEOUT = 30000  # 30秒
     HEADLESS = os.getenv("HEADLESS", "false").lower() == "true"
 
+    # スクレイピング方式（browser: フォーム操作 / replay: 学習したHTTPリクエストを再送 / local: 移植した計算モジュール）
+    SCRAPER_BACKEND = os.getenv("SCRAPER_BACKEND", "browser")
+    # 外部サイトの計算を移植したモジュール（ENGINE_VERSIONとcompute()を定義。無ければlocalはブラウザにフォールバック）
+    LOCAL_ENGINE_PATH = os.getenv("LOCAL_ENGINE_PATH", os.path.join(BASE_DIR, "backend", "engines", "upstream_engine.py"))
+    # 計算結果をブラウザでも取得して突き合わせる割合と、食い違ったら計算を止めるか
+    LOCAL_ENGINE_CROSSCHECK_RATE = float(os.getenv("LOCAL_ENGINE_CROSSCHECK_RATE", "0.05"))
+    LOCAL_ENGINE_DISABLE_ON_MISMATCH = os.getenv("LOCAL_ENGINE_DISABLE_ON_MISMATCH", "true").lower() == "true"
+    SCRAPER_LEARNED_REQUEST_FILE = os.path.join(BASE_DIR, "cache", "learned_request.json")
+    SCRAPER_HTTP_MAX_CONNECTIONS = int(os.getenv("SCRAPER_HTTP_MAX_CONNECTIONS", "20"))
+    # 学習に失敗した後、再び学習を試みるまでの秒数（その間はブラウザで取得する）
+    SCRAPER_LEARN_RETRY_SECONDS = float(os.getenv("SCRAPER_LEARN_RETRY_SECONDS", "300"))
+
+    # スクレイピング結果キャッシュ（TTLは秒、0で無期限。外部サイトの仕様変更時はバージョンを上げて無効化）
+    SCRAPE_CACHE_ENABLED = os.getenv("SCRAPE_CACHE_ENABLED", "true").lower() == "true"
+    # 再生モード（TARGET_URL=replay:）でもキャッシュを使うか（既定では使わず、毎回代替サーバーまで取得して計測する）
+    SCRAPE_CACHE_IN_REPLAY = os.getenv("SCRAPE_CACHE_IN_REPLAY", "false").lower() == "true"
+    SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "scrape_results.sqlite3"))
+    SCRAPE_CACHE_TTL = float(os.getenv("SCRAPE_CACHE_TTL", str(30 * 24 * 3600)))
+    SCRAPE_CACHE_VERSION = os.getenv("SCRAPE_CACHE_VERSION", "1")
+    SCRAPE_CACHE_LRU_SIZE = int(os.getenv("SCRAPE_CACHE_LRU_SIZE", "10000"))
+    # 期限切れ後も裏で更新する間に返してよい期間（秒、0で期限切れは返さない）
+    SCRAPE_CACHE_STALE_TTL = float(os.getenv("SCRAPE_CACHE_STALE_TTL", str(30 * 24 * 3600)))
+
+    # 外部サイト向けサーキットブレーカー（直近WINDOW件のエラー率・遅い呼び出しの割合で開き、OPEN_SECONDS秒後に半開）
+    CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    CIRCUIT_BREAKER_WINDOW = int(os.getenv("CIRCUIT_BREAKER_WINDOW", "20"))
+    CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "10"))
+    CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", "20"))
+    CIRCUIT_BREAKER_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_RATE", "0.8"))
+    CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_PROBES", "2"))
+
+    # 外部サイトへの取得の受付制御（同時に実行する取得数・空きを待つ列の長さ・列で待つ最大秒数。同時実行数0で無効）
+    ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "4"))
+    ADMISSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_QUEUE_LIMIT", "16"))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+    # 一時的なエラーの再試行（ジッター付き指数バックオフ、秒。回数はヘッジと共通の予算の範囲内）
+    SCRAPE_RETRY_ATTEMPTS = int(os.getenv("SCRAPE_RETRY_ATTEMPTS", "2"))
+    SCRAPE_RETRY_BASE_DELAY = float(os.getenv("SCRAPE_RETRY_BASE_DELAY", "0.5"))
+    SCRAPE_RETRY_MAX_DELAY = float(os.getenv("SCRAPE_RETRY_MAX_DELAY", "5"))
+
+    # ヘッジ（直近のパーセンタイルを過ぎたら別のページで2本目を並走。再試行と共通の予算は取得1回あたりの割合と上限）
+    SCRAPE_HEDGE_ENABLED = os.getenv("SCRAPE_HEDGE_ENABLED", "true").lower() == "true"
+    SCRAPE_HEDGE_PERCENTILE = float(os.getenv("SCRAPE_HEDGE_PERCENTILE", "95"))
+    SCRAPE_HEDGE_MIN_SAMPLES = int(os.getenv("SCRAPE_HEDGE_MIN_SAMPLES", "20"))
+    SCRAPE_HEDGE_BUDGET_RATIO = float(os.getenv("SCRAPE_HEDGE_BUDGET_RATIO", "0.1"))
+    SCRAPE_HEDGE_BUDGET_BURST = float(os.getenv("SCRAPE_HEDGE_BUDGET_BURST", "5"))
+    SCRAPE_LATENCY_WINDOW = int(os.getenv("SCRAPE_LATENCY_WINDOW", "200"))
+
+    # キー正規化用のバケット表（equivalence_analyzerで生成。ファイルが無ければ正規化しない）
+    SCRAPE_KEY_BUCKETS_FILE = os.getenv("SCRAPE_KEY_BUCKETS_FILE", os.path.join(DATABASE_DIR, "key_buckets.json"))
+
+    # キャッシュ事前投入クローラー（並列数、1ページで続けて取得する件数、1秒あたりの最大リクエスト数、進捗表示間隔）
+    CRAWLER_CONCURRENCY = int(os.getenv("CRAWLER_CONCURRENCY", "2"))
+    CRAWLER_BATCH_SIZE = int(os.getenv("CRAWLER_BATCH_SIZE", "20"))
+    CRAWLER_RATE_LIMIT = float(os.getenv("CRAWLER_RATE_LIMIT", "1"))
+    CRAWLER_PROGRESS_INTERVAL = float(os.getenv("CRAWLER_PROGRESS_INTERVAL", "10"))  # 秒
+    CRAWLER_CHECKPOINT_FILE = os.getenv("CRAWLER_CHECKPOINT_FILE", os.path.join(BASE_DIR, "cache", "crawler_checkpoint.json"))
+
+    # 精度・整合性の検証ハーネスの同時実行数
+    VERIFY_CONCURRENCY = int(os.getenv("VERIFY_CONCURRENCY", "4"))
+
+    # スクレイパーワーカー（別プロセス）。ソケットを指定するとAPIはブラウザを持たずワーカーに要求を送る
+    SCRAPER_WORKER_SOCKETS = [
+        p.strip() for p in os.getenv("SCRAPER_WORKER_SOCKETS", "").split(",") if p.strip()
+    ]
+    SCRAPER_WORKER_SOCKET_PATH = os.getenv("SCRAPER_WORKER_SOCKET_PATH", "/tmp/mydungeon-scraper.sock")  # ワーカー側の待ち受け
+    SCRAPER_WORKER_TIMEOUT = float(os.getenv("SCRAPER_WORKER_TIMEOUT", "90"))  # 秒
+    SCRAPER_WORKER_MAX_CONCURRENCY = int(os.getenv("SCRAPER_WORKER_MAX_CONCURRENCY", "8"))
+
+    # ブラウザプール設定
+    BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+    BROWSER_HEALTH_CHECK_INTERVAL = float(os.getenv("BROWSER_HEALTH_CHECK_INTERVAL", "30"))  # 秒（0で無効）
+    BROWSER_POOL_DRAIN_TIMEOUT = float(os.getenv("BROWSER_POOL_DRAIN_TIMEOUT", "30"))  # 秒
+    # ブラウザの入れ替え（スクレイピングに使ったページ数・プロセスツリーのRSSの上限。0で無効）
+    BROWSER_RECYCLE_MAX_PAGES = int(os.getenv("BROWSER_RECYCLE_MAX_PAGES", "500"))
+    BROWSER_RECYCLE_MAX_RSS_MB = int(os.getenv("BROWSER_RECYCLE_MAX_RSS_MB", "1024"))
+
+    # フォーム準備済みページプール設定
+    FORM_PAGE_POOL_SIZE = int(os.getenv("FORM_PAGE_POOL_SIZE", "4"))
+    FORM_PAGE_RETRY_DELAY = float(os.getenv("FORM_PAGE_RETRY_DELAY", "5"))  # 秒
+
+    # 不要リソースの遮断（許可するリソース種別と、種別に関係なく遮断するURLの部分文字列）
+    SCRAPER_BLOCK_RESOURCES = os.getenv("SCRAPER_BLOCK_RESOURCES", "true").lower() == "true"
+    SCRAPER_ALLOWED_RESOURCE_TYPES = [
+        t.strip() for t in os.getenv("SCRAPER_ALLOWED_RESOURCE_TYPES", "document,script,xhr,fetch").split(",") if t.strip()
+    ]
+    SCRAPER_BLOCKED_URL_PATTERNS = [
+        p.strip() for p in os.getenv(
+            "SCRAPER_BLOCKED_URL_PATTERNS",
+            "google-analytics.com,googletagmanager.com,doubleclick.net,connect.facebook.net,clarity.ms,hotjar.com"
+        ).split(",") if p.strip()
+    ]
+
+    # 準備完了判定のフェーズ別タイムアウト（ミリ秒）
+    READINESS_OPTION_TIMEOUT = int(os.getenv("READINESS_OPTION_TIMEOUT", "5000"))
+    READINESS_RESULT_TIMEOUT = int(os.getenv("READINESS_RESULT_TIMEOUT", "15000"))
+    READINESS_NETWORK_QUIET_MS = int(os.getenv("READINESS_NETWORK_QUIET_MS", "500"))
+
     # CORS設定
     CORS_ORIGINS = [
         "http://localhost:3000",
@@ -1,15 +1,61 @@
 import pandas as pd
+from types import MappingProxyType
 from typing import List, Dict, Tuple
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from backend.config import settings
-from backend.models import ItemInfo, HissatsuInfo
+from backend.models import (
+    AnalysisResult, ColorCount, ColorSystemCount, HissatsuInfo, ItemInfo, color_counts_to_dict
+)
+from backend.hissatsu_engine import HissatsuEngine, PairRule, pairs_of
+from backend.number_mask import numbers_to_mask
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 色系統の表示順
+COLOR_SYSTEM_ORDER = ['赤系', '緑系', '青系', '黄系']
+
+# 対応する画像の拡張子（同じ名前で複数ある場合は先頭のものを使う）
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.JPG', '.JPEG', '.PNG', '.GIF']
+
+
+def scan_image_dir(directory: str) -> Dict[str, str]:
+    """
+    画像ディレクトリを1度だけ走査し、拡張子を除いたファイル名 → パスの索引を作る
+
+    Args:
+        directory: 走査するディレクトリ
+
+    Returns:
+        {"1": ".../1.jpg", "1_h": ".../1_h.jpeg", ...}（ディレクトリが無ければ空）
+    """
+    found: Dict[str, Tuple[int, str]] = {}
+    try:
+        entries = os.listdir(directory)
+    except OSError as e:
+        logger.warning(f"Cannot scan image directory {directory}: {str(e)}")
+        return {}
+    for filename in entries:
+        stem, ext = os.path.splitext(filename)
+        if ext not in IMAGE_EXTENSIONS:
+            continue
+        priority = IMAGE_EXTENSIONS.index(ext)
+        if stem not in found or priority < found[stem][0]:
+            found[stem] = (priority, os.path.join(directory, filename))
+    return {stem: path for stem, (_, path) in found.items()}
+
+
+def _records(df: pd.DataFrame) -> List[dict]:
+    """DataFrameの行を辞書のリストにする（欠損値はNone）"""
+    return [
+        {column: (value if pd.notna(value) else None) for column, value in row.items()}
+        for row in df.to_dict('records')
+    ]
+
+
 class DataProcessor:
     """CSVデータの読み込みとマッチング処理"""
 
@@ -18,6 +64,22 @@ class DataProcessor:
         self.hissatsu_df = None
         self.color_meaning_df = None
         self.action_df = None
+        # リクエストごとにDataFrameを走査しないよう、読み込み時に作る索引
+        self.item_rows_by_no: Dict[int, List[dict]] = {}
+        self.hissatsu_row_by_no: Dict[int, dict] = {}
+        self.pairs_by_no: Dict[int, List[Tuple[int, int]]] = {}
+        self.pair_rows: List[Tuple[int, int, int]] = []
+        self.hissatsu_numbers_by_no: Dict[int, List[int]] = {}
+        self.hissatsu_engine = HissatsuEngine([])
+        self.color_system_rows: List[Tuple[str, str, List[Tuple[str, str]]]] = []
+        self.actions: List[Dict[str, str]] = []
+        # 読み込み時に1度だけ作る変更不可のレコード（リクエストはこれを参照するだけ）
+        self.items_by_no: Dict[int, ItemInfo] = {}
+        self.hissatsus_by_no: Dict[int, HissatsuInfo] = {}
+        # 画像ディレクトリ → {ファイル名（拡張子なし）: パス}（起動時に1度だけ走査）
+        self.image_index: Dict[str, Dict[str, str]] = {}
+        # 画像が見つからなかったカタログのエントリ（例: "item 5", "hissatsu 12"）
+        self.missing_images: List[str] = []
         self.load_csv_data()
 
     def load_csv_data(self):
@@ -82,10 +144,117 @@ class DataProcessor:
             self.action_df.columns = self.action_df.columns.str.strip()
             logger.info(f"Loaded {len(self.action_df)} action descriptions from CSV")
 
+            self._build_indexes()
+            self._scan_images()
+            self._build_catalog()
+
         except Exception as e:
             logger.error(f"Error loading CSV: {str(e)}")
             raise
 
+    def _build_indexes(self):
+        """読み込んだCSVからNo・必殺Noをキーにした索引を作る（欠損値はNone）"""
+        self.item_rows_by_no = {}
+        self.pairs_by_no = {}
+        self.pair_rows = []
+        self.hissatsu_numbers_by_no = {}
+        for row in _records(self.item_df):
+            number = int(row['No'])
+            # 複数の対Noを持つ特殊アイテムは同じNoの行が複数ある（CSVの順に保持）
+            self.item_rows_by_no.setdefault(number, []).append(row)
+            if row['必殺No'] is None:
+                continue
+            hissatsu_no = int(row['必殺No'])
+            pair_no = int(row['対No']) if row['対No'] is not None else None
+            # 必殺技に関わる数字（アイテム自身と対No）
+            related = self.hissatsu_numbers_by_no.setdefault(hissatsu_no, [])
+            for n in (number, pair_no):
+                if n is not None and n not in related:
+                    related.append(n)
+            if pair_no is not None:
+                self.pairs_by_no.setdefault(number, []).append((pair_no, hissatsu_no))
+                # (No, 対No, 必殺No) をCSVの行順に
+                self.pair_rows.append((number, pair_no, hissatsu_no))
+
+        # ペアごとの2ビットのマスクで必殺技を判定する
+        self.hissatsu_engine = HissatsuEngine(self.pair_rows)
+
+        self.hissatsu_row_by_no = {}
+        for row in _records(self.hissatsu_df):
+            # 同じ必殺Noが重複していれば最初の行を使う
+            self.hissatsu_row_by_no.setdefault(int(row['必殺No']), row)
+
+        # 色系統ごとの (系統名, 系統意味, [(色, 色意味), ...])
+        self.color_system_rows = []
+        for system_name in COLOR_SYSTEM_ORDER:
+            rows = [row for row in _records(self.color_meaning_df) if row['系統'] == system_name]
+            if rows:
+                colors = [(row['色'], row['色意味']) for row in rows if row['色']]
+                self.color_system_rows.append((system_name, rows[0]['系統意味'], colors))
+
+        self.actions = [
+            {'action': str(row['動き方']), 'meaning': str(row['意味'])}
+            for row in _records(self.action_df)
+        ]
+        logger.info(f"Indexed {len(self.item_rows_by_no)} item numbers and {len(self.hissatsu_row_by_no)} hissatsuwaza")
+
+    def _scan_images(self):
+        """アイテム・必殺技の画像ディレクトリを走査して画像の索引を作る"""
+        self.image_index = {
+            directory: scan_image_dir(directory)
+            for directory in (settings.ITEM_IMAGES_DIR, settings.HISSATSU_IMAGES_DIR)
+        }
+        logger.info(
+            f"Indexed {len(self.image_index[settings.ITEM_IMAGES_DIR])} item images and "
+            f"{len(self.image_index[settings.HISSATSU_IMAGES_DIR])} hissatsu images"
+        )
+
+    def _build_catalog(self):
+        """アイテム・必殺技のレコードを作る（画像パスとレスポンス用の辞書も作っておく）"""
+        self.items_by_no = {}
+        for number, rows in self.item_rows_by_no.items():
+            # 複数の対Noを持つ特殊アイテムは最初の行の情報を使う
+            item = rows[0]
+            self.items_by_no[number] = ItemInfo(
+                no=number,
+                name=str(item['アイテム名']),
+                pair_no=int(item['対No']) if item['対No'] is not None else None,
+                pair_name=str(item['対アイテム名']) if item['対アイテム名'] is not None else None,
+                hissatsu_no=int(item['必殺No']) if item['必殺No'] is not None else None,
+                hissatsu_name=str(item['必殺技名']) if item['必殺技名'] is not None else None,
+                color=str(item['色']),
+                movement=str(item['動き方']),
+                description=str(item['説明']),
+                on_state=str(item['ON']),
+                off_state=str(item['OFF']),
+                image_path=self._find_image_path(number, settings.ITEM_IMAGES_DIR)
+            )
+
+        self.hissatsus_by_no = {}
+        for hissatsu_no, h in self.hissatsu_row_by_no.items():
+            self.hissatsus_by_no[hissatsu_no] = HissatsuInfo(
+                hissatsu_no=hissatsu_no,
+                name=str(h['必殺技名']),
+                color=str(h['色']),
+                meaning=str(h['意味']),
+                movement=str(h['動き方']),
+                basic_posture=str(h['基本姿勢']),
+                talent=str(h['才能']),
+                characteristics=str(h['特性']),
+                advice=str(h['アドバイス']),
+                on_state=str(h['ON']),
+                off_state=str(h['OFF']),
+                image_path=self._find_image_path(hissatsu_no, settings.HISSATSU_IMAGES_DIR, suffix='_h')
+            )
+
+        # 画像の無いエントリはまとめてログに出す（表示時は画像なしで描画される）
+        self.missing_images = (
+            [f"item {item.no}" for item in self.items_by_no.values() if not item.image_path] +
+            [f"hissatsu {h.hissatsu_no}" for h in self.hissatsus_by_no.values() if not h.image_path]
+        )
+        if self.missing_images:
+            logger.warning(f"{len(self.missing_images)} catalog entries have no image: {', '.join(self.missing_images)}")
+
     def get_items_by_numbers(self, numbers: List[int]) -> List[ItemInfo]:
         """
         数字リストから対応するアイテム情報を取得
@@ -98,27 +267,9 @@ class DataProcessor:
         """
         items = []
         for number in numbers:
-            item_row = self.item_df[self.item_df['No'] == number]
-            if not item_row.empty:
-                item = item_row.iloc[0]
-
-                # 画像パスを構築（拡張子を動的に検索）
-                image_path = self._find_image_path(number, settings.ITEM_IMAGES_DIR)
-
-                items.append(ItemInfo(
-                    no=int(item['No']),
-                    name=str(item['アイテム名']),
-                    pair_no=int(item['対No']) if pd.notna(item['対No']) else None,
-                    pair_name=str(item['対アイテム名']) if pd.notna(item['対アイテム名']) else None,
-                    hissatsu_no=int(item['必殺No']) if pd.notna(item['必殺No']) else None,
-                    hissatsu_name=str(item['必殺技名']) if pd.notna(item['必殺技名']) else None,
-                    color=str(item['色']),
-                    movement=str(item['動き方']),
-                    description=str(item['説明']),
-                    on_state=str(item['ON']),
-                    off_state=str(item['OFF']),
-                    image_path=image_path
-                ))
+            item = self.items_by_no.get(number)
+            if item is not None:
+                items.append(item)
             else:
                 logger.warning(f"Item No.{number} not found in CSV")
 
@@ -134,63 +285,24 @@ class DataProcessor:
         Returns:
             発動する必殺技情報のリスト
         """
+        # ペアのマスクで成立した行を求める（数字リストを先頭から見た場合と同じ順序）
+        hissatsus = self._hissatsus_of(self.hissatsu_engine.activated(numbers))
+        logger.info(f"Detected {len(hissatsus)} hissatsuwaza: {[h.hissatsu_no for h in hissatsus]}")
+        return hissatsus
+
+    def _hissatsus_of(self, rules: List[PairRule]) -> List[HissatsuInfo]:
+        """成立した行から必殺技のレコードを重複なく取り出す"""
         hissatsus = []
         activated_hissatsu_nos = set()
-
-        # 数字をセットに変換（高速検索用）
-        number_set = set(numbers)
-
-        # 各数字について対Noとのペアをチェック
-        for number in numbers:
-            item_rows = self.item_df[self.item_df['No'] == number]
-
-            # 複数の行がある場合（複数の対Noを持つ特殊アイテム）、すべてチェック
-            for _, item in item_rows.iterrows():
-                pair_no = item['対No']
-                hissatsu_no = item['必殺No']
-
-                # 対Noが数字リストに含まれ、必殺Noが存在する場合
-                if (pd.notna(pair_no) and
-                    int(pair_no) in number_set and
-                    pd.notna(hissatsu_no)):
-
-                    hissatsu_no = int(hissatsu_no)
-
-                    # 同じ必殺技を重複して追加しない
-                    if hissatsu_no not in activated_hissatsu_nos:
-                        activated_hissatsu_nos.add(hissatsu_no)
-
-                        # 必殺技情報を取得
-                        hissatsu_row = self.hissatsu_df[
-                            self.hissatsu_df['必殺No'] == hissatsu_no
-                        ]
-
-                        if not hissatsu_row.empty:
-                            h = hissatsu_row.iloc[0]
-                            image_path = self._find_image_path(
-                                hissatsu_no,
-                                settings.HISSATSU_IMAGES_DIR,
-                                suffix='_h'
-                            )
-
-                            hissatsus.append(HissatsuInfo(
-                                hissatsu_no=hissatsu_no,
-                                name=str(h['必殺技名']),
-                                color=str(h['色']),
-                                meaning=str(h['意味']),
-                                movement=str(h['動き方']),
-                                basic_posture=str(h['基本姿勢']),
-                                talent=str(h['才能']),
-                                characteristics=str(h['特性']),
-                                advice=str(h['アドバイス']),
-                                on_state=str(h['ON']),
-                                off_state=str(h['OFF']),
-                                image_path=image_path
-                            ))
-                        else:
-                            logger.warning(f"Hissatsuwaza No.{hissatsu_no} not found in CSV")
-
-        logger.info(f"Detected {len(hissatsus)} hissatsuwaza: {list(activated_hissatsu_nos)}")
+        for rule in rules:
+            if rule.hissatsu_no in activated_hissatsu_nos:
+                continue
+            activated_hissatsu_nos.add(rule.hissatsu_no)
+            hissatsu = self.hissatsus_by_no.get(rule.hissatsu_no)
+            if hissatsu is None:
+                logger.warning(f"Hissatsuwaza No.{rule.hissatsu_no} not found in CSV")
+                continue
+            hissatsus.append(hissatsu)
         return hissatsus
 
     def get_hissatsu_pair_numbers(self, numbers: List[int]) -> Dict[int, List[int]]:
@@ -203,33 +315,7 @@ class DataProcessor:
         Returns:
             {必殺技No: [数字1, 数字2]} の辞書
         """
-        hissatsu_pairs = {}
-        number_set = set(numbers)
-        processed_pairs = set()
-
-        for number in numbers:
-            item_rows = self.item_df[self.item_df['No'] == number]
-
-            # 複数の行がある場合（複数の対Noを持つ特殊アイテム）、すべてチェック
-            for _, item in item_rows.iterrows():
-                pair_no = item['対No']
-                hissatsu_no = item['必殺No']
-
-                if (pd.notna(pair_no) and
-                    int(pair_no) in number_set and
-                    pd.notna(hissatsu_no)):
-
-                    hissatsu_no = int(hissatsu_no)
-                    pair_no = int(pair_no)
-
-                    # ペアの順序を正規化（小さい方を先に）
-                    pair_tuple = tuple(sorted([number, pair_no]))
-
-                    if pair_tuple not in processed_pairs:
-                        processed_pairs.add(pair_tuple)
-                        hissatsu_pairs[hissatsu_no] = list(pair_tuple)
-
-        return hissatsu_pairs
+        return self.hissatsu_engine.pairs(numbers)
 
     def get_color_counts(self, items: List[ItemInfo]) -> Dict:
         """
@@ -247,49 +333,70 @@ class DataProcessor:
             color = item.color
             color_count[color] = color_count.get(color, 0) + 1
 
-        # 色系統の情報を構築
+        return color_counts_to_dict(self._count_color_systems(color_count))
+
+    def _count_color_systems(self, color_count: Dict[str, int]) -> Tuple[ColorSystemCount, ...]:
+        """色ごとの枚数を色系統ごとにまとめる（枚数が0の色・系統は含めない）"""
         color_systems = []
 
-        # 色系統の順序
-        system_order = ['赤系', '緑系', '青系', '黄系']
-
-        for system_name in system_order:
-            # 該当する色系統の行を取得
-            system_rows = self.color_meaning_df[
-                self.color_meaning_df['系統'] == system_name
-            ]
-
-            if not system_rows.empty:
-                # 系統の意味を取得（最初の行から）
-                system_meaning = system_rows.iloc[0]['系統意味']
-
-                colors_info = []
-                total_count = 0
-
-                # 各色の情報を取得
-                for _, row in system_rows.iterrows():
-                    color_name = row['色']
-                    if pd.notna(color_name) and color_name:
-                        color_meaning = row['色意味']
-                        count = color_count.get(color_name, 0)
-
-                        if count > 0:
-                            colors_info.append({
-                                'name': color_name,
-                                'meaning': color_meaning,
-                                'count': count
-                            })
-                            total_count += count
-
-                if total_count > 0:
-                    color_systems.append({
-                        'name': system_name,
-                        'meaning': system_meaning,
-                        'total_count': total_count,
-                        'colors': colors_info
-                    })
-
-        return {'color_systems': color_systems}
+        for system_name, system_meaning, colors in self.color_system_rows:
+            # 各色の情報を取得
+            colors_info = tuple(
+                ColorCount(color_name, color_meaning, color_count[color_name])
+                for color_name, color_meaning in colors
+                if color_count.get(color_name, 0) > 0
+            )
+            total_count = sum(color.count for color in colors_info)
+
+            if total_count > 0:
+                color_systems.append(ColorSystemCount(system_name, system_meaning, total_count, colors_info))
+
+        return tuple(color_systems)
+
+    def analyze(self, numbers: List[int]) -> AnalysisResult:
+        """
+        1人分の数字をまとめて分析する（アイテム・必殺技・成立ペア・赤字の数字・色系統の枚数）
+
+        get_items_by_numbers・detect_hissatsuwaza・get_hissatsu_pair_numbers・get_color_counts
+        と同じ内容を、数字リストの1回の走査と成立ペアの1回の判定から作る
+
+        Args:
+            numbers: スクレイピングで取得した数字のリスト
+
+        Returns:
+            変更不可の分析結果（画像生成とレスポンス構築の両方で使う）
+        """
+        # カタログの範囲外の数字はマスクに入れない（アイテムが無いので成立する行も無い）
+        mask = numbers_to_mask(numbers, strict=False)
+
+        # アイテムと色ごとの枚数を同じ走査で求める
+        items = []
+        color_count: Dict[str, int] = {}
+        for number in numbers:
+            item = self.items_by_no.get(number)
+            if item is None:
+                logger.warning(f"Item No.{number} not found in CSV")
+                continue
+            items.append(item)
+            color_count[item.color] = color_count.get(item.color, 0) + 1
+
+        # 成立した行から必殺技とペアの両方を作る
+        rules = self.hissatsu_engine.activated(numbers, mask)
+        hissatsus = self._hissatsus_of(rules)
+        hissatsu_pairs = {hissatsu_no: tuple(pair) for hissatsu_no, pair in pairs_of(rules).items()}
+
+        logger.info(f"Analyzed {len(numbers)} numbers: {len(items)} items, "
+                    f"hissatsuwaza {[h.hissatsu_no for h in hissatsus]}")
+
+        return AnalysisResult(
+            numbers=tuple(numbers),
+            mask=mask,
+            items=tuple(items),
+            hissatsus=tuple(hissatsus),
+            hissatsu_pairs=MappingProxyType(hissatsu_pairs),
+            hissatsu_numbers=frozenset(n for pair in hissatsu_pairs.values() for n in pair),
+            color_systems=self._count_color_systems(color_count)
+        )
 
     def get_all_actions(self) -> List[Dict[str, str]]:
         """
@@ -298,17 +405,11 @@ class DataProcessor:
         Returns:
             [{'action': '動き方', 'meaning': '意味'}, ...] のリスト
         """
-        actions = []
-        for _, row in self.action_df.iterrows():
-            actions.append({
-                'action': str(row['動き方']),
-                'meaning': str(row['意味'])
-            })
-        return actions
+        return [dict(action) for action in self.actions]
 
     def _find_image_path(self, number: int, directory: str, suffix: str = '') -> str:
         """
-        画像ファイルのパスを検索（拡張子を自動判定）
+        画像ファイルのパスを画像の索引から取得（拡張子は走査時に判定済み）
 
         Args:
             number: アイテムまたは必殺技のNo
@@ -318,20 +419,18 @@ class DataProcessor:
         Returns:
             画像ファイルのパス
         """
-        # 対応する拡張子リスト
-        extensions = ['.jpg', '.jpeg', '.png', '.gif', '.JPG', '.JPEG', '.PNG', '.GIF']
-
-        for ext in extensions:
-            filename = f"{number}{suffix}{ext}"
-            filepath = os.path.join(directory, filename)
-            if os.path.exists(filepath):
-                logger.debug(f"Found image: {filepath}")
-                return filepath
-
-        # 見つからない場合は警告を出して空文字を返す
-        logger.warning(f"Image not found: {number}{suffix} in {directory}")
-        return ""
+        index = self.image_index.get(directory)
+        if index is None:
+            # 起動時に走査していないディレクトリは初回だけ走査する
+            index = self.image_index[directory] = scan_image_dir(directory)
+
+        filepath = index.get(f"{number}{suffix}")
+        if filepath:
+            return filepath
 
+        # 見つからない場合は空文字を返す（起動時にまとめて警告を出す）
+        logger.debug(f"Image not found: {number}{suffix} in {directory}")
+        return ""
 
 # テスト用
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+"""
+スクレイピングの診断情報の保存
+一部のリクエスト（サンプリング）と失敗したリクエストだけ、スクリーンショットとHTMLを記録する
+書き込みはリクエストの外（別スレッド）で行い、公開されない専用ディレクトリに
+リクエストIDごとのディレクトリを作って、古いものから消して件数を保つ
+"""
+import asyncio
+import json
+import random
+import re
+import shutil
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional, Set, Union
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 引き継ぐリクエストIDの形式（記録のディレクトリ名に使うため英数字・ハイフン・アンダースコアのみ）
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+# 処理中のAPIリクエストのID（appのミドルウェアが設定する。無ければ記録ごとに採番）
+current_request_id: ContextVar[Optional[str]] = ContextVar('current_request_id', default=None)
+
+
+def new_request_id(given: str = None) -> str:
+    """リクエストID（渡されたIDがディレクトリ名に使える形式ならそれを引き継ぐ）"""
+    if given and REQUEST_ID_PATTERN.fullmatch(given):
+        return given
+    return uuid.uuid4().hex[:16]
+
+
+class Capture:
+    """1回のスクレイピング分の診断情報"""
+
+    def __init__(self, owner: "Diagnostics", request_id: str, sampled: bool, meta: dict):
+        self.owner = owner
+        self.request_id = request_id
+        self.sampled = sampled
+        self.meta = meta
+        self.artifacts: Dict[str, Union[bytes, str]] = {}
+        self.failed = False
+
+    async def snapshot(self, page, name: str):
+        """サンプリング対象ならスクリーンショットを撮る（ファイルには書かない）"""
+        if self.sampled:
+            await self._screenshot(page, name)
+
+    async def fail(self, page, reason: str):
+        """失敗時の画面とHTMLを残す（on_failureならサンプリングに関係なく記録する）"""
+        self.failed = True
+        self.meta['error'] = reason
+        if not self.sampled and not self.owner.on_failure:
+            return
+        await self._screenshot(page, 'error.png')
+        try:
+            self.artifacts['page_content.html'] = await page.content()
+        except Exception as e:
+            logger.debug(f"Failed to read page content for diagnostics: {str(e)}")
+
+    def finish(self, **meta):
+        """記録対象なら書き込みを予約する"""
+        self.meta.update(meta)
+        if self.sampled or self.failed:
+            self.owner.submit(self)
+
+    async def _screenshot(self, page, name: str):
+        try:
+            self.artifacts[name] = await page.screenshot()
+        except Exception as e:
+            logger.debug(f"Failed to take diagnostic screenshot {name}: {str(e)}")
+
+
+class Diagnostics:
+    """診断情報の記録先（プロセス内で共有）"""
+
+    def __init__(
+        self,
+        directory: str = None,
+        sample_rate: float = None,
+        on_failure: bool = None,
+        max_captures: int = None,
+        max_pending: int = None
+    ):
+        self.directory = directory or settings.DIAGNOSTICS_DIR
+        self.sample_rate = sample_rate if sample_rate is not None else settings.DIAGNOSTICS_SAMPLE_RATE
+        self.on_failure = on_failure if on_failure is not None else settings.DIAGNOSTICS_ON_FAILURE
+        self.max_captures = max_captures if max_captures is not None else settings.DIAGNOSTICS_MAX_CAPTURES
+        # 書き込み待ちの上限（ディスクが遅いときにメモリを使い続けないよう、超えた分は捨てる）
+        self.max_pending = max_pending if max_pending is not None else 16
+        self._tasks: Set[asyncio.Task] = set()
+        self._prune_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.write_failures = 0
+
+    def begin(self, **meta) -> Capture:
+        """スクレイピング1回分の記録を始める（この時点でサンプリングするかを決める）"""
+        request_id = current_request_id.get() or new_request_id()
+        sampled = self.max_captures > 0 and self.sample_rate > 0 and random.random() < self.sample_rate
+        meta.update(request_id=request_id, started_at=datetime.now().isoformat(timespec='milliseconds'))
+        return Capture(self, request_id, sampled, meta)
+
+    def submit(self, capture: Capture):
+        """記録の書き込みを別スレッドで行うよう予約する"""
+        if self.max_captures <= 0 or (not capture.sampled and not self.on_failure):
+            return
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            return
+        task = asyncio.create_task(asyncio.to_thread(self._write, capture.request_id, dict(capture.artifacts), dict(capture.meta)))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    async def drain(self):
+        """書き込み待ちの記録を書き終えるまで待つ"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'sample_rate': self.sample_rate,
+            'on_failure': self.on_failure,
+            'max_captures': self.max_captures,
+            'pending': len(self._tasks),
+            'written': self.written,
+            'dropped': self.dropped,
+            'write_failures': self.write_failures,
+        }
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.write_failures += 1
+            logger.warning(f"Failed to write diagnostics: {str(task.exception())}")
+        else:
+            self.written += 1
+
+    def _write(self, request_id: str, artifacts: Dict[str, Union[bytes, str]], meta: dict):
+        """記録を1ディレクトリに書き、古い記録を消す（別スレッドで実行）"""
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request_id}-{uuid.uuid4().hex[:6]}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        for filename, content in artifacts.items():
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            with open(os.path.join(path, filename), 'wb') as f:
+                f.write(content)
+        meta['artifacts'] = sorted(artifacts)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        self._prune()
+
+    def _prune(self):
+        """記録の件数をmax_capturesに保つ（ディレクトリ名が時刻順なので名前順で古いものから消す）"""
+        with self._prune_lock:
+            entries = sorted(
+                entry for entry in os.listdir(self.directory)
+                if os.path.isdir(os.path.join(self.directory, entry))
+            )
+            for entry in entries[:max(0, len(entries) - self.max_captures)]:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+
+# プロセス内で共有する診断情報の記録先
+diagnostics = Diagnostics()
@@ -3,11 +3,11 @@ My Dungeonサービス
 スクレイピングから画像生成までの完全なフローを提供
 """
 import logging
-from typing import Tuple, List
-from backend.scraper import DungeonScraper
+from typing import Tuple
+from backend.scraper_worker import create_scraper
 from backend.data_processor import DataProcessor
 from backend.image_processor import ImageProcessor
-from backend.models import ItemInfo, HissatsuInfo
+from backend.models import AnalysisResult
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,7 +17,8 @@ class DungeonService:
     """My Dungeonの完全なサービス"""
 
     def __init__(self):
-        self.scraper = DungeonScraper()
+        # ワーカー設定時は別プロセスのワーカーに要求を送るクライアント
+        self.scraper = create_scraper()
         self.data_processor = DataProcessor()
         self.image_processor = ImageProcessor()
 
@@ -26,7 +27,7 @@ class DungeonService:
         birthdate: str,
         birthtime: str,
         name: str = None
-    ) -> Tuple[str, List[int], List[ItemInfo], List[HissatsuInfo]]:
+    ) -> Tuple[str, AnalysisResult]:
         """
         生年月日と時刻から完全な結果を生成
 
@@ -36,7 +37,7 @@ class DungeonService:
             name: 名前（オプション）
 
         Returns:
-            (画像パス, 数字リスト, アイテムリスト, 必殺技リスト)
+            (画像パス, 数字の分析結果)
         """
         logger.info(f"Starting dungeon result generation for {birthdate} {birthtime}")
 
@@ -45,28 +46,23 @@ class DungeonService:
         numbers = await self.scraper.scrape_numbers(birthdate, birthtime)
         logger.info(f"Scraped {len(numbers)} numbers: {numbers}")
 
-        # Step 2: アイテム情報取得
-        logger.info("Step 2: Getting item information...")
-        items = self.data_processor.get_items_by_numbers(numbers)
-        logger.info(f"Retrieved {len(items)} items")
+        # Step 2: アイテム・必殺技・色の枚数をまとめて分析
+        logger.info("Step 2: Analyzing numbers...")
+        analysis = self.data_processor.analyze(numbers)
+        logger.info(f"Retrieved {len(analysis.items)} items, detected {len(analysis.hissatsus)} hissatsuwaza")
 
-        # Step 3: 必殺技判定
-        logger.info("Step 3: Detecting hissatsuwaza...")
-        hissatsus = self.data_processor.detect_hissatsuwaza(numbers)
-        logger.info(f"Detected {len(hissatsus)} hissatsuwaza")
-
-        # Step 4: 画像生成
-        logger.info("Step 4: Generating result image...")
+        # Step 3: 画像生成
+        logger.info("Step 3: Generating result image...")
         image_path = self.image_processor.create_result_image(
-            items,
-            hissatsus,
+            analysis.items,
+            analysis.hissatsus,
             birthdate,
             birthtime,
             name
         )
         logger.info(f"Generated image: {image_path}")
 
-        return image_path, numbers, items, hissatsus
+        return image_path, analysis
 
     async def get_result_summary(
         self,
@@ -85,83 +81,26 @@ class DungeonService:
         Returns:
             結果サマリーの辞書
         """
-        image_path, numbers, items, hissatsus = await self.generate_dungeon_result(
+        image_path, analysis = await self.generate_dungeon_result(
             birthdate, birthtime, name
         )
 
-        # 必殺技成立数字のペアを取得
-        hissatsu_pairs = self.data_processor.get_hissatsu_pair_numbers(numbers)
-
-        # 必殺技成立数字を抽出（赤字表示用）
-        hissatsu_numbers = set()
-        for pair in hissatsu_pairs.values():
-            hissatsu_numbers.update(pair)
-
-        # 色ごとの枚数情報を取得
-        color_counts = self.data_processor.get_color_counts(items)
-
         # 動き方の説明を取得
         actions = self.data_processor.get_all_actions()
 
-        # 画像パスをWeb URLに変換するヘルパー関数
-        def convert_image_path_to_url(image_path: str) -> str:
-            if not image_path:
-                return ""
-            # 絶対パスからファイル名を抽出し、/images/配下のパスに変換
-            import os
-            # database/images/item/1.jpg -> /images/item/1.jpg
-            # database/images/Hissatsuwaza/1_h.jpg -> /images/Hissatsuwaza/1_h.jpg
-            parts = image_path.split(os.sep)
-            if 'images' in parts:
-                idx = parts.index('images')
-                relative_path = '/'.join(parts[idx:])
-                return f'/{relative_path}'
-            return ""
-
         return {
             'image_path': image_path,
             'name': name,
             'birthdate': birthdate,
             'birthtime': birthtime,
-            'numbers': numbers,
-            'hissatsu_numbers': list(hissatsu_numbers),  # 必殺技成立数字（赤字表示用）
-            'hissatsu_pairs': hissatsu_pairs,  # {必殺技No: [数字1, 数字2]}
-            'item_count': len(items),
-            'hissatsu_count': len(hissatsus),
-            'color_counts': color_counts,  # 色ごとの枚数情報
+            'numbers': list(analysis.numbers),
+            'hissatsu_numbers': list(analysis.hissatsu_numbers),  # 必殺技成立数字（赤字表示用）
+            'hissatsu_pairs': analysis.pairs_dict(),  # {必殺技No: [数字1, 数字2]}
+            'item_count': len(analysis.items),
+            'hissatsu_count': len(analysis.hissatsus),
+            'color_counts': analysis.color_counts_dict(),  # 色ごとの枚数情報
             'actions': actions,  # 動き方の説明
-            'items': [
-                {
-                    'no': item.no,
-                    'name': item.name,
-                    'pair_no': item.pair_no,
-                    'pair_name': item.pair_name,
-                    'hissatsu_no': item.hissatsu_no,
-                    'hissatsu_name': item.hissatsu_name,
-                    'color': item.color,
-                    'movement': item.movement,
-                    'description': item.description,
-                    'on_state': item.on_state,
-                    'off_state': item.off_state,
-                    'image_url': convert_image_path_to_url(item.image_path),
-                }
-                for item in items
-            ],
-            'hissatsus': [
-                {
-                    'hissatsu_no': h.hissatsu_no,
-                    'name': h.name,
-                    'color': h.color,
-                    'meaning': h.meaning,
-                    'movement': h.movement,
-                    'basic_posture': h.basic_posture,
-                    'talent': h.talent,
-                    'characteristics': h.characteristics,
-                    'advice': h.advice,
-                    'on_state': h.on_state,
-                    'off_state': h.off_state,
-                    'image_url': convert_image_path_to_url(h.image_path),
-                }
-                for h in hissatsus
-            ]
+            # 読み込み時に作ったレスポンス用の辞書（画像パスを除きimage_urlを含む）
+            'items': [item.as_dict(with_image_path=False) for item in analysis.items],
+            'hissatsus': [h.as_dict(with_image_path=False) for h in analysis.hissatsus]
         }
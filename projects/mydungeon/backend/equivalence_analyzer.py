@@ -0,0 +1,216 @@
+"""
+入力の同値性アナライザー（オフライン分析ツール）
+サンプルした日付ごとに時刻を変えてスクレイピングし、出力が変わる時刻の境界を探して
+キー正規化用のバケット表（key_buckets.json）を出力する
+
+使い方:
+    python -m backend.equivalence_analyzer --dates 10 --step 15 --output database/key_buckets.json
+    python -m backend.equivalence_analyzer --verify 200 --table database/key_buckets.json
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.browser_pool import browser_pool
+from backend.page_pool import form_page_pool
+from backend.key_buckets import MINUTES_PER_DAY, TimeBucketTable
+from backend.result_cache import ScrapeResultCache
+from backend.scraper import DungeonScraper
+from backend.single_flight import SingleFlight
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 空の結果（取得の失敗など）を取り直す回数
+EMPTY_RESULT_RETRIES = 2
+
+
+def format_minute(minute_of_day: int) -> str:
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+
+def random_dates(count: int, start_year: int, end_year: int, seed: int = None) -> List[str]:
+    """期間内のランダムな日付（重複なし）"""
+    rng = random.Random(seed)
+    start = date(start_year, 1, 1)
+    days = (date(end_year, 12, 31) - start).days
+    picked = rng.sample(range(days + 1), min(count, days + 1))
+    return sorted((start + timedelta(days=d)).isoformat() for d in picked)
+
+
+class EquivalenceAnalyzer:
+    """時刻方向の出力の変化点を探すアナライザー"""
+
+    def __init__(self, concurrency: int = 2, step: int = 15):
+        # 分析中はキーを正規化せず、本番のキャッシュ・合流先も使わない
+        # （本番のキャッシュはバケット内で最初に取得した時刻の結果を持つため、1分単位の本当の出力にならない）
+        self._cache_dir = tempfile.mkdtemp(prefix='equivalence_analyzer_')
+        self.cache = ScrapeResultCache(path=os.path.join(self._cache_dir, 'scrape_results.sqlite3'), ttl=0, stale_ttl=0)
+        self.scraper = DungeonScraper(key_table=TimeBucketTable(), cache=self.cache, flights=SingleFlight())
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.step = step
+        self.scrapes = 0
+
+    async def numbers_at(self, birthdate: str, minute_of_day: int, memo: Dict[int, Tuple[int, ...]]) -> Tuple[int, ...]:
+        """
+        指定時刻の出力（外部サイトの表示順のまま、日付ごとにメモ化）
+
+        空の結果は取得の失敗とみなして取り直し、それでも空なら例外にする
+        （空の結果をメモ化すると、その前後に偽の境界ができるため）。
+        """
+        if minute_of_day not in memo:
+            for _ in range(EMPTY_RESULT_RETRIES + 1):
+                async with self.semaphore:
+                    numbers = await self.scraper.scrape_numbers(birthdate, format_minute(minute_of_day))
+                self.scrapes += 1
+                if numbers:
+                    break
+                logger.warning(f"{birthdate} {format_minute(minute_of_day)}: empty result, retrying")
+            else:
+                raise RuntimeError(f"Empty result for {birthdate} {format_minute(minute_of_day)}")
+            memo[minute_of_day] = tuple(numbers)
+        return memo[minute_of_day]
+
+    async def find_boundaries(self, birthdate: str) -> List[int]:
+        """
+        1日の中で出力が変わる時刻（変化後の最初の分）を探す
+
+        step分おきの格子点で出力を比べ、違いがある区間だけを二分探索で詰める。
+        格子点の両端で同じ出力になる区間は一定とみなすため、step分より短い変化は見逃しうる
+        （--verifyで確認する）。
+        """
+        memo: Dict[int, Tuple[int, ...]] = {}
+        grid = sorted(set(range(0, MINUTES_PER_DAY, self.step)) | {MINUTES_PER_DAY - 1})
+        await asyncio.gather(*[self.numbers_at(birthdate, m, memo) for m in grid])
+
+        boundaries = []
+        for lo, hi in zip(grid, grid[1:]):
+            if memo[lo] != memo[hi]:
+                boundaries += await self._bisect(birthdate, lo, hi, memo)
+        logger.info(f"{birthdate}: {len(boundaries)} boundaries {[format_minute(b) for b in boundaries]}")
+        return boundaries
+
+    async def analyze(self, dates: List[str]) -> TimeBucketTable:
+        """
+        サンプル日付の境界の和集合からバケット表を作る
+
+        境界が1つも見つからなかった場合は時刻を正規化しない表にする
+        （サンプルしていない日付の全時刻を1つのバケットにまとめない）。
+        時刻に依存しない日付として扱うのはサンプルした日付だけ。
+        """
+        started = time.monotonic()
+        per_date = dict(zip(dates, await asyncio.gather(*[self.find_boundaries(d) for d in dates])))
+
+        boundaries = sorted({b for bs in per_date.values() for b in bs})
+        time_independent = [d for d, bs in per_date.items() if not bs]
+        if not boundaries:
+            logger.warning("No boundaries found in the sampled dates, time of day is not normalized")
+        return TimeBucketTable(boundaries or None, time_independent, {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'target_url': settings.TARGET_URL,
+            'step_minutes': self.step,
+            'sampled_dates': dates,
+            'per_date_boundaries': {d: bs for d, bs in per_date.items()},
+            'scrape_count': self.scrapes,
+            'elapsed_seconds': round(time.monotonic() - started, 1),
+        })
+
+    async def verify(self, table: TimeBucketTable, samples: int, start_year: int, end_year: int, seed: int = None) -> List[str]:
+        """ランダムな入力で、正規化前後の出力が一致するかを確かめる"""
+        rng = random.Random(seed)
+        dates = random_dates(samples, start_year, end_year, seed)
+        violations = []
+
+        async def check(birthdate: str):
+            minute = rng.randrange(MINUTES_PER_DAY)
+            canonical = table.canonical_key(birthdate, format_minute(minute))
+            canonical_date, canonical_time = canonical.split(' ')
+            hour, m = canonical_time.split(':')
+            memo: Dict[int, Tuple[int, ...]] = {}
+            actual = await self.numbers_at(birthdate, minute, memo)
+            expected = await self.numbers_at(canonical_date, int(hour) * 60 + int(m), memo)
+            if actual != expected:
+                violations.append(f"{birthdate} {format_minute(minute)} != {canonical}")
+
+        await asyncio.gather(*[check(d) for d in dates])
+        return violations
+
+    async def _bisect(self, birthdate: str, lo: int, hi: int, memo: Dict[int, Tuple[int, ...]]) -> List[int]:
+        """出力が異なる2点の間の変化点を二分探索で求める"""
+        if hi - lo == 1:
+            return [hi]
+        mid = (lo + hi) // 2
+        await self.numbers_at(birthdate, mid, memo)
+        boundaries = []
+        if memo[lo] != memo[mid]:
+            boundaries += await self._bisect(birthdate, lo, mid, memo)
+        if memo[mid] != memo[hi]:
+            boundaries += await self._bisect(birthdate, mid, hi, memo)
+        return boundaries
+
+    def close(self):
+        """分析用の一時キャッシュを削除"""
+        self.cache.close()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+    @staticmethod
+    def print_summary(table: TimeBucketTable):
+        print("=" * 60)
+        print(f"サンプル日付数: {len(table.metadata['sampled_dates'])}")
+        print(f"スクレイピング回数: {table.metadata['scrape_count']}")
+        if table.boundaries is None:
+            print("時刻バケット数: 境界が見つからないため時刻は正規化しない")
+        else:
+            buckets = len(table.boundaries)
+            print(f"時刻バケット数: {buckets} / {MINUTES_PER_DAY} （キー数 1/{MINUTES_PER_DAY / buckets:.0f}）")
+        print(f"時刻に依存しない日付: {len(table.time_independent_dates)}")
+        print("=" * 60)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="スクレイピング入力の同値性を分析してバケット表を出力")
+    parser.add_argument('--dates', type=int, default=10, help="サンプルする日付数")
+    parser.add_argument('--date', action='append', default=[], help="分析する日付（YYYY-MM-DD、複数指定可）")
+    parser.add_argument('--start-year', type=int, default=1950)
+    parser.add_argument('--end-year', type=int, default=2024)
+    parser.add_argument('--step', type=int, default=15, help="格子点の間隔（分）")
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=settings.SCRAPE_KEY_BUCKETS_FILE)
+    parser.add_argument('--verify', type=int, default=0, help="既存のバケット表をランダム入力で検証する件数")
+    parser.add_argument('--table', default=settings.SCRAPE_KEY_BUCKETS_FILE, help="検証するバケット表")
+    args = parser.parse_args()
+
+    await browser_pool.start()
+    await form_page_pool.start()
+    analyzer = EquivalenceAnalyzer(concurrency=args.concurrency, step=args.step)
+    try:
+        if args.verify:
+            table = TimeBucketTable.load(args.table)
+            violations = await analyzer.verify(table, args.verify, args.start_year, args.end_year, args.seed)
+            print(f"検証: {args.verify}件中 {len(violations)}件の不一致")
+            for v in violations:
+                print(f"  {v}")
+            return
+
+        dates = args.date or random_dates(args.dates, args.start_year, args.end_year, args.seed)
+        table = await analyzer.analyze(dates)
+        table.save(args.output)
+        analyzer.print_summary(table)
+        print(f"バケット表を保存しました: {args.output}")
+    finally:
+        analyzer.close()
+        await form_page_pool.stop()
+        await browser_pool.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+"""
+スクレイピングの再試行とヘッジ
+一時的なエラーはジッター付きの指数バックオフで再試行し、直近のp95レイテンシを過ぎても
+終わらない取得は別のページで2本目を並走させて先に終わった方を使う
+再試行・2本目はどちらも共通の予算の範囲内だけ行う（外部サイトへの負荷を倍にしない）
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+import httpx
+from playwright.async_api import Error as PlaywrightError
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 再試行する一時的なエラー（タイムアウト・ブラウザの切断・通信エラー）
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    PlaywrightError,
+    asyncio.TimeoutError,
+    ConnectionError,
+    httpx.TransportError,
+)
+
+
+class LatencyTracker:
+    """直近の成功した取得のレイテンシ（秒）"""
+
+    def __init__(self, window: int = None):
+        self._samples = deque(maxlen=window or settings.SCRAPE_LATENCY_WINDOW)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """p（0〜100）パーセンタイル（最近傍法）。サンプルが無ければNone"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    再試行とヘッジの予算（トークンバケット）
+
+    取得1回ごとにratio分のトークンが貯まり（上限burst）、再試行・ヘッジ1回で1トークンを使う。
+    長期的に再試行とヘッジの合計は取得数のratio倍までに抑えられる。
+    起動直後の失敗も再試行できるよう、最初は上限まで貯まった状態から始める。
+    """
+
+    def __init__(self, ratio: float = None, burst: float = None):
+        self.ratio = ratio if ratio is not None else settings.SCRAPE_HEDGE_BUDGET_RATIO
+        self.burst = burst if burst is not None else settings.SCRAPE_HEDGE_BUDGET_BURST
+        self.tokens = self.burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class HedgedExecutor:
+    """再試行とヘッジを行って取得を実行する"""
+
+    def __init__(
+        self,
+        retries: int = None,
+        base_delay: float = None,
+        max_delay: float = None,
+        hedge_enabled: bool = None,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = None,
+        budget: HedgeBudget = None,
+        latency: LatencyTracker = None
+    ):
+        self.retries = retries if retries is not None else settings.SCRAPE_RETRY_ATTEMPTS
+        self.base_delay = base_delay if base_delay is not None else settings.SCRAPE_RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else settings.SCRAPE_RETRY_MAX_DELAY
+        self.hedge_enabled = hedge_enabled if hedge_enabled is not None else settings.SCRAPE_HEDGE_ENABLED
+        self.hedge_percentile = hedge_percentile or settings.SCRAPE_HEDGE_PERCENTILE
+        self.hedge_min_samples = hedge_min_samples if hedge_min_samples is not None else settings.SCRAPE_HEDGE_MIN_SAMPLES
+        self.budget = budget or HedgeBudget()
+        self.latency = latency or LatencyTracker()
+        self.calls = 0
+        self.retried = 0
+        self.retries_denied = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_denied = 0
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        fnを実行し、一時的なエラーならジッター付きで再試行する
+
+        fnは呼ぶたびに独立した取得（別のページ）を行うこと。
+        再試行はヘッジと共通の予算から1トークンずつ使い、予算が無ければ再試行せずに失敗させる。
+        """
+        self.calls += 1
+        # 予算は呼び出し1回につき1回だけ貯める（失敗した試行で再試行の予算を増やさない）
+        self.budget.deposit()
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(fn)
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.retries:
+                    raise
+                if not self.budget.withdraw():
+                    self.retries_denied += 1
+                    logger.warning(f"Transient scrape error ({type(e).__name__}: {str(e)}), retry budget exhausted")
+                    raise
+                delay = self.backoff(attempt)
+                self.retried += 1
+                logger.warning(f"Transient scrape error ({type(e).__name__}: {str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def backoff(self, attempt: int) -> float:
+        """attempt回目の失敗後の待ち時間（フルジッター付き指数バックオフ）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def hedge_delay(self) -> Optional[float]:
+        """ヘッジを始めるまでの待ち時間（直近のpXXレイテンシ。サンプル不足ならNone）"""
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def stats(self) -> dict:
+        p95 = self.latency.percentile(95)
+        return {
+            'calls': self.calls,
+            'retried': self.retried,
+            'retries_denied': self.retries_denied,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'hedges_denied': self.hedges_denied,
+            'hedge_tokens': round(self.budget.tokens, 2),
+            'latency_samples': len(self.latency),
+            'latency_p95_ms': round(p95 * 1000) if p95 is not None else None,
+        }
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """1回分の取得。p95を過ぎても終わらなければ予算の範囲で2本目を並走させる"""
+        start = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        delay = self.hedge_delay()
+        if delay is None:
+            result = await primary
+            self.latency.record(time.monotonic() - start)
+            return result
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            result = primary.result()
+            self.latency.record(time.monotonic() - start)
+            return result
+        if not self.budget.withdraw():
+            self.hedges_denied += 1
+            result = await primary
+            self.latency.record(time.monotonic() - start)
+            return result
+
+        self.hedges += 1
+        logger.info(f"Scrape exceeded p{self.hedge_percentile:.0f} ({delay * 1000:.0f}ms), starting hedge")
+        hedge = asyncio.ensure_future(fn())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            # 先に成功した方を使う（片方が失敗したらもう片方を待つ）
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        self.latency.record(time.monotonic() - start)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
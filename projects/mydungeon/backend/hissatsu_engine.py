@@ -0,0 +1,104 @@
+"""
+ビットマスクによる必殺技判定
+数字は1〜72なので1人分の結果は1つの整数に収まる（数字nはビットn-1。結果キャッシュと同じnumber_maskの変換）。
+item_list.csvの (No, 対No, 必殺No) の行ごとに2ビットのマスクを作っておき、
+(結果のマスク & 行のマスク) == 行のマスク で成立した行を求める。
+出力の順序は数字リストを先頭から見ていく従来の判定と同じ。
+"""
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.number_mask import number_bit, numbers_to_mask
+
+
+class PairRule(NamedTuple):
+    """必殺技が成立する数字のペア（item_list.csvの1行）"""
+    no: int
+    pair_no: int
+    hissatsu_no: int
+    mask: int  # number_bit(No) | number_bit(対No)
+    order: int  # 同じNoの行の中での順番（CSVの行順）
+
+
+class HissatsuEngine:
+    """ペアのマスクを使った必殺技判定"""
+
+    def __init__(self, pair_rows: Iterable[Tuple[int, int, int]]):
+        """
+        Args:
+            pair_rows: (No, 対No, 必殺No) のCSVの行順のリスト
+        """
+        self.rules: List[PairRule] = []
+        # No → そのNoの行（CSVの行順）と、対Noのビットをまとめたマスク
+        self.rules_by_no: Dict[int, List[PairRule]] = {}
+        self.partner_mask: Dict[int, int] = {}
+        for no, pair_no, hissatsu_no in pair_rows:
+            rules = self.rules_by_no.setdefault(no, [])
+            rule = PairRule(no, pair_no, hissatsu_no, number_bit(no) | number_bit(pair_no), len(rules))
+            rules.append(rule)
+            self.rules.append(rule)
+            self.partner_mask[no] = self.partner_mask.get(no, 0) | number_bit(pair_no)
+
+    def activated(self, numbers: List[int], mask: int = None) -> List[PairRule]:
+        """
+        成立したペアの行を、数字リストを先頭から見ていった場合と同じ順序で返す
+
+        対Noが1つも結果に無い数字は partner_mask との1回のANDで読み飛ばし、
+        残った数字の行だけ (mask & 行のマスク) == 行のマスク で確かめる。
+
+        Args:
+            numbers: 1人分の数字リスト
+            mask: numbers_to_mask(numbers, strict=False)（計算済みなら渡す）
+
+        Returns:
+            成立した行（数字リストでNoが出てくる順、同じNoはCSVの行順）
+        """
+        if mask is None:
+            mask = numbers_to_mask(numbers, strict=False)
+        partner_mask = self.partner_mask
+        rules = []
+        seen = 0
+        for number in numbers:
+            if not mask & partner_mask.get(number, 0):
+                continue
+            bit = number_bit(number)
+            # 同じ数字が2回出てきても2回目は見ない
+            if seen & bit:
+                continue
+            seen |= bit
+            for rule in self.rules_by_no[number]:
+                if mask & rule.mask == rule.mask:
+                    rules.append(rule)
+        return rules
+
+    def activated_unordered(self, mask: int) -> List[PairRule]:
+        """マスクだけから成立した行を求める（CSVの行順。キャッシュや一括分析向け）"""
+        return [rule for rule in self.rules if mask & rule.mask == rule.mask]
+
+    def detect(self, numbers: List[int]) -> List[int]:
+        """発動する必殺Noのリスト（重複なし）"""
+        hissatsu_nos = []
+        seen = set()
+        for rule in self.activated(numbers):
+            if rule.hissatsu_no not in seen:
+                seen.add(rule.hissatsu_no)
+                hissatsu_nos.append(rule.hissatsu_no)
+        return hissatsu_nos
+
+    def pairs(self, numbers: List[int]) -> Dict[int, List[int]]:
+        """{必殺No: [数字1, 数字2]}（小さい方が先。同じペアは最初の行だけ）"""
+        return pairs_of(self.activated(numbers))
+
+
+def pairs_of(rules: List[PairRule]) -> Dict[int, List[int]]:
+    """成立した行から {必殺No: [数字1, 数字2]} を作る"""
+    hissatsu_pairs = {}
+    processed_pairs = set()
+    for rule in rules:
+        # ペアの順序を正規化（小さい方を先に）
+        pair_tuple = tuple(sorted([rule.no, rule.pair_no]))
+        if pair_tuple not in processed_pairs:
+            processed_pairs.add(pair_tuple)
+            hissatsu_pairs[rule.hissatsu_no] = list(pair_tuple)
+    return hissatsu_pairs
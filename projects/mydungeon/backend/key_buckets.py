@@ -0,0 +1,83 @@
+"""
+スクレイピングキーの正規化テーブル
+equivalence_analyzerが生成した「出力が変わる時刻の境界」をもとに、同じ結果になる入力を1つのキーにまとめる
+"""
+import json
+from bisect import bisect_right
+from typing import Iterable, List
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.result_cache import make_key
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class TimeBucketTable:
+    """1日の中で出力が変わる時刻（0時からの分）の境界表"""
+
+    def __init__(self, boundaries: Iterable[int] = None, time_independent_dates: Iterable[str] = None, metadata: dict = None):
+        # 境界が無い場合は1分単位（正規化しない）
+        self.boundaries: List[int] = sorted(set(boundaries)) if boundaries is not None else None
+        if self.boundaries is not None and (not self.boundaries or self.boundaries[0] != 0):
+            self.boundaries = [0] + (self.boundaries or [])
+        self.time_independent_dates = set(time_independent_dates or [])
+        self.metadata = metadata or {}
+
+    @property
+    def active(self) -> bool:
+        return self.boundaries is not None or bool(self.time_independent_dates)
+
+    @classmethod
+    def load(cls, path: str) -> 'TimeBucketTable':
+        """JSONから読み込む（ファイルが無ければ正規化しないテーブル）"""
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            table = cls(data.get('boundaries'), data.get('time_independent_dates'), data)
+            logger.info(f"Loaded key bucket table: {len(table.boundaries or [])} time buckets")
+            return table
+        except Exception as e:
+            logger.warning(f"Failed to load key bucket table {path}: {str(e)}")
+            return cls()
+
+    def save(self, path: str, **metadata):
+        """JSONに保存"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        data = {
+            **self.metadata,
+            **metadata,
+            'boundaries': self.boundaries,
+            'time_independent_dates': sorted(self.time_independent_dates),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def bucket_start(self, minute_of_day: int) -> int:
+        """分を含むバケットの先頭の分"""
+        if self.boundaries is None:
+            return minute_of_day
+        return self.boundaries[bisect_right(self.boundaries, minute_of_day) - 1]
+
+    def canonical_key(self, birthdate: str, birthtime: str) -> str:
+        """同じ結果になる入力をまとめたキャッシュ・合流用のキー"""
+        key = make_key(birthdate, birthtime)
+        if not self.active:
+            return key
+        date, time_text = key.split(' ')
+        if date in self.time_independent_dates:
+            return f"{date} 00:00"
+        hour, minute = time_text.split(':')
+        start = self.bucket_start(int(hour) * 60 + int(minute))
+        return f"{date} {start // 60:02d}:{start % 60:02d}"
+
+
+# アプリ全体で使う正規化テーブル（ファイルが無ければ正規化しない）
+key_buckets = TimeBucketTable.load(settings.SCRAPE_KEY_BUCKETS_FILE)
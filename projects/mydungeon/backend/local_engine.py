@@ -0,0 +1,216 @@
+"""
+外部サイトの数字計算をローカルで行うバックエンド
+外部サイトがページ内のJavaScriptで数字を計算している場合に、その計算をPythonに移植した
+バージョン付きのモジュール（LOCAL_ENGINE_PATH）を読み込み、ブラウザを使わずに数字を求める
+一部の結果は裏でブラウザ（または記録の再生）でも取得して突き合わせ、食い違えば計算を止めて
+キャッシュに保存済みの計算結果を消す
+
+計算モジュールの形式:
+    ENGINE_VERSION = "2024-05-01"  # 移植元の外部サイトのスクリプトのバージョン
+    def compute(year: int, month: int, day: int, hour: int, minute: int) -> List[int]: ...
+
+使い方（記録した結果との突き合わせ）:
+    python -m backend.local_engine --recordings cache/upstream_recordings.jsonl
+"""
+import asyncio
+import importlib.util
+import random
+from typing import List, Optional, Set, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.scrape_backends import BackendUnavailable, ScrapeBackend
+from backend.admission import AdmissionRejected
+from backend.upstream_standin import RecordingStore
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LocalEngine:
+    """読み込んだ計算モジュール"""
+
+    def __init__(self, path: str, version: str, compute):
+        self.path = path
+        self.version = version
+        self._compute = compute
+
+    def compute(self, values: Tuple[str, str, str, str, str]) -> List[int]:
+        """(年, 月, 日, 時, 分)から数字を計算（外部サイトの結果と同じく1〜72の重複なし）"""
+        numbers = [int(n) for n in self._compute(*(int(v) for v in values))]
+        if not all(1 <= n <= 72 for n in numbers):
+            raise ValueError(f"Engine {self.version} returned out-of-range numbers: {numbers}")
+        return list(dict.fromkeys(numbers))
+
+
+def load_engine(path: str = None) -> Optional[LocalEngine]:
+    """計算モジュールを読み込む（ファイルが無い・形式が違う場合はNone）"""
+    path = path or settings.LOCAL_ENGINE_PATH
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        spec = importlib.util.spec_from_file_location('mydungeon_local_engine', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except Exception as e:
+        logger.warning(f"Failed to load local engine {path}: {str(e)}")
+        return None
+    version = getattr(module, 'ENGINE_VERSION', None)
+    compute = getattr(module, 'compute', None)
+    if not version or not callable(compute):
+        logger.warning(f"Local engine {path} must define ENGINE_VERSION and compute()")
+        return None
+    logger.info(f"Loaded local engine {version} from {path}")
+    return LocalEngine(path, str(version), compute)
+
+
+class LocalEngineBackend(ScrapeBackend):
+    """計算モジュールで数字を求めるバックエンド（使えない場合はブラウザにフォールバック）"""
+
+    name = 'local'
+    in_process = True
+
+    def __init__(self, scraper, engine: LocalEngine = None, crosscheck_rate: float = None, disable_on_mismatch: bool = None):
+        self.scraper = scraper
+        self.engine = engine if engine is not None else load_engine()
+        # 突き合わせる割合（0〜1）と、食い違ったら計算を止めるか
+        self.crosscheck_rate = crosscheck_rate if crosscheck_rate is not None else settings.LOCAL_ENGINE_CROSSCHECK_RATE
+        self.disable_on_mismatch = (
+            disable_on_mismatch if disable_on_mismatch is not None else settings.LOCAL_ENGINE_DISABLE_ON_MISMATCH
+        )
+        self.disabled_reason: Optional[str] = None if self.engine else 'no engine loaded'
+        self._tasks: Set[asyncio.Task] = set()
+        self.computed = 0
+        self.crosschecks = 0
+        self.crosscheck_skipped = 0
+        self.mismatches = 0
+        self.purged = 0
+        self.last_mismatch: Optional[dict] = None
+
+    async def fetch(self, values, return_raw_text=False):
+        if self.disabled_reason:
+            raise BackendUnavailable(f"Local engine disabled ({self.disabled_reason})")
+        # 生テキストは外部サイトにしか無いので、ブラウザで取得する
+        if return_raw_text:
+            raise BackendUnavailable("Local engine has no raw text")
+        try:
+            numbers = self.engine.compute(values)
+        except Exception as e:
+            self._disable(f"compute failed: {str(e)}")
+            raise BackendUnavailable(str(e))
+        self.computed += 1
+        if self.crosscheck_rate > 0 and random.random() < self.crosscheck_rate:
+            self._spawn(self.cross_check(values, numbers))
+        return numbers, ''
+
+    def cache_source(self) -> Optional[str]:
+        # 計算が止まっている間のfetchはブラウザにフォールバックした外部サイトの結果
+        if self.disabled_reason:
+            return None
+        return self._engine_source()
+
+    async def cross_check(self, values: Tuple[str, str, str, str, str], numbers: List[int]) -> Optional[bool]:
+        """
+        ブラウザで取得した結果と順序・重複も含めて突き合わせる（混雑時・ブレーカーが開いているときは見送る）
+
+        食い違った場合、計算を止める設定ならキャッシュに保存済みの計算結果も消す。
+
+        Returns:
+            一致すればTrue、食い違えばFalse、見送った場合はNone
+        """
+        if not self.scraper.breaker.allows_calls():
+            self.crosscheck_skipped += 1
+            return None
+        try:
+            async with self.scraper.admission.slot():
+                expected, _ = await self.scraper.browser_backend.fetch(values)
+        except AdmissionRejected:
+            self.crosscheck_skipped += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Local engine cross-check for {values} failed: {str(e)}")
+            self.crosscheck_skipped += 1
+            return None
+
+        self.crosschecks += 1
+        if list(expected) == list(numbers):
+            return True
+        self.mismatches += 1
+        self.last_mismatch = {'values': list(values), 'engine': numbers, 'upstream': expected}
+        logger.error(f"Local engine {self.engine.version} mismatch for {values}: engine={numbers} upstream={expected}")
+        if self.disable_on_mismatch:
+            self._disable(f"mismatch for {'/'.join(values)}")
+            self.purged += await self.scraper.cache.invalidate_source_async(self._engine_source())
+            logger.error(f"Purged {self.purged} cached result(s) computed by local engine {self.engine.version}")
+        return False
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'engine_version': self.engine.version if self.engine else None,
+            'disabled_reason': self.disabled_reason,
+            'computed': self.computed,
+            'crosscheck_rate': self.crosscheck_rate,
+            'crosschecks': self.crosschecks,
+            'crosscheck_skipped': self.crosscheck_skipped,
+            'mismatches': self.mismatches,
+            'purged': self.purged,
+            'last_mismatch': self.last_mismatch,
+        }
+
+    def _engine_source(self) -> str:
+        return f"local:{self.engine.version}"
+
+    def _disable(self, reason: str):
+        if not self.disabled_reason:
+            logger.error(f"Local engine disabled, falling back to browser: {reason}")
+            self.disabled_reason = reason
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def verify_against_recordings(engine: LocalEngine, store: RecordingStore) -> Tuple[int, List[dict]]:
+    """記録した外部サイトの結果と計算結果を突き合わせ、(件数, 食い違いのリスト)を返す"""
+    mismatches = []
+    checked = 0
+    for key in store.keys():
+        record = store.get(key)
+        birthdate, birthtime = key.split(' ')
+        values = tuple(birthdate.split('-')) + tuple(birthtime.split(':'))
+        checked += 1
+        try:
+            numbers = engine.compute(values)
+        except Exception as e:
+            mismatches.append({'key': key, 'error': str(e)})
+            continue
+        if list(numbers) != list(record['numbers']):
+            mismatches.append({'key': key, 'engine': numbers, 'upstream': record['numbers']})
+    return checked, mismatches
+
+
+# 記録した結果と突き合わせる（python -m backend.local_engine）
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='ローカル計算モジュールを記録した結果と突き合わせる')
+    parser.add_argument('--engine', default=settings.LOCAL_ENGINE_PATH, help='計算モジュールのパス')
+    parser.add_argument('--recordings', default=settings.UPSTREAM_RECORDINGS_FILE, help='記録ファイル（JSON Lines）')
+    args = parser.parse_args()
+
+    engine = load_engine(args.engine)
+    if engine is None:
+        print(f"計算モジュールを読み込めませんでした: {args.engine}")
+        sys.exit(1)
+    checked, mismatches = verify_against_recordings(engine, RecordingStore(args.recordings))
+    print(f"計算モジュール {engine.version}: {checked}件中 {checked - len(mismatches)}件一致")
+    for mismatch in mismatches[:20]:
+        print(f"  ❌ {mismatch}")
+    sys.exit(1 if mismatches or not checked else 0)
+
+if __name__ == "__main__":
+    main()
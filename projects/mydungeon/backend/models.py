@@ -1,5 +1,7 @@
+import os
+from dataclasses import dataclass, field, fields
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Tuple
 
 class CalculateRequest(BaseModel):
     """生年月日と時刻のリクエスト"""
@@ -11,8 +13,19 @@ class NumbersResponse(BaseModel):
     numbers: List[int]
     message: str
 
-class ItemInfo(BaseModel):
-    """アイテム情報"""
+def image_path_to_url(image_path: str) -> str:
+    """画像パスをWeb URLに変換（database/images/item/1.jpg -> /images/item/1.jpg）"""
+    if not image_path:
+        return ""
+    parts = image_path.split(os.sep)
+    if 'images' in parts:
+        idx = parts.index('images')
+        return '/' + '/'.join(parts[idx:])
+    return ""
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class ItemInfo:
+    """アイテム情報（CSV読み込み時に1度だけ作り、リクエスト間で共有する変更不可のレコード）"""
     no: int
     name: str
     pair_no: Optional[int] = None
@@ -25,9 +38,19 @@ class ItemInfo(BaseModel):
     on_state: str
     off_state: str
     image_path: str
+    image_url: str = field(init=False, repr=False, compare=False)
+    _serialized: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        _precompute(self)
+
+    def as_dict(self, with_image_path: bool = True) -> dict:
+        """レスポンス用の辞書（作成済みの辞書のコピー。image_urlを含む）"""
+        return _as_dict(self, with_image_path)
 
-class HissatsuInfo(BaseModel):
-    """必殺技情報"""
+@dataclass(frozen=True, slots=True, kw_only=True)
+class HissatsuInfo:
+    """必殺技情報（CSV読み込み時に1度だけ作り、リクエスト間で共有する変更不可のレコード）"""
     hissatsu_no: int
     name: str
     color: str
@@ -40,6 +63,72 @@ class HissatsuInfo(BaseModel):
     on_state: str
     off_state: str
     image_path: str
+    image_url: str = field(init=False, repr=False, compare=False)
+    _serialized: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        _precompute(self)
+
+    def as_dict(self, with_image_path: bool = True) -> dict:
+        """レスポンス用の辞書（作成済みの辞書のコピー。image_urlを含む）"""
+        return _as_dict(self, with_image_path)
+
+def _precompute(record):
+    """画像URLとレスポンス用の辞書を作っておく（frozenなのでobject.__setattr__で設定）"""
+    object.__setattr__(record, 'image_url', image_path_to_url(record.image_path))
+    serialized = {f.name: getattr(record, f.name) for f in fields(record) if f.init}
+    serialized['image_url'] = record.image_url
+    object.__setattr__(record, '_serialized', serialized)
+
+def _as_dict(record, with_image_path: bool) -> dict:
+    serialized = dict(record._serialized)
+    if not with_image_path:
+        del serialized['image_path']
+    return serialized
+
+class ColorCount(NamedTuple):
+    """色ごとの枚数"""
+    name: str
+    meaning: str
+    count: int
+
+class ColorSystemCount(NamedTuple):
+    """色系統ごとの枚数"""
+    name: str
+    meaning: str
+    total_count: int
+    colors: Tuple[ColorCount, ...]
+
+def color_counts_to_dict(color_systems: Tuple[ColorSystemCount, ...]) -> dict:
+    """色系統ごとの枚数をレスポンスの形（{'color_systems': [...]}）にする"""
+    return {'color_systems': [
+        {
+            'name': system.name,
+            'meaning': system.meaning,
+            'total_count': system.total_count,
+            'colors': [color._asdict() for color in system.colors]
+        }
+        for system in color_systems
+    ]}
+
+@dataclass(frozen=True, slots=True)
+class AnalysisResult:
+    """1人分の数字の分析結果（DataProcessor.analyzeが1回の走査で作る変更不可の結果）"""
+    numbers: Tuple[int, ...]
+    mask: int  # 数字のビットマスク（数字nはビットn-1。範囲外の数字は含まない）
+    items: Tuple[ItemInfo, ...]
+    hissatsus: Tuple[HissatsuInfo, ...]
+    hissatsu_pairs: Mapping[int, Tuple[int, int]]  # {必殺No: (数字1, 数字2)}（読み取り専用）
+    hissatsu_numbers: FrozenSet[int]  # 必殺技成立数字（赤字表示用）
+    color_systems: Tuple[ColorSystemCount, ...]
+
+    def pairs_dict(self) -> Dict[int, List[int]]:
+        """{必殺No: [数字1, 数字2]}（get_hissatsu_pair_numbersと同じ形）"""
+        return {hissatsu_no: list(pair) for hissatsu_no, pair in self.hissatsu_pairs.items()}
+
+    def color_counts_dict(self) -> dict:
+        """色系統ごとの枚数（get_color_countsと同じ形）"""
+        return color_counts_to_dict(self.color_systems)
 
 class ResultResponse(BaseModel):
     """最終結果のレスポンス"""
@@ -0,0 +1,38 @@
+"""
+数字のビットマスク
+数字は1〜72なので数字の集合は1つの整数に収まる（数字nはビットn-1）。
+結果キャッシュと必殺技判定は同じ変換を使う。
+"""
+from typing import Iterable, List
+
+# 数字の範囲（1〜72）
+MAX_NUMBER = 72
+MASK_BYTES = (MAX_NUMBER + 7) // 8
+
+
+def number_bit(n: int) -> int:
+    """数字nのビット（範囲外なら0）"""
+    if not 1 <= n <= MAX_NUMBER:
+        return 0
+    return 1 << (n - 1)
+
+
+def numbers_to_mask(numbers: Iterable[int], strict: bool = True) -> int:
+    """
+    数字の集合をビットマスクに変換（数字nはビットn-1）
+
+    Args:
+        strict: Trueなら範囲外の数字でValueError、Falseなら範囲外の数字を無視する
+    """
+    mask = 0
+    for n in numbers:
+        bit = number_bit(n)
+        if not bit and strict:
+            raise ValueError(f"Number out of range: {n}")
+        mask |= bit
+    return mask
+
+
+def mask_to_numbers(mask: int) -> List[int]:
+    """ビットマスクを昇順の数字リストに変換"""
+    return [n for n in range(1, MAX_NUMBER + 1) if mask >> (n - 1) & 1]
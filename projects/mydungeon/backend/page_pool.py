@@ -0,0 +1,241 @@
+"""
+フォーム準備済みページプール
+外部サイトのフォームを開いた状態のページを常に保持し、ページ読み込みをリクエストの外で行う
+"""
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional, Set
+from playwright.async_api import Page
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.browser_pool import BrowserPool, browser_pool
+from backend.resource_filter import resource_filter
+from backend.upstream_standin import upstream_target
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# フォームの描画完了を判定するセレクタ
+FORM_READY_SELECTOR = 'fieldset[name="dateFields"]'
+
+
+class FormPage:
+    """フォームを開いた状態のページと、その所有コンテキスト"""
+
+    def __init__(self, stack: AsyncExitStack, page: Page):
+        self.stack = stack
+        self.page = page
+        self.uses = 0
+        self.ready_at = time.monotonic()
+
+    async def close(self):
+        try:
+            await self.stack.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close pooled page: {str(e)}")
+
+
+class FormPagePool:
+    """フォーム準備済みページのプール"""
+
+    def __init__(self, pool: BrowserPool = None, size: int = None, url: str = None):
+        self.browser_pool = pool or browser_pool
+        self.size = size if size is not None else settings.FORM_PAGE_POOL_SIZE
+        # 接続先は初回の遷移時に解決する（import時に再生モードの代替サーバーを起動しない）
+        self._url = url
+        self.timeout = settings.SCRAPING_TIMEOUT
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._running = False
+        self.warm_hits = 0
+        self.cold_misses = 0
+        self.resets = 0
+        self.reset_failures = 0
+        self.retired_discards = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    @property
+    def url(self) -> str:
+        if self._url is None:
+            self._url = upstream_target().url
+        return self._url
+
+    async def start(self):
+        """プールサイズ分のページを並列に開いてフォームを準備する"""
+        if self._running or self.size <= 0 or not self.browser_pool.is_running:
+            return
+        self._ready = asyncio.Queue()
+        self._running = True
+        self.browser_pool.retire_listeners.append(self._discard_retired)
+        for _ in range(self.size):
+            self._spawn(self._refill())
+        logger.info(f"Form page pool started with {self.size} page(s)")
+
+    async def stop(self):
+        """補充タスクを止めて全ページを閉じる"""
+        if not self._running:
+            return
+        self._running = False
+        if self._discard_retired in self.browser_pool.retire_listeners:
+            self.browser_pool.retire_listeners.remove(self._discard_retired)
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while not self._ready.empty():
+            await self._ready.get_nowait().close()
+        logger.info("Form page pool stopped")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        フォーム入力可能なページを払い出す
+
+        準備済みページがあればそれを使い、使用後はバックグラウンドで再読み込みしてプールに戻す。
+        準備済みページが無い場合はその場でページを開き、使用後に閉じる。
+        """
+        form_page = self._take_ready()
+        if form_page is None:
+            self.cold_misses += 1
+            async with self.browser_pool.new_context() as context:
+                page = await self._new_form_page(context)
+                self.browser_pool.record_page_use(page)
+                yield page
+            return
+
+        self.warm_hits += 1
+        form_page.uses += 1
+        self.browser_pool.record_page_use(form_page.page)
+        try:
+            yield form_page.page
+        finally:
+            # 入力済みのページをリセットしてからプールに戻す
+            self._spawn(self._reset(form_page))
+
+    async def open_form(self, page: Page):
+        """ページを外部サイトのフォームまで遷移させる"""
+        logger.info(f"Accessing {self.url}")
+        await page.goto(self.url, timeout=self.timeout)
+        await page.wait_for_selector(FORM_READY_SELECTOR, timeout=self.timeout)
+
+    async def _new_form_page(self, context) -> Page:
+        """不要リソースを遮断したページを開き、フォームまで遷移させる"""
+        page = await context.new_page()
+        await resource_filter.install(page)
+        await self.open_form(page)
+        return page
+
+    def stats(self) -> dict:
+        """プールの状態を返す"""
+        return {
+            'running': self._running,
+            'size': self.size,
+            'ready': self._ready.qsize() if self._ready else 0,
+            'warm_hits': self.warm_hits,
+            'cold_misses': self.cold_misses,
+            'resets': self.resets,
+            'reset_failures': self.reset_failures,
+            'retired_discards': self.retired_discards,
+        }
+
+    def _take_ready(self) -> Optional[FormPage]:
+        """準備済みページを取り出す（入れ替え対象のブラウザのページは捨てて作り直す）"""
+        if not self._running:
+            return None
+        while True:
+            try:
+                form_page = self._ready.get_nowait()
+            except asyncio.QueueEmpty:
+                return None
+            if not self.browser_pool.is_retired(form_page.page):
+                return form_page
+            self.retired_discards += 1
+            self._spawn(self._replace(form_page))
+
+    def _discard_retired(self):
+        """入れ替え対象のブラウザの待機中ページを作り直す（古いブラウザのドレインを待たせない）"""
+        if not self._running:
+            return
+        keep = []
+        while not self._ready.empty():
+            form_page = self._ready.get_nowait()
+            if self.browser_pool.is_retired(form_page.page):
+                self.retired_discards += 1
+                self._spawn(self._replace(form_page))
+            else:
+                keep.append(form_page)
+        for form_page in keep:
+            self._ready.put_nowait(form_page)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _create(self) -> FormPage:
+        stack = AsyncExitStack()
+        try:
+            context = await stack.enter_async_context(self.browser_pool.new_context())
+            page = await self._new_form_page(context)
+        except BaseException:
+            await stack.aclose()
+            raise
+        return FormPage(stack, page)
+
+    async def _refill(self):
+        """新しいページを開いてプールに追加（失敗時は間隔を空けて再試行）"""
+        while self._running:
+            try:
+                form_page = await self._create()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to prepare form page: {str(e)}")
+                await asyncio.sleep(settings.FORM_PAGE_RETRY_DELAY)
+                continue
+            await self._put(form_page)
+            return
+
+    async def _reset(self, form_page: FormPage):
+        """使用済みページをフォームに再遷移させる。失敗したページは作り直す"""
+        if not self._running:
+            await form_page.close()
+            return
+        if self.browser_pool.is_retired(form_page.page):
+            self.retired_discards += 1
+            await self._replace(form_page)
+            return
+        try:
+            await self.open_form(form_page.page)
+            form_page.ready_at = time.monotonic()
+            self.resets += 1
+        except asyncio.CancelledError:
+            await form_page.close()
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to reset form page, replacing it: {str(e)}")
+            self.reset_failures += 1
+            await self._replace(form_page)
+            return
+        await self._put(form_page)
+
+    async def _replace(self, form_page: FormPage):
+        """ページを閉じ、新しいブラウザで作り直す"""
+        await form_page.close()
+        await self._refill()
+
+    async def _put(self, form_page: FormPage):
+        if self._running:
+            self._ready.put_nowait(form_page)
+        else:
+            await form_page.close()
+
+
+# アプリ全体で共有するフォームページプール
+form_page_pool = FormPagePool()
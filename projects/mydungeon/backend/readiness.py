@@ -0,0 +1,180 @@
+"""
+ページ準備完了の判定エンジン
+固定時間のsleepではなく、結果欄のDOM変化・ネットワークの静止を待つ
+（選択肢の出現待ちは送信スクリプト内で行い、終わった時点でoption_readyに記録する）
+"""
+import asyncio
+import time
+from collections import Counter
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeout
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 結果が表示される要素
+RESULT_SELECTOR = 'table, #app section:not(#data-input)'
+
+# 結果欄の変化を監視するMutationObserverを仕掛けるJS文（送信スクリプトに埋め込んで使う）
+RESULT_WATCH_SNIPPET = """
+    if (window.__mdResultObserver) window.__mdResultObserver.disconnect();
+    window.__mdResultMutated = false;
+    const __mdRoot = document.querySelector('#app') || document.body;
+    window.__mdResultObserver = new MutationObserver(() => { window.__mdResultMutated = true; });
+    window.__mdResultObserver.observe(__mdRoot, { childList: true, subtree: true, characterData: true });
+"""
+
+# 結果欄に数字が表示されているか
+_RESULT_PRESENT_JS = """
+(selector) => {
+    const el = document.querySelector(selector);
+    return !!el && /\\d/.test(el.innerText || '');
+}
+"""
+
+# 監視開始後にDOMが変化し、結果欄に数字が表示されているか
+_RESULT_READY_JS = """
+(selector) => {
+    if (!window.__mdResultMutated) return false;
+    const el = document.querySelector(selector);
+    return !!el && /\\d/.test(el.innerText || '');
+}
+"""
+
+# 同じページで再送信した場合用：監視開始後にDOMが変化し、前回読み取った結果と違う内容が表示されているか
+# （前回の結果はwindow.__mdLastResultに抽出スクリプトが保存する）
+_RESULT_CHANGED_JS = """
+(selector) => {
+    if (!window.__mdResultMutated) return false;
+    const el = document.querySelector(selector);
+    return !!el && /\\d/.test(el.innerText || '') && el.innerText !== window.__mdLastResult;
+}
+"""
+
+# どのシグナルで準備完了と判定したかの累計
+signal_counts: Counter = Counter()
+
+
+class ReadinessTimeout(PlaywrightTimeout):
+    """フェーズごとのタイムアウト"""
+
+    def __init__(self, phase: str, timeout_ms: float):
+        super().__init__(f"Readiness phase '{phase}' timed out after {timeout_ms:.0f}ms")
+        self.phase = phase
+        self.timeout_ms = timeout_ms
+
+
+class ReadinessSignal:
+    """準備完了を知らせたシグナル"""
+
+    def __init__(self, phase: str, name: str, elapsed_ms: float):
+        self.phase = phase
+        self.name = name
+        self.elapsed_ms = elapsed_ms
+
+    def __repr__(self):
+        return f"ReadinessSignal(phase={self.phase!r}, name={self.name!r}, elapsed_ms={self.elapsed_ms:.0f})"
+
+
+class ReadinessWaiter:
+    """1ページ分の準備完了待ち"""
+
+    def __init__(self, page: Page):
+        self.page = page
+        self.option_timeout = settings.READINESS_OPTION_TIMEOUT  # 送信スクリプト内の選択肢待ち
+        self.result_timeout = settings.READINESS_RESULT_TIMEOUT
+        self.network_quiet_ms = settings.READINESS_NETWORK_QUIET_MS
+        self._inflight = 0
+        self._last_activity = time.monotonic()
+        self._listening = False
+
+    def track_network(self):
+        """送信前に呼び出し、進行中リクエストの追跡を開始する"""
+        if not self._listening:
+            self.page.on('request', self._on_request)
+            self.page.on('requestfinished', self._on_request_done)
+            self.page.on('requestfailed', self._on_request_done)
+            self._listening = True
+        self._inflight = 0
+        self._last_activity = time.monotonic()
+
+    def untrack_network(self):
+        """進行中リクエストの追跡を終了する"""
+        if not self._listening:
+            return
+        self.page.remove_listener('request', self._on_request)
+        self.page.remove_listener('requestfinished', self._on_request_done)
+        self.page.remove_listener('requestfailed', self._on_request_done)
+        self._listening = False
+
+    def option_ready(self, start: float, waited_frames: int) -> ReadinessSignal:
+        """
+        送信スクリプト内の選択肢待ちが終わったことを記録する
+
+        Args:
+            start: 送信スクリプトを呼び出した時刻（time.monotonic()）
+            waited_frames: 選択肢の出現を待ったフレーム数（0なら最初から揃っていた）
+        """
+        return self._fired('option', 'options_appeared' if waited_frames else 'options_present', start)
+
+    async def wait_for_result(self, changed: bool = False) -> ReadinessSignal:
+        """
+        結果の表示を待つ
+
+        送信前にRESULT_WATCH_SNIPPETで仕掛けたDOM変化の監視を主シグナルとし、
+        ネットワークが静止した時点で結果欄に数字が出ていればそれも準備完了とみなす
+
+        Args:
+            changed: 前回の結果が表示されたページで再送信した場合にTrue。
+                前回と違う結果が出るまでを主シグナルとし、ネットワーク静止時は
+                DOMが変化していれば（同じ結果の再表示も）準備完了とみなす
+        """
+        start = time.monotonic()
+        mutation = asyncio.ensure_future(self.page.wait_for_function(
+            _RESULT_CHANGED_JS if changed else _RESULT_READY_JS, arg=RESULT_SELECTOR, timeout=self.result_timeout
+        ))
+        idle = asyncio.ensure_future(self._wait_network_idle(self.result_timeout / 1000))
+        try:
+            done, _ = await asyncio.wait({mutation, idle}, return_when=asyncio.FIRST_COMPLETED)
+            if idle in done and not mutation.done() and idle.result():
+                if await self.page.evaluate(_RESULT_READY_JS if changed else _RESULT_PRESENT_JS, RESULT_SELECTOR):
+                    return self._fired('result', 'network_idle', start)
+            try:
+                await mutation
+            except PlaywrightTimeout:
+                raise ReadinessTimeout('result', self.result_timeout)
+            return self._fired('result', 'dom_mutation', start)
+        finally:
+            for task in (mutation, idle):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(mutation, idle, return_exceptions=True)
+            self.untrack_network()
+
+    async def _wait_network_idle(self, timeout: float) -> bool:
+        """進行中のリクエストが0件のまま一定時間経過するまで待つ"""
+        deadline = time.monotonic() + timeout
+        quiet = self.network_quiet_ms / 1000
+        while time.monotonic() < deadline:
+            if self._inflight <= 0 and time.monotonic() - self._last_activity >= quiet:
+                return True
+            await asyncio.sleep(min(0.05, quiet))
+        return False
+
+    def _on_request(self, request):
+        self._inflight += 1
+        self._last_activity = time.monotonic()
+
+    def _on_request_done(self, request):
+        self._inflight -= 1
+        self._last_activity = time.monotonic()
+
+    def _fired(self, phase: str, name: str, start: float) -> ReadinessSignal:
+        signal = ReadinessSignal(phase, name, (time.monotonic() - start) * 1000)
+        signal_counts[f"{phase}:{name}"] += 1
+        logger.debug(f"Readiness: {signal}")
+        return signal
@@ -0,0 +1,67 @@
+"""
+リソースブロック用のルーティング
+外部サイトの画像・フォント・CSS・解析スクリプトなど、フォーム操作と結果取得に不要な通信を遮断する
+"""
+from collections import Counter
+from playwright.async_api import Page, Route
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ResourceFilter:
+    """page.routeで不要なリソースを遮断し、遮断したリクエスト数を種別ごとに集計する"""
+
+    def __init__(self, allowed_types=None, blocked_url_patterns=None):
+        self.allowed_types = set(allowed_types if allowed_types is not None
+                                 else settings.SCRAPER_ALLOWED_RESOURCE_TYPES)
+        self.blocked_url_patterns = list(blocked_url_patterns if blocked_url_patterns is not None
+                                         else settings.SCRAPER_BLOCKED_URL_PATTERNS)
+        self.allowed_requests = 0
+        self.blocked_requests = 0
+        self.blocked_by_type: Counter = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SCRAPER_BLOCK_RESOURCES
+
+    async def install(self, page: Page):
+        """ページにルーティングを設定する（ページ遷移前に呼び出す）"""
+        if self.enabled:
+            await page.route('**/*', self._handle)
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        """リソースを遮断するかどうか"""
+        if resource_type not in self.allowed_types:
+            return True
+        return any(pattern in url for pattern in self.blocked_url_patterns)
+
+    def stats(self) -> dict:
+        """遮断状況の集計を返す"""
+        return {
+            'enabled': self.enabled,
+            'allowed_requests': self.allowed_requests,
+            'blocked_requests': self.blocked_requests,
+            'blocked_by_type': dict(self.blocked_by_type),
+        }
+
+    async def _handle(self, route: Route):
+        request = route.request
+        resource_type = request.resource_type
+        if self.should_block(resource_type, request.url):
+            self.blocked_requests += 1
+            self.blocked_by_type[resource_type] += 1
+            logger.debug(f"Blocked {resource_type}: {request.url}")
+            await route.abort('blockedbyclient')
+        else:
+            self.allowed_requests += 1
+            await route.continue_()
+
+
+# アプリ全体で共有するリソースフィルタ
+resource_filter = ResourceFilter()
@@ -0,0 +1,234 @@
+"""
+スクレイピング結果の永続キャッシュ
+(生年月日, 時刻) → 数字の対応は決定的なので、SQLite（WALモード）に保存し、手前にプロセス内LRUを置く
+数字は外部サイトの表示順のまま1数字1バイトで保存する（集合として比べるための72ビットのマスクも併せて保存）
+イベントループ上からはasync版のメソッドを使う（SQLiteの読み書きをスレッドで行い、ループを止めない）
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.number_mask import MASK_BYTES, MAX_NUMBER, mask_to_numbers, numbers_to_mask
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def numbers_to_bytes(numbers: Iterable[int]) -> bytes:
+    """数字リストを順序どおりのバイト列に変換（1数字1バイト）"""
+    numbers = list(numbers)
+    for n in numbers:
+        if not 1 <= n <= MAX_NUMBER:
+            raise ValueError(f"Number out of range: {n}")
+    return bytes(numbers)
+
+
+def make_key(birthdate: str, birthtime: str) -> str:
+    """表記ゆれ（先頭ゼロの有無など）を吸収したキャッシュキー"""
+    year, month, day = birthdate.split('-')
+    hour, minute = birthtime.split(':')
+    return f"{int(year):04d}-{int(month):02d}-{int(day):02d} {int(hour):02d}:{int(minute):02d}"
+
+
+class ScrapeResultCache:
+    """SQLite + LRUのスクレイピング結果キャッシュ"""
+
+    def __init__(self, path: str = None, ttl: float = None, version: str = None, lru_size: int = None, stale_ttl: float = None):
+        self.path = path or settings.SCRAPE_CACHE_PATH
+        self.ttl = ttl if ttl is not None else settings.SCRAPE_CACHE_TTL
+        # 期限切れ後も、更新までの間に返してよい期間（秒、0で返さない）
+        self.stale_ttl = stale_ttl if stale_ttl is not None else settings.SCRAPE_CACHE_STALE_TTL
+        self.version = version or settings.SCRAPE_CACHE_VERSION
+        self.lru_size = lru_size if lru_size is not None else settings.SCRAPE_CACHE_LRU_SIZE
+        self._lru: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str) -> Optional[List[int]]:
+        """キャッシュから数字リスト（取得時の順序）を取得（無い・期限切れならNone）"""
+        return self._fresh(self._lookup(key))
+
+    async def get_async(self, key: str) -> Optional[List[int]]:
+        """getの非同期版"""
+        return self._fresh(await self._lookup_async(key))
+
+    def get_entry(self, key: str) -> Optional[Tuple[List[int], bool]]:
+        """
+        キャッシュから (数字リスト, 期限切れか) を取得
+
+        期限切れでもstale_ttlの範囲内なら期限切れとして返す（更新中に返すため）。
+        それより古い・無い場合はNone。
+        """
+        return self._servable(self._lookup(key))
+
+    async def get_entry_async(self, key: str) -> Optional[Tuple[List[int], bool]]:
+        """get_entryの非同期版"""
+        return self._servable(await self._lookup_async(key))
+
+    def put(self, key: str, numbers: Iterable[int], source: str = None):
+        """
+        数字リストを取得時の順序のまま保存
+
+        Args:
+            source: 外部サイト以外で求めた結果の出所（invalidate_sourceでまとめて消せる）
+        """
+        numbers = list(numbers)
+        data = numbers_to_bytes(numbers)
+        mask = numbers_to_mask(numbers)
+        stored_at = time.time()
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO scrape_results (key, mask, version, stored_at, numbers, source) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, mask.to_bytes(MASK_BYTES, 'big'), self.version, stored_at, data, source)
+            )
+            self._remember(key, data, stored_at)
+        self.stores += 1
+
+    async def put_async(self, key: str, numbers: Iterable[int], source: str = None):
+        """putの非同期版（SQLiteへの書き込みをスレッドで行う）"""
+        await asyncio.to_thread(self.put, key, list(numbers), source)
+
+    def contains(self, key: str) -> bool:
+        """期限内のエントリがあるか（統計には数えない）"""
+        entry = self._lookup(key)
+        return entry is not None and not self._is_expired(entry[1])
+
+    async def contains_async(self, key: str) -> bool:
+        """containsの非同期版"""
+        entry = await self._lookup_async(key)
+        return entry is not None and not self._is_expired(entry[1])
+
+    def invalidate(self, key: str = None):
+        """指定キー（省略時は全件）を削除"""
+        with self._lock:
+            if key is None:
+                self._connection().execute("DELETE FROM scrape_results")
+                self._lru.clear()
+            else:
+                self._connection().execute("DELETE FROM scrape_results WHERE key = ?", (key,))
+                self._lru.pop(key, None)
+
+    def invalidate_source(self, source: str) -> int:
+        """指定した出所の結果を全て削除し、削除した件数を返す（LRUは出所を持たないので空にする）"""
+        with self._lock:
+            deleted = self._connection().execute("DELETE FROM scrape_results WHERE source = ?", (source,)).rowcount
+            self._lru.clear()
+        return deleted
+
+    async def invalidate_source_async(self, source: str) -> int:
+        """invalidate_sourceの非同期版"""
+        return await asyncio.to_thread(self.invalidate_source, source)
+
+    def stats(self) -> dict:
+        """キャッシュの統計を返す"""
+        return {
+            'enabled': settings.SCRAPE_CACHE_ENABLED,
+            'version': self.version,
+            'ttl_seconds': self.ttl,
+            'stale_ttl_seconds': self.stale_ttl,
+            'lru_entries': len(self._lru),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'stores': self.stores,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._lru.clear()
+
+    def _fresh(self, entry: Optional[Tuple[bytes, float]]) -> Optional[List[int]]:
+        if entry is None or self._is_expired(entry[1]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry[0])
+
+    def _servable(self, entry: Optional[Tuple[bytes, float]]) -> Optional[Tuple[List[int], bool]]:
+        if entry is not None and not self._is_expired(entry[1]):
+            self.hits += 1
+            return list(entry[0]), False
+        if entry is not None and self._is_servable_stale(entry[1]):
+            self.stale_hits += 1
+            return list(entry[0]), True
+        self.misses += 1
+        return None
+
+    async def _lookup_async(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """LRUにあればそのまま返し、無ければSQLiteをスレッドで読む"""
+        with self._lock:
+            entry = self._lru_get(key)
+        if entry is not None:
+            return entry
+        return await asyncio.to_thread(self._lookup, key)
+
+    def _lookup(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            entry = self._lru_get(key)
+            if entry is not None:
+                return entry
+            # 順序を持たない旧形式のエントリ（numbersがNULL）は無いものとして取り直す
+            row = self._connection().execute(
+                "SELECT numbers, stored_at FROM scrape_results WHERE key = ? AND version = ? AND numbers IS NOT NULL",
+                (key, self.version)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = (bytes(row[0]), row[1])
+            self._remember(key, *entry)
+            return entry
+
+    def _lru_get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+        return entry
+
+    def _remember(self, key: str, data: bytes, stored_at: float):
+        if self.lru_size <= 0:
+            return
+        self._lru[key] = (data, stored_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _is_servable_stale(self, stored_at: float) -> bool:
+        return self.stale_ttl > 0 and time.time() - stored_at <= self.ttl + self.stale_ttl
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scrape_results ("
+                "key TEXT PRIMARY KEY, mask BLOB NOT NULL, version TEXT NOT NULL, stored_at REAL NOT NULL, numbers BLOB, source TEXT)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(scrape_results)")}
+            for column, column_type in (('numbers', 'BLOB'), ('source', 'TEXT')):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE scrape_results ADD COLUMN {column} {column_type}")
+            logger.info(f"Opened scrape result cache: {self.path}")
+        return self._conn
+
+
+# プロセス内で共有するキャッシュ
+scrape_cache = ScrapeResultCache()
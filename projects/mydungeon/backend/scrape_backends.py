@@ -0,0 +1,558 @@
+"""
+スクレイピングのバックエンド
+- browser: Playwrightでフォームを操作する（従来の方式）
+- replay: ブラウザで一度だけ外部サイトの通信を学習し、以降は同じHTTPリクエストを直接送る
+- local: 外部サイトの計算をPythonに移植したモジュールで求める（backend.local_engine）
+"""
+import asyncio
+import json
+import time
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import httpx
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 学習に使う入力（各値が互いに区別でき、ゼロ埋めの有無も判別できるように1桁の値を選ぶ）
+LEARN_SAMPLE = ('1987', '3', '7', '5', '9')
+
+# 学習したリクエストに含めるヘッダー（Cookieなどセッション固有のものは除く）
+REPLAY_HEADERS = {'accept', 'content-type', 'x-requested-with', 'origin', 'referer', 'user-agent'}
+
+
+class BackendUnavailable(Exception):
+    """バックエンドが使えない（未学習・応答形式の変化など）。ブラウザにフォールバックする"""
+
+
+class ResponseShapeChanged(BackendUnavailable):
+    """応答の形が学習時と変わった（学習結果を捨てて学習し直す）"""
+
+
+# 一時的な障害とみなす応答のステータス（学習結果は捨てずにブラウザにフォールバックする）
+TRANSIENT_STATUS_CODES = {408, 429}
+
+
+class ScrapeBackend:
+    """スクレイピングバックエンドのインターフェース"""
+
+    name = 'base'
+    # 外部サイトにアクセスしない（受付制御・ブレーカー・再試行を通さずに実行する）
+    in_process = False
+
+    async def fetch(self, values: Tuple[str, str, str, str, str], return_raw_text: bool = False) -> Tuple[List[int], str]:
+        """
+        入力値から数字を取得
+
+        Args:
+            values: (年, 月, 日, 時, 分)（先頭ゼロなし）
+            return_raw_text: 生テキストも取得するか
+
+        Returns:
+            (数字のリスト, 生テキスト)
+        """
+        raise NotImplementedError
+
+    def cache_source(self) -> Optional[str]:
+        """
+        fetchが返した結果をキャッシュに保存するときの出所（外部サイトから取得した結果ならNone）
+
+        出所を付けて保存した結果は、出所が信用できなくなったときにまとめて消せる。
+        """
+        return None
+
+    def stats(self) -> dict:
+        return {'name': self.name}
+
+
+class BrowserBackend(ScrapeBackend):
+    """Playwrightでフォームを操作するバックエンド"""
+
+    name = 'browser'
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+
+    async def fetch(self, values, return_raw_text=False):
+        return await self.scraper._scrape_in_browser(values, return_raw_text)
+
+
+def _renderings(values: Tuple[str, str, str, str, str]) -> Dict[str, str]:
+    """入力値がリクエスト内に現れうる表記と、そのプレースホルダー名"""
+    year, month, day, hour, minute = values
+    return {
+        'date': f"{year}-{int(month):02d}-{int(day):02d}",
+        'date_slash': f"{year}/{int(month):02d}/{int(day):02d}",
+        'time': f"{int(hour):02d}:{int(minute):02d}",
+        'year': year,
+        'month': month,
+        'day': day,
+        'hour': hour,
+        'minute': minute,
+        'month02': f"{int(month):02d}",
+        'day02': f"{int(day):02d}",
+        'hour02': f"{int(hour):02d}",
+        'minute02': f"{int(minute):02d}",
+    }
+
+
+def _templatize(value: Any, renderings: Dict[str, str]) -> Any:
+    """リクエスト中の値を、入力値に一致する部分をプレースホルダーに置き換えた形にする"""
+    if isinstance(value, dict):
+        return {k: _templatize(v, renderings) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_templatize(v, renderings) for v in value]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        for name, text in renderings.items():
+            if text.isdigit() and int(text) == value:
+                return {'$int': name}
+        return value
+    if isinstance(value, str):
+        for name, text in renderings.items():
+            if value == text:
+                return {'$str': name}
+        # 日付・時刻の複合表記は部分一致でも置き換える（短い数字は誤一致しやすいので対象外）
+        composites = [name for name in ('date', 'date_slash', 'time') if renderings[name] in value]
+        if composites:
+            value = value.replace('{', '{{').replace('}', '}}')
+            for name in composites:
+                value = value.replace(renderings[name], '{' + name + '}')
+            return {'$fmt': value}
+    return value
+
+
+def _templatize_pairs(pairs: List[Tuple[str, str]], renderings: Dict[str, str]) -> List[list]:
+    """クエリ文字列・フォームの(キー, 値)の値だけをテンプレート化"""
+    return [[key, _templatize(value, renderings)] for key, value in pairs]
+
+
+def _render(template: Any, renderings: Dict[str, str]) -> Any:
+    """_templatizeの逆変換"""
+    if isinstance(template, dict):
+        if '$int' in template:
+            return int(renderings[template['$int']])
+        if '$str' in template:
+            return renderings[template['$str']]
+        if '$fmt' in template:
+            return template['$fmt'].format(**renderings)
+        return {k: _render(v, renderings) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_render(v, renderings) for v in template]
+    return template
+
+
+def _contains_placeholder(template: Any) -> bool:
+    if isinstance(template, dict):
+        if {'$int', '$str', '$fmt'} & template.keys():
+            return True
+        return any(_contains_placeholder(v) for v in template.values())
+    if isinstance(template, list):
+        return any(_contains_placeholder(v) for v in template)
+    return False
+
+
+def _as_number(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def _numbers_at(obj: Any, path: List[Any]) -> Optional[List[int]]:
+    """JSONのパスから数字リストを取り出す（'*'はリストの各要素）"""
+    for i, key in enumerate(path):
+        if key == '*':
+            if not isinstance(obj, list):
+                return None
+            rest = path[i + 1:]
+            numbers = []
+            for element in obj:
+                n = _as_number(element) if not rest else None
+                if rest:
+                    sub = _numbers_at(element, rest)
+                    if sub is None or len(sub) != 1:
+                        return None
+                    n = sub[0]
+                if n is None:
+                    return None
+                numbers.append(n)
+            return numbers
+        if isinstance(obj, dict) and key in obj:
+            obj = obj[key]
+        elif isinstance(obj, list) and isinstance(key, int) and key < len(obj):
+            obj = obj[key]
+        else:
+            return None
+    n = _as_number(obj)
+    return [n] if n is not None else None
+
+
+def _find_numbers_path(obj: Any, target: List[int], path: List[Any] = None) -> Optional[List[Any]]:
+    """JSON内で、ブラウザで取得した数字と同じ集合になるリストのパスを探す"""
+    path = path or []
+    if isinstance(obj, list) and obj:
+        candidates = [path + ['*']]
+        if isinstance(obj[0], dict):
+            candidates += [path + ['*', key] for key in obj[0].keys()]
+        for candidate in candidates:
+            numbers = _numbers_at(obj, candidate[len(path):])
+            if numbers is not None and set(numbers) == set(target):
+                return candidate
+        for i, element in enumerate(obj):
+            found = _find_numbers_path(element, target, path + [i])
+            if found:
+                return found
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            found = _find_numbers_path(value, target, path + [key])
+            if found:
+                return found
+    return None
+
+
+class _NumberCellParser(HTMLParser):
+    """HTMLから数字だけを含む要素のテキストを抽出（select/option/script/styleは除外）"""
+
+    SKIP_TAGS = {'select', 'option', 'script', 'style', 'head', 'title'}
+    VOID_TAGS = {'br', 'img', 'input', 'meta', 'link', 'hr', 'wbr', 'source'}
+
+    def __init__(self):
+        super().__init__()
+        self.numbers: List[int] = []
+        self._stack: List[str] = []
+        self._text: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID_TAGS:
+            return
+        self._flush()
+        self._stack.append(tag)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in self._stack:
+            while self._stack and self._stack.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        text = ''.join(self._text).strip()
+        self._text = []
+        if text.isdigit() and len(text) <= 2 and not self.SKIP_TAGS & set(self._stack):
+            self.numbers.append(int(text))
+
+
+def extract_numbers_from_html(html: str) -> List[int]:
+    """HTMLの数字セルを文書順に返す"""
+    parser = _NumberCellParser()
+    parser.feed(html)
+    parser.close()
+    return [n for n in parser.numbers if 1 <= n <= 72]
+
+
+class LearnedRequest:
+    """学習した外部サイトのリクエストと応答の形"""
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    @property
+    def method(self) -> str:
+        return self.data['method']
+
+    def build(self, values: Tuple[str, str, str, str, str]) -> dict:
+        """入力値からhttpxに渡すリクエストを組み立てる"""
+        renderings = _renderings(values)
+        url = self.data['url']
+        query = _render(self.data['query'], renderings)
+        if query:
+            parts = urlsplit(url)
+            url = urlunsplit(parts._replace(query=urlencode(query)))
+        request = {'method': self.method, 'url': url, 'headers': self.data['headers']}
+        body = _render(self.data['body'], renderings)
+        if self.data['body_kind'] == 'json':
+            request['json'] = body
+        elif self.data['body_kind'] == 'form':
+            request['content'] = urlencode(body)
+        return request
+
+    def parse(self, response: httpx.Response) -> List[int]:
+        """
+        応答から数字を取り出す
+
+        Raises:
+            ResponseShapeChanged: 応答の形が学習時と違う（4xx・JSONでない・数字が見つからない）
+            BackendUnavailable: 外部サイトの一時的な障害（5xx・429など）
+        """
+        status = response.status_code
+        if status in TRANSIENT_STATUS_CODES or status >= 500:
+            raise BackendUnavailable(f"Transient status {status}")
+        if status != 200:
+            raise ResponseShapeChanged(f"Unexpected status {status}")
+        if self.data['response_kind'] == 'json':
+            try:
+                numbers = _numbers_at(response.json(), self.data['json_path'])
+            except ValueError:
+                raise ResponseShapeChanged("Response is no longer JSON")
+        else:
+            numbers = extract_numbers_from_html(response.text)
+        if not numbers or not all(1 <= n <= 72 for n in numbers):
+            raise ResponseShapeChanged("Response shape changed")
+        return list(dict.fromkeys(numbers))
+
+
+class LearnedRequestStore:
+    """学習結果をファイルに保存・読み込みする（プロセス内の全スクレイパーで共有）"""
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.SCRAPER_LEARNED_REQUEST_FILE
+        self.learned: Optional[LearnedRequest] = None
+        # 学習に失敗した後、次に学習を試みてよい時刻（time.monotonic()）
+        self.learn_retry_at = 0.0
+        self.lock = asyncio.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('target_url') == settings.TARGET_URL:
+                self.learned = LearnedRequest(data)
+                logger.info(f"Loaded learned request: {data['method']} {data['url']}")
+        except Exception as e:
+            logger.warning(f"Failed to load learned request: {str(e)}")
+
+    def save(self, learned: LearnedRequest):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(learned.data, f, ensure_ascii=False, indent=2)
+        self.learned = learned
+
+    def invalidate(self, reason: str):
+        logger.warning(f"Learned request invalidated: {reason}")
+        self.learned = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RequestReplayBackend(ScrapeBackend):
+    """学習したHTTPリクエストをキープアライブのクライアントで再送するバックエンド"""
+
+    name = 'replay'
+
+    def __init__(self, scraper, store: LearnedRequestStore = None):
+        self.scraper = scraper
+        self.store = store or learned_request_store
+        self.replays = 0
+        self.fallbacks = 0
+
+    async def fetch(self, values, return_raw_text=False):
+        learned = await self._ensure_learned()
+        try:
+            response = await get_http_client().request(**learned.build(values))
+        except httpx.TransportError as e:
+            # 通信エラーは学習結果の問題ではないので、捨てずにブラウザにフォールバックする
+            self.fallbacks += 1
+            raise BackendUnavailable(f"{type(e).__name__}: {str(e)}") from e
+        try:
+            numbers = learned.parse(response)
+        except ResponseShapeChanged as e:
+            self.fallbacks += 1
+            self.store.invalidate(str(e))
+            raise
+        except BackendUnavailable:
+            self.fallbacks += 1
+            raise
+        self.replays += 1
+        return numbers, (response.text if return_raw_text else '')
+
+    async def learn(self) -> LearnedRequest:
+        """
+        ブラウザで一度フォームを送信し、結果を返したリクエストを学習する
+
+        Raises:
+            BackendUnavailable: 結果を含むリクエストが見つからない（ページ内で計算している等）
+        """
+        captured: List[Any] = []
+
+        def on_response(response):
+            if response.request.resource_type in ('xhr', 'fetch', 'document'):
+                captured.append(response)
+
+        renderings = _renderings(LEARN_SAMPLE)
+        # 応答本文を読むため、解析が終わるまでページを保持する
+        async with self.scraper.page_pool.acquire() as page:
+            page.on('response', on_response)
+            try:
+                numbers, _ = await self.scraper._submit_and_extract(page, LEARN_SAMPLE)
+            finally:
+                page.remove_listener('response', on_response)
+            if not numbers:
+                raise BackendUnavailable("Browser scrape returned no numbers while learning")
+
+            for response in captured:
+                learned = await self._describe(response, numbers, renderings)
+                if learned:
+                    self.store.save(learned)
+                    logger.info(f"Learned upstream request: {learned.method} {learned.data['url']}")
+                    return learned
+        raise BackendUnavailable("No upstream request carries the result")
+
+    def stats(self) -> dict:
+        learned = self.store.learned
+        return {
+            'name': self.name,
+            'learned': bool(learned),
+            'learned_request': f"{learned.method} {learned.data['url']}" if learned else None,
+            'replays': self.replays,
+            'fallbacks': self.fallbacks,
+        }
+
+    async def _ensure_learned(self) -> LearnedRequest:
+        """学習済みのリクエストを返す（無ければ学習する。失敗後は一定時間学習し直さない）"""
+        if self.store.learned:
+            return self.store.learned
+        if time.monotonic() < self.store.learn_retry_at:
+            raise BackendUnavailable(f"Learning failed earlier, retrying in {self.store.learn_retry_at - time.monotonic():.0f}s")
+        async with self.store.lock:
+            if self.store.learned:
+                return self.store.learned
+            if time.monotonic() < self.store.learn_retry_at:
+                raise BackendUnavailable("Learning failed earlier")
+            try:
+                return await self.learn()
+            except Exception as e:
+                self.store.learn_retry_at = time.monotonic() + settings.SCRAPER_LEARN_RETRY_SECONDS
+                if isinstance(e, BackendUnavailable):
+                    raise
+                raise BackendUnavailable(f"Learning failed: {type(e).__name__}: {str(e)}") from e
+
+    async def _describe(self, response, numbers: List[int], renderings: Dict[str, str]) -> Optional[LearnedRequest]:
+        """結果を含む応答なら、リクエストをテンプレート化して返す"""
+        request = response.request
+        parts = urlsplit(request.url)
+        query = _templatize_pairs(parse_qsl(parts.query, keep_blank_values=True), renderings)
+        body_kind, body = 'none', None
+        post_data = request.post_data
+        content_type = (request.headers.get('content-type') or '').lower()
+        if post_data:
+            if 'json' in content_type:
+                body_kind, body = 'json', _templatize(json.loads(post_data), renderings)
+            elif 'x-www-form-urlencoded' in content_type:
+                body_kind, body = 'form', _templatize_pairs(parse_qsl(post_data, keep_blank_values=True), renderings)
+            else:
+                return None
+        # 入力値がどこにも含まれないリクエストは結果と無関係
+        if not _contains_placeholder(query) and not _contains_placeholder(body):
+            return None
+
+        try:
+            text = await response.text()
+        except Exception:
+            return None
+        data = {
+            'target_url': settings.TARGET_URL,
+            'method': request.method,
+            'url': urlunsplit(parts._replace(query='')),
+            'query': query,
+            'headers': {k: v for k, v in request.headers.items() if k.lower() in REPLAY_HEADERS},
+            'body_kind': body_kind,
+            'body': body,
+            'learned_at': time.time(),
+        }
+        if 'json' in (response.headers.get('content-type') or ''):
+            path = _find_numbers_path(json.loads(text), numbers)
+            if path is None:
+                return None
+            data.update(response_kind='json', json_path=path)
+        elif set(extract_numbers_from_html(text)) == set(numbers):
+            data.update(response_kind='html', json_path=None)
+        else:
+            return None
+        return LearnedRequest(data)
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """キープアライブで接続を再利用する共有HTTPクライアント"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=settings.SCRAPING_TIMEOUT / 1000,
+            limits=httpx.Limits(
+                max_connections=settings.SCRAPER_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SCRAPER_HTTP_MAX_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """共有HTTPクライアントを閉じる"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# プロセス内で共有する学習結果
+learned_request_store = LearnedRequestStore()
+
+
+def create_backend(name: str, scraper) -> ScrapeBackend:
+    """
+    設定名からバックエンドを作成
+
+    ブラウザはスクレイパーがフォールバック用に持つインスタンス（scraper.browser_backend）を
+    そのまま使う（フォールバックの判定を同一性で行えるようにする）
+    """
+    if name == 'replay':
+        return RequestReplayBackend(scraper)
+    if name == 'local':
+        from backend.local_engine import LocalEngineBackend
+        return LocalEngineBackend(scraper)
+    if name != 'browser':
+        logger.warning(f"Unknown scraper backend '{name}', using browser")
+    return scraper.browser_backend
+
+
+# 学習だけを実行する（python -m backend.scrape_backends）
+async def main():
+    from backend.scraper import DungeonScraper
+    scraper = DungeonScraper()
+    backend = RequestReplayBackend(scraper)
+    try:
+        learned = await backend.learn()
+        print(f"学習したリクエスト: {learned.method} {learned.data['url']}")
+        print(f"応答の形式: {learned.data['response_kind']} {learned.data['json_path'] or ''}")
+    except BackendUnavailable as e:
+        print(f"学習できませんでした: {str(e)}")
+    finally:
+        await close_http_client()
+
+if __name__ == "__main__":
+    asyncio.run(main())
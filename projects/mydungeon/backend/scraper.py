@@ -1,22 +1,164 @@
 import asyncio
-from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeout
-from typing import List
+import time
+from playwright.async_api import Page
+from typing import AsyncIterator, Iterable, List, NamedTuple, Optional, Set, Tuple
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from backend.config import settings
+from backend.page_pool import FormPagePool, form_page_pool
+from backend.result_cache import ScrapeResultCache, scrape_cache
+from backend.key_buckets import TimeBucketTable, key_buckets
+from backend.single_flight import SingleFlight
+from backend.hedging import HedgedExecutor
+from backend.circuit_breaker import CircuitBreaker
+from backend.admission import AdmissionController
+from backend.diagnostics import Capture, Diagnostics, diagnostics as scrape_diagnostics
+from backend.scrape_backends import BackendUnavailable, BrowserBackend, create_backend
+from backend.upstream_standin import RecordingMissing, UpstreamTarget, upstream_target, values_key
+from backend.readiness import ReadinessWaiter, ReadinessTimeout, RESULT_SELECTOR, RESULT_WATCH_SNIPPET
 import logging
-import re
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 入力するセレクトボックス（年・月・日・時・分の順）
+SELECT_SELECTORS = (
+    'fieldset[name="dateFields"] select:nth-of-type(1)',
+    'fieldset[name="dateFields"] select:nth-of-type(2)',
+    'fieldset[name="dateFields"] select:nth-of-type(3)',
+    'fieldset[name="timeFields"] select:nth-of-type(1)',
+    'fieldset[name="timeFields"] select:nth-of-type(2)',
+)
+SUBMIT_SELECTOR = 'button.button'
+
+# 5つのセレクトを順に選択してchangeイベントを発火し、送信まで1回のevaluateで行う
+# 選択肢が動的に生成される場合に備え、各セレクトで選択肢の出現をページ内で待つ
+# 戻り値は選択肢の出現を待ったフレーム数（optionフェーズのシグナルに使う）
+_FILL_AND_SUBMIT_JS = """
+async ({ fields, submit, timeout }) => {
+    const sleep = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+    let waited = 0;
+    for (const [selector, value] of fields) {
+        const deadline = performance.now() + timeout;
+        let select = document.querySelector(selector);
+        while (!select || select.disabled || !Array.from(select.options).some(o => o.value === value)) {
+            if (performance.now() > deadline) throw new Error(`option-timeout: ${selector}=${value}`);
+            await sleep();
+            waited++;
+            select = document.querySelector(selector);
+        }
+        select.value = value;
+        select.dispatchEvent(new Event('input', { bubbles: true }));
+        select.dispatchEvent(new Event('change', { bubbles: true }));
+        await sleep();
+    }
+    %s
+    document.querySelector(submit).click();
+    return waited;
+}
+""" % RESULT_WATCH_SNIPPET
+
+# 結果欄のセルを直接読み取り、数字だけのセルを文書順の配列で返す（記録モードでは結果欄のHTMLも返す）
+# 同じページで再送信したときに結果の変化を判定できるよう、読み取った内容をページに残す
+_EXTRACT_RESULT_JS = """
+({ selector, withText, withHtml }) => {
+    const root = document.querySelector(selector);
+    if (!root) return { found: false, numbers: [], text: '', html: null };
+    const numbers = [];
+    const isNumber = el => /^\\d{1,2}$/.test((el.textContent || '').trim());
+    for (const el of root.querySelectorAll('*')) {
+        // 数字だけを含む要素のうち最も外側のもの（td > span のような入れ子は1回だけ数える）
+        if (isNumber(el) && !(el.parentElement && el.parentElement !== root && isNumber(el.parentElement))) {
+            numbers.push(parseInt(el.textContent.trim(), 10));
+        }
+    }
+    const text = root.innerText;
+    window.__mdLastResult = text;
+    return { found: true, numbers, text: withText ? text : '', html: withHtml ? root.outerHTML : null };
+}
+"""
+
+
+# プロセス内の全スクレイパーで共有する、実行中の取得の合流先
+scrape_flights = SingleFlight()
+
+# プロセス内の全スクレイパーで共有する再試行・ヘッジ（レイテンシの統計とヘッジ予算を共有する）
+scrape_executor = HedgedExecutor()
+
+# 外部サイト向けのサーキットブレーカー（プロセス内で共有）
+upstream_breaker = CircuitBreaker('upstream')
+
+# 外部サイトへの取得の受付制御（プロセス内の全スクレイパーでスロットを共有）
+scrape_admission = AdmissionController()
+
+# 期限切れキャッシュを返した後の裏での更新タスク（参照を保持してGCされないようにする）
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+class BatchItem(NamedTuple):
+    """scrape_manyの1件分の結果（失敗時はnumbersが空でerrorに例外が入る）"""
+    birthdate: str
+    birthtime: str
+    numbers: List[int]
+    raw_text: Optional[str] = None
+    error: Optional[Exception] = None
+
+
+def split_birth_inputs(birthdate: str, birthtime: str) -> Tuple[str, str, str, str, str]:
+    """
+    生年月日と時刻をセレクトボックスの値に分解（先頭ゼロを削除）
+
+    Returns:
+        (年, 月, 日, 時, 分)
+    """
+    year, month, day = birthdate.split('-')
+    hour, minute = birthtime.split(':')
+    return str(int(year)), str(int(month)), str(int(day)), str(int(hour)), str(int(minute))
+
+
 class DungeonScraper:
     """外部サイトからデータを取得するスクレイパー"""
 
-    def __init__(self):
-        self.url = settings.TARGET_URL
+    def __init__(
+        self,
+        page_pool: FormPagePool = None,
+        backend: str = None,
+        cache: ScrapeResultCache = None,
+        key_table: TimeBucketTable = None,
+        executor: HedgedExecutor = None,
+        breaker: CircuitBreaker = None,
+        target: UpstreamTarget = None,
+        admission: AdmissionController = None,
+        diagnostics: Diagnostics = None,
+        flights: SingleFlight = None
+    ):
+        # 接続先（TARGET_URLで記録・再生モードを選ぶ。指定が無ければ初回の取得時に解決する）
+        self._target = target
         self.timeout = settings.SCRAPING_TIMEOUT
+        self.page_pool = page_pool or form_page_pool
+        self.cache = cache or scrape_cache
+        self.key_table = key_table or key_buckets
+        self.executor = executor or scrape_executor
+        self.breaker = breaker or upstream_breaker
+        self.admission = admission or scrape_admission
+        self.diagnostics = diagnostics or scrape_diagnostics
+        self.flights = flights or scrape_flights
+        self.browser_backend = BrowserBackend(self)
+        self.backend = create_backend(backend or settings.SCRAPER_BACKEND, self)
+
+    @property
+    def target(self) -> UpstreamTarget:
+        if self._target is None:
+            self._target = upstream_target()
+        return self._target
+
+    @property
+    def cache_enabled(self) -> bool:
+        """結果キャッシュを使うか（再生モードではSCRAPE_CACHE_IN_REPLAYを有効にした場合だけ使う）"""
+        if not settings.SCRAPE_CACHE_ENABLED:
+            return False
+        return self.target.mode != 'replay' or settings.SCRAPE_CACHE_IN_REPLAY
 
     async def scrape_numbers(self, birthdate: str, birthtime: str, return_raw_text: bool = False):
         """
@@ -30,160 +172,306 @@ class DungeonScraper:
         Returns:
             return_raw_text=False: 取得した数字のリスト
             return_raw_text=True: (取得した数字のリスト, 生のテキスト)のタプル
-        """
-        # 日付と時刻を分解（先頭ゼロを削除）
-        year, month, day = birthdate.split('-')
-        month = str(int(month))  # 先頭ゼロ削除
-        day = str(int(day))  # 先頭ゼロ削除
-        hour, minute = birthtime.split(':')
-        hour = str(int(hour))  # 先頭ゼロ削除
-        minute = str(int(minute))  # 先頭ゼロ削除
-
-        async with async_playwright() as p:
-            # Codespaces環境ではXServerが無いため、常にヘッドレスモードを使用
-            browser = await p.chromium.launch(headless=True)
-            # 日本のタイムゾーンとロケールを設定
-            context = await browser.new_context(
-                timezone_id='Asia/Tokyo',
-                locale='ja-JP'
-            )
-            page = await context.new_page()
-
-            try:
-                logger.info(f"Accessing {self.url}")
-                await page.goto(self.url, timeout=self.timeout)
 
-                # ページの読み込み待機
-                await page.wait_for_selector('fieldset[name="dateFields"]', timeout=self.timeout)
-
-                # 生年月日の入力
-                logger.info(f"Selecting birthdate: {year}/{month}/{day}")
-
-                # 年の選択
-                await page.select_option('fieldset[name="dateFields"] select:nth-of-type(1)', year)
-                await asyncio.sleep(0.5)
+        Raises:
+            CircuitOpenError: 外部サイトの障害でブレーカーが開いていて、返せるキャッシュも無い
+            AdmissionRejected: 混雑していて取得を受け付けられない
+        """
+        values = split_birth_inputs(birthdate, birthtime)
+
+        # 生テキストが必要な場合（精度検証など）はキャッシュを使わず必ず取得する
+        if return_raw_text:
+            return await self._fetch(values, return_raw_text=True)
+
+        use_cache = self.cache_enabled
+        # 同じ結果になる入力（バケット表で判明したもの）は同じキーにまとめる
+        key = self.key_table.canonical_key(birthdate, birthtime)
+        if use_cache:
+            entry = await self.cache.get_entry_async(key)
+            if entry is not None:
+                cached, stale = entry
+                if stale:
+                    # 期限切れの結果をすぐに返し、裏で取り直す（stale-while-revalidate）
+                    logger.info(f"Stale cache hit for {key}, refreshing in background")
+                    self._refresh_in_background(key, values)
+                else:
+                    logger.info(f"Cache hit for {key}: {cached}")
+                return cached
+
+        # 同じ入力の取得が実行中なら合流し、外部サイトへのアクセスを1回にまとめる
+        numbers = await self.flights.do(key, lambda: self._fetch_and_store(key, values, use_cache))
+        return list(numbers)
+
+    async def scrape_many(
+        self,
+        inputs: Iterable[Tuple[str, str]],
+        return_raw_text: bool = False
+    ) -> AsyncIterator[BatchItem]:
+        """
+        複数の生年月日・時刻をまとめて取得し、取得できた順に返す
 
-                # 月の選択
-                await page.select_option('fieldset[name="dateFields"] select:nth-of-type(2)', month)
-                await asyncio.sleep(0.5)
+        キャッシュにある入力はすぐに返し、残りは1つのページでセレクトを入れ替えて
+        再送信する（入力ごとのページ読み込みをしない）。1件の失敗は他の入力に影響せず、
+        その入力のBatchItem.errorに例外が入る。
 
-                # 日の選択
-                await page.select_option('fieldset[name="dateFields"] select:nth-of-type(3)', day)
-                await asyncio.sleep(0.5)
+        Args:
+            inputs: (生年月日 YYYY-MM-DD, 時刻 HH:MM) の列
+            return_raw_text: Trueの場合、キャッシュを使わず結果欄の生テキストも返す
 
-                # 時刻の入力
-                logger.info(f"Selecting birthtime: {hour}:{minute}")
+        Yields:
+            BatchItem（入力の順序は、キャッシュにあったものが先になる）
+        """
+        use_cache = self.cache_enabled and not return_raw_text
+        pending = []
+        for birthdate, birthtime in inputs:
+            try:
+                values = split_birth_inputs(birthdate, birthtime)
+                key = self.key_table.canonical_key(birthdate, birthtime)
+            except ValueError as e:
+                yield BatchItem(birthdate, birthtime, [], error=e)
+                continue
+            cached = await self.cache.get_async(key) if use_cache else None
+            if cached is not None:
+                yield BatchItem(birthdate, birthtime, cached)
+                continue
+            pending.append((birthdate, birthtime, key, values))
+
+        if not pending:
+            return
+
+        # ブラウザ以外のバックエンドは1件ごとのHTTPリクエストなので、そのまま順に取得する
+        if not isinstance(self.backend, BrowserBackend):
+            for birthdate, birthtime, key, values in pending:
+                try:
+                    if return_raw_text:
+                        numbers, raw_text = await self._fetch(values, return_raw_text=True)
+                    else:
+                        numbers, raw_text = await self._fetch_and_store(key, values, use_cache), None
+                    yield BatchItem(birthdate, birthtime, numbers, raw_text)
+                except Exception as e:
+                    yield BatchItem(birthdate, birthtime, [], error=e)
+            return
+
+        async for item in self._scrape_batch_in_browser(pending, return_raw_text, use_cache):
+            yield item
+
+    async def _scrape_batch_in_browser(self, pending: list, return_raw_text: bool, use_cache: bool) -> AsyncIterator[BatchItem]:
+        """
+        1つのページで入力を順に送信して取得（結果ページのフォームをそのまま再利用する）
 
-                # 時の選択
-                await page.select_option('fieldset[name="timeFields"] select:nth-of-type(1)', hour)
-                await asyncio.sleep(0.5)
+        バッチ全体で受付制御のスロットを1つ確保し、1件ごとの送信は_fetchと同じく
+        サーキットブレーカー越しに再試行・ヘッジ付きで実行する（再試行・ヘッジは別のページで行う）。
 
-                # 分の選択
-                await page.select_option('fieldset[name="timeFields"] select:nth-of-type(2)', minute)
-                await asyncio.sleep(0.5)
+        Raises:
+            AdmissionRejected: 混雑していてバッチを受け付けられない
+        """
+        async with self.admission.slot():
+            async with self.page_pool.acquire() as page:
+                # True: 前回の結果が表示されている / None: ページの状態が不明（失敗後）
+                state = {'resubmit': False}
+                for birthdate, birthtime, key, values in pending:
+                    attempt = self._batch_attempt(page, values, return_raw_text, state)
+                    try:
+                        numbers, raw_text = await self.breaker.call(lambda: self.executor.run(attempt))
+                    except Exception as e:
+                        logger.warning(f"Batch item {birthdate} {birthtime} failed: {str(e)}")
+                        yield BatchItem(birthdate, birthtime, [], error=e)
+                        continue
 
-                # スクリーンショット（デバッグ用）
-                if not settings.HEADLESS:
-                    await page.screenshot(path=os.path.join(settings.OUTPUT_DIR, 'before_submit.png'))
+                    if use_cache and numbers:
+                        await self.cache.put_async(key, numbers)
+                    yield BatchItem(birthdate, birthtime, numbers, raw_text if return_raw_text else None)
 
-                # ボタンをクリック
-                logger.info("Clicking submit button")
-                await page.click('button.button')
+    def _batch_attempt(self, page: Page, values: Tuple[str, str, str, str, str], return_raw_text: bool, state: dict):
+        """
+        バッチの1件分の取得関数（executor.runに渡す）
 
-                # 結果の表示を待つ（数秒待機）
-                await asyncio.sleep(3)
+        1回目はバッチのページで送信し、再試行・ヘッジ（2回目以降の呼び出し）は
+        プールの別のページで取得する。バッチのページでの送信が失敗・キャンセルされたら
+        ページの状態を不明として、次の入力の前にフォームを開き直す。
+        """
+        first = True
 
-                # スクリーンショット（結果確認用）
-                if not settings.HEADLESS:
-                    await page.screenshot(path=os.path.join(settings.OUTPUT_DIR, 'after_submit.png'))
+        async def attempt() -> Tuple[List[int], str]:
+            nonlocal first
+            if not first:
+                return await self.browser_backend.fetch(values, return_raw_text)
+            first = False
+            try:
+                # 失敗後や結果ページにフォームが無い場合だけフォームを開き直す
+                resubmit = state['resubmit']
+                if resubmit is None or (resubmit and not await page.query_selector(SELECT_SELECTORS[0])):
+                    await self.page_pool.open_form(page)
+                    resubmit = False
+                result = await self._submit_and_extract(page, values, return_raw_text, resubmit=resubmit)
+            except BaseException:
+                state['resubmit'] = None
+                raise
+            state['resubmit'] = True
+            return result
+
+        return attempt
+
+    async def _fetch_and_store(self, key: str, values: Tuple[str, str, str, str, str], use_cache: bool) -> List[int]:
+        """取得してキャッシュに保存（失敗時は何も保存しない）"""
+        numbers, _ = await self._fetch(values)
+        # 外部サイト以外（ローカル計算など）で求めた結果は出所を付けて保存する
+        source = self.backend.cache_source()
+
+        # 取得できた結果だけを、外部サイトの表示順のまま保存する
+        if use_cache and numbers:
+            await self.cache.put_async(key, numbers, source)
+            # 保存中に出所が信用できなくなった（まとめて消された）場合は、この結果も消す
+            if source and self.backend.cache_source() != source:
+                await asyncio.to_thread(self.cache.invalidate, key)
+        return numbers
+
+    def _refresh_in_background(self, key: str, values: Tuple[str, str, str, str, str]):
+        """期限切れキャッシュの更新（実行中の取得があれば合流。ブレーカーが開いていれば何もしない）"""
+        if not self.breaker.allows_calls():
+            return
+
+        async def refresh():
+            try:
+                await self.flights.do(key, lambda: self._fetch_and_store(key, values, True))
+            except Exception as e:
+                logger.warning(f"Background refresh for {key} failed: {str(e)}")
 
-                # 結果が表示される要素を探す
-                # 動的に生成される可能性が高いので、複数のパターンを試す
-                numbers = []
-                raw_text = ""
+        task = asyncio.create_task(refresh())
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
 
-                # パターン1: テーブル要素を探す
-                try:
-                    await page.wait_for_selector('table', timeout=5000)
-                    # テーブル内の数字を抽出
-                    table_text = await page.inner_text('table')
-                    raw_text = table_text
-                    logger.info(f"Table text found: {table_text[:200]}")
-                    # 数字を抽出（1〜72の範囲）
-                    found_numbers = re.findall(r'\b([1-9]|[1-6][0-9]|7[0-2])\b', table_text)
-                    numbers = [int(n) for n in found_numbers if 1 <= int(n) <= 72]
-                except PlaywrightTimeout:
-                    logger.warning("Table not found, trying other patterns")
-
-                # パターン2: 結果が表示されるdiv要素を探す
-                if not numbers:
-                    try:
-                        await page.wait_for_selector('#app section:not(#data-input)', timeout=5000)
-                        result_section = await page.query_selector('#app section:not(#data-input)')
-                        if result_section:
-                            result_text = await result_section.inner_text()
-                            raw_text = result_text
-                            logger.info(f"Result section found: {result_text[:200]}")
-                            found_numbers = re.findall(r'\b([1-9]|[1-6][0-9]|7[0-2])\b', result_text)
-                            numbers = [int(n) for n in found_numbers if 1 <= int(n) <= 72]
-                    except PlaywrightTimeout:
-                        logger.warning("Result section not found")
-
-                # パターン3: ページ全体のテキストから抽出
-                if not numbers:
-                    logger.info("Trying to extract from full page content")
-                    page_content = await page.content()
-
-                    # HTMLをファイルに保存（デバッグ用）
-                    with open(os.path.join(settings.OUTPUT_DIR, 'page_content.html'), 'w', encoding='utf-8') as f:
-                        f.write(page_content)
-
-                    # テキストコンテンツ全体から数字を抽出
-                    body_text = await page.inner_text('body')
-                    raw_text = body_text
-                    logger.info(f"Body text: {body_text[:500]}")
-
-                    # 1〜72の範囲の数字を抽出
-                    found_numbers = re.findall(r'\b([1-9]|[1-6][0-9]|7[0-2])\b', body_text)
-                    # 重複を除去せず、順番に並べる
-                    numbers = [int(n) for n in found_numbers if 1 <= int(n) <= 72]
-
-                    # 明らかに関係ない数字（年月日など）を除外
-                    # 生年月日と時刻に含まれる数字を除外
-                    exclude_numbers = [int(year), int(month), int(day), int(hour), int(minute)]
-                    numbers = [n for n in numbers if n not in exclude_numbers]
-
-                # 重複を除去（順序は保持）
-                seen = set()
-                unique_numbers = []
-                for n in numbers:
-                    if n not in seen:
-                        seen.add(n)
-                        unique_numbers.append(n)
-
-                numbers = unique_numbers
-
-                logger.info(f"Extracted numbers: {numbers}")
-
-                if not numbers:
-                    logger.error("No numbers found. Check the output directory for screenshots and HTML.")
-
-                if return_raw_text:
-                    return numbers, raw_text
-                else:
-                    return numbers
+    async def _fetch(self, values: Tuple[str, str, str, str, str], return_raw_text: bool = False) -> Tuple[List[int], str]:
+        """
+        外部サイトから取得（受付制御のスロットを確保し、サーキットブレーカー越しに、
+        一時的なエラーの再試行と遅い取得のヘッジ（別のページで並走）を付けて実行）
+        外部サイトにアクセスしないバックエンドはそのまま実行する
+        """
+        if self.backend.in_process:
+            try:
+                return await self.backend.fetch(values, return_raw_text)
+            except BackendUnavailable as e:
+                logger.debug(f"Backend '{self.backend.name}' unavailable ({str(e)}), scraping upstream")
+        async with self.admission.slot():
+            return await self.breaker.call(
+                lambda: self.executor.run(lambda: self._fetch_once(values, return_raw_text))
+            )
 
+    async def _fetch_once(self, values: Tuple[str, str, str, str, str], return_raw_text: bool = False) -> Tuple[List[int], str]:
+        """設定されたバックエンドで取得し、使えない場合はブラウザにフォールバック"""
+        if not self.backend.in_process and self.backend is not self.browser_backend:
+            try:
+                return await self.backend.fetch(values, return_raw_text)
+            except BackendUnavailable as e:
+                logger.warning(f"Backend '{self.backend.name}' unavailable ({str(e)}), falling back to browser")
+        return await self.browser_backend.fetch(values, return_raw_text)
+
+    async def _scrape_in_browser(self, values: Tuple[str, str, str, str, str], return_raw_text: bool = False) -> Tuple[List[int], str]:
+        """ブラウザでフォームを操作して取得"""
+        # フォーム準備済みのページを取得（ページ読み込みはプール側で済んでいる）
+        async with self.page_pool.acquire() as page:
+            try:
+                return await self._submit_and_extract(page, values, return_raw_text)
             except Exception as e:
                 logger.error(f"Scraping error: {str(e)}")
-                # エラー時もスクリーンショットを保存
-                try:
-                    await page.screenshot(path=os.path.join(settings.OUTPUT_DIR, 'error.png'))
-                except:
-                    pass
                 raise
-            finally:
-                await context.close()
-                await browser.close()
+
+    def _check_recorded(self, values: Tuple[str, str, str, str, str]):
+        """再生モードで記録に無い入力は、結果の表示待ちでタイムアウトさせずにすぐ失敗させる"""
+        standin = self.target.standin
+        if self.target.mode == 'replay' and standin and not standin.synthesize and values_key(values) not in standin.store:
+            raise RecordingMissing(f"No recording for {values_key(values)}")
+
+    async def _submit_and_extract(
+        self,
+        page: Page,
+        values: Tuple[str, str, str, str, str],
+        return_raw_text: bool = False,
+        resubmit: bool = False
+    ) -> Tuple[List[int], str]:
+        """
+        フォームを入力・送信し、結果欄から数字を抽出
+
+        Args:
+            resubmit: 前回の結果が表示されたページで再送信する場合にTrue（結果の変化を待つ）
+
+        Returns:
+            (数字のリスト, 結果欄の生テキスト)
+        """
+        self._check_recorded(values)
+        # 診断情報はサンプリング対象と失敗時だけ記録する（書き込みはリクエストの外で行う）
+        capture = self.diagnostics.begin(values=list(values), resubmit=resubmit)
+        try:
+            numbers, text = await self._submit_and_extract_once(page, values, capture, return_raw_text, resubmit)
+        except Exception as e:
+            await capture.fail(page, f"{type(e).__name__}: {str(e)}")
+            capture.finish()
+            raise
+        if not numbers:
+            logger.error(f"No numbers found (diagnostics request id: {capture.request_id})")
+            await capture.fail(page, 'no numbers')
+        capture.finish(numbers=numbers)
+        return numbers, text
+
+    async def _submit_and_extract_once(
+        self,
+        page: Page,
+        values: Tuple[str, str, str, str, str],
+        capture: Capture,
+        return_raw_text: bool,
+        resubmit: bool
+    ) -> Tuple[List[int], str]:
+        year, month, day, hour, minute = values
+        waiter = ReadinessWaiter(page)
+        await capture.snapshot(page, 'before_submit.png')
+
+        # 入力・送信（1回のevaluateで完結）
+        logger.info(f"Submitting birthdate: {year}/{month}/{day}, birthtime: {hour}:{minute}")
+        waiter.track_network()
+        option_start = time.monotonic()
+        try:
+            waited_frames = await page.evaluate(_FILL_AND_SUBMIT_JS, {
+                'fields': [list(field) for field in zip(SELECT_SELECTORS, values)],
+                'submit': SUBMIT_SELECTOR,
+                'timeout': waiter.option_timeout,
+            })
+        except Exception as e:
+            waiter.untrack_network()
+            if 'option-timeout' in str(e):
+                raise ReadinessTimeout('option', waiter.option_timeout) from e
+            raise
+        signal = waiter.option_ready(option_start, waited_frames or 0)
+        logger.info(f"Options ready via {signal.name} after {signal.elapsed_ms:.0f}ms")
+
+        # 結果の表示を待つ（DOM変化またはネットワーク静止）
+        try:
+            signal = await waiter.wait_for_result(changed=resubmit)
+            logger.info(f"Result ready via {signal.name} after {signal.elapsed_ms:.0f}ms")
+        except ReadinessTimeout as e:
+            logger.warning(f"{str(e)}, trying to extract anyway")
+
+        await capture.snapshot(page, 'after_submit.png')
+
+        # 結果欄のセルを構造化して取得
+        result = await page.evaluate(_EXTRACT_RESULT_JS, {
+            'selector': RESULT_SELECTOR,
+            'withText': return_raw_text,
+            'withHtml': self.target.mode == 'record',
+        })
+        if not result['found']:
+            logger.warning("Result section not found")
+
+        numbers = [n for n in result['numbers'] if 1 <= n <= 72]
+
+        # 重複を除去（順序は保持）
+        numbers = list(dict.fromkeys(numbers))
+
+        logger.info(f"Extracted numbers: {numbers}")
+
+        if self.target.mode == 'record' and numbers:
+            self.target.recordings.add(values_key(values), numbers, result['html'])
+
+        return numbers, result['text']
 
 
 # テスト用
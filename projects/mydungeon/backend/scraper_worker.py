@@ -0,0 +1,428 @@
+"""
+スクレイパーワーカー（APIとは別プロセス）
+ブラウザを持つワーカープロセスがUnixソケットでスクレイピング要求を受け付け、
+APIプロセスは薄い非同期クライアントで要求を送る（Chromiumのメモリ・CPUをAPIプロセスから切り離す）
+
+プロトコル: 1行1メッセージのJSON。1つの接続で複数の要求を同時に送れる（応答はidで対応付ける）
+    要求: {"id": 1, "op": "scrape", "birthdate": "1990-01-01", "birthtime": "12:30", "raw": false, "request_id": "..."}
+    応答: {"id": 1, "numbers": [...], "raw_text": null}
+      または {"id": 1, "error": "...", "error_type": "...", "retry_after": null, "queue_depth": null, "queue_position": null}
+
+使い方:
+    python -m backend.scraper_worker --socket /tmp/mydungeon-scraper.sock
+    python -m backend.scraper_worker --socket /tmp/mydungeon-scraper.sock --workers 2
+      （--workers指定時は /tmp/mydungeon-scraper-0.sock, -1.sock ... を開く）
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+import zlib
+from typing import Dict, List, Optional, Set
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.browser_pool import browser_pool
+from backend.page_pool import form_page_pool
+from backend.result_cache import make_key, scrape_cache
+from backend.scrape_backends import close_http_client
+from backend.diagnostics import current_request_id, diagnostics, new_request_id
+from backend.scraper import DungeonScraper, scrape_admission, scrape_executor, scrape_flights, upstream_breaker
+from backend.resource_filter import resource_filter
+from backend.readiness import signal_counts as readiness_signal_counts
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 1メッセージの最大長（raw_textを含む応答に余裕を持たせる）
+MESSAGE_LIMIT = 4 * 1024 * 1024
+
+
+class ScraperWorkerError(Exception):
+    """ワーカー側でスクレイピングが失敗した（error_typeにワーカー側の例外クラス名が入る）"""
+
+    def __init__(
+        self,
+        message: str,
+        error_type: str = None,
+        retry_after: float = None,
+        queue_depth: int = None,
+        queue_position: int = None
+    ):
+        super().__init__(message)
+        self.error_type = error_type
+        # ワーカー側のブレーカーが開いていた・混雑で断られた場合の、再試行までの秒数
+        self.retry_after = retry_after
+        # 混雑で断られた場合の、ワーカー側の待ち列の長さと列の中の順番
+        self.queue_depth = queue_depth
+        self.queue_position = queue_position
+
+
+class ScraperWorkerUnavailable(ScraperWorkerError):
+    """ワーカーに接続できない・応答が返らない"""
+
+
+class ScraperWorker:
+    """Unixソケットでスクレイピング要求を受け付けるワーカー"""
+
+    def __init__(self, socket_path: str, scraper: DungeonScraper = None, max_concurrency: int = None):
+        self.socket_path = socket_path
+        self.scraper = scraper or DungeonScraper()
+        self.max_concurrency = max_concurrency or settings.SCRAPER_WORKER_MAX_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self.requests = 0
+        self.failures = 0
+        self.active = 0
+
+    async def start(self):
+        """ソケットを開いて要求の受け付けを開始"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path, limit=MESSAGE_LIMIT)
+        logger.info(f"Scraper worker listening on {self.socket_path}")
+
+    async def stop(self):
+        """新規接続を止め、処理中の要求が終わるのを待ってから閉じる"""
+        if self._server is None:
+            return
+        self._server.close()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # 応答を返し終えてからクライアントとの接続を閉じる
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        logger.info("Scraper worker stopped")
+
+    def stats(self) -> dict:
+        """ワーカーとスクレイパーの統計"""
+        return {
+            'pid': os.getpid(),
+            'socket': self.socket_path,
+            'requests': self.requests,
+            'failures': self.failures,
+            'active': self.active,
+            'max_concurrency': self.max_concurrency,
+            'browser_pool': browser_pool.stats(),
+            'form_page_pool': form_page_pool.stats(),
+            'resource_filter': resource_filter.stats(),
+            'readiness_signals': dict(readiness_signal_counts),
+            'backend': self.scraper.backend.stats(),
+            'cache': scrape_cache.stats(),
+            'single_flight': scrape_flights.stats(),
+            'resilience': scrape_executor.stats(),
+            'circuit_breaker': upstream_breaker.stats(),
+            'admission': scrape_admission.stats(),
+            'diagnostics': diagnostics.stats(),
+        }
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """1接続分の要求を読み、要求ごとにタスクを起こして応答を書き戻す"""
+        write_lock = asyncio.Lock()
+        self._writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._respond(line, writer, write_lock))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning(f"Worker connection closed: {str(e)}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        message = {}
+        try:
+            message = json.loads(line)
+            response = await self._dispatch(message)
+        except Exception as e:
+            self.failures += 1
+            response = {
+                'error': str(e),
+                'error_type': type(e).__name__,
+                'retry_after': getattr(e, 'retry_after', None),
+                'queue_depth': getattr(e, 'queue_depth', None),
+                'queue_position': getattr(e, 'queue_position', None),
+            }
+        response['id'] = message.get('id')
+        async with write_lock:
+            if writer.is_closing():
+                return
+            writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def _dispatch(self, message: dict) -> dict:
+        op = message.get('op')
+        if op == 'scrape':
+            self.requests += 1
+            # 診断情報をAPI側のリクエストIDで記録する（要求ごとのタスクなので他の要求には影響しない）
+            current_request_id.set(new_request_id(message.get('request_id')))
+            async with self._semaphore:
+                self.active += 1
+                try:
+                    if message.get('raw'):
+                        numbers, raw_text = await self.scraper.scrape_numbers(
+                            message['birthdate'], message['birthtime'], return_raw_text=True
+                        )
+                    else:
+                        numbers, raw_text = await self.scraper.scrape_numbers(message['birthdate'], message['birthtime']), None
+                finally:
+                    self.active -= 1
+            return {'numbers': numbers, 'raw_text': raw_text}
+        if op == 'stats':
+            return {'stats': self.stats()}
+        if op == 'ping':
+            return {'ok': True}
+        raise ValueError(f"Unknown op: {op}")
+
+
+class _WorkerConnection:
+    """1つのワーカーへの常時接続（要求をidで多重化する）"""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def call(self, message: dict, timeout: float) -> dict:
+        await self._connect()
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._lock:
+                if self._writer is None:
+                    raise ConnectionResetError("connection closed")
+                self._writer.write(json.dumps({**message, 'id': request_id}, ensure_ascii=False).encode('utf-8') + b'\n')
+                await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ScraperWorkerUnavailable(f"Worker {self.socket_path} did not respond within {timeout:.0f}s", 'TimeoutError')
+        except ConnectionError as e:
+            self._pending.pop(request_id, None)
+            await self._disconnect(e)
+            raise ScraperWorkerUnavailable(f"Worker {self.socket_path} connection lost: {str(e)}")
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        await self._disconnect(None)
+
+    async def _connect(self):
+        async with self._lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=MESSAGE_LIMIT)
+            except (OSError, ConnectionError) as e:
+                raise ScraperWorkerUnavailable(f"Cannot connect to worker {self.socket_path}: {str(e)}")
+            self._read_task = asyncio.create_task(self._read_loop(self._reader))
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.get(response.get('id'))
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        # 接続が切れたら待機中の要求を全て失敗させる
+        self._fail_pending(error)
+        if self._reader is reader:
+            writer, self._writer, self._reader, self._read_task = self._writer, None, None, None
+            writer.close()
+
+    async def _disconnect(self, error: Optional[BaseException]):
+        writer, task = self._writer, self._read_task
+        self._writer = self._reader = self._read_task = None
+        if writer is not None:
+            writer.close()
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self._fail_pending(error)
+
+    def _fail_pending(self, error: Optional[BaseException]):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ScraperWorkerUnavailable(
+                    f"Worker {self.socket_path} closed the connection" + (f": {str(error)}" if error else "")
+                ))
+
+
+class ScraperWorkerClient:
+    """
+    スクレイパーワーカーへの非同期クライアント（DungeonScraperと同じscrape_numbersを持つ）
+
+    同じ入力は常に同じワーカーに送り（ワーカー内のキャッシュ・合流が効くように）、
+    そのワーカーに接続できない場合は次のワーカーに送る。
+    """
+
+    def __init__(self, socket_paths: List[str] = None, timeout: float = None):
+        paths = socket_paths or settings.SCRAPER_WORKER_SOCKETS
+        if not paths:
+            raise ValueError("No scraper worker sockets configured")
+        self.connections = [_WorkerConnection(path) for path in paths]
+        self.timeout = timeout or settings.SCRAPER_WORKER_TIMEOUT
+        self.failovers = 0
+
+    async def scrape_numbers(self, birthdate: str, birthtime: str, return_raw_text: bool = False):
+        """
+        ワーカーで生年月日と時刻から数字を取得（戻り値はDungeonScraper.scrape_numbersと同じ）
+
+        Raises:
+            ScraperWorkerError: ワーカー側でスクレイピングが失敗した
+            ScraperWorkerUnavailable: どのワーカーにも接続できない
+        """
+        message = {
+            'op': 'scrape', 'birthdate': birthdate, 'birthtime': birthtime, 'raw': return_raw_text,
+            'request_id': current_request_id.get(),
+        }
+        response = await self._call(message, make_key(birthdate, birthtime))
+        if return_raw_text:
+            return response['numbers'], response['raw_text']
+        return response['numbers']
+
+    async def stats(self) -> List[dict]:
+        """各ワーカーの統計（接続できないワーカーはエラー内容）"""
+        async def one(connection: _WorkerConnection) -> dict:
+            try:
+                response = await connection.call({'op': 'stats'}, self.timeout)
+                return response.get('stats') or {'socket': connection.socket_path, 'error': response.get('error')}
+            except ScraperWorkerError as e:
+                return {'socket': connection.socket_path, 'error': str(e)}
+        return list(await asyncio.gather(*[one(c) for c in self.connections]))
+
+    async def close(self):
+        await asyncio.gather(*[c.close() for c in self.connections])
+
+    async def _call(self, message: dict, key: str) -> dict:
+        start = zlib.crc32(key.encode('utf-8')) % len(self.connections)
+        last_error: Optional[ScraperWorkerUnavailable] = None
+        for offset in range(len(self.connections)):
+            connection = self.connections[(start + offset) % len(self.connections)]
+            try:
+                response = await connection.call(message, self.timeout)
+            except ScraperWorkerUnavailable as e:
+                # タイムアウトは送信済みの可能性があるため、他のワーカーに送り直さない
+                if e.error_type == 'TimeoutError':
+                    raise
+                logger.warning(f"{str(e)}, trying next worker")
+                self.failovers += 1
+                last_error = e
+                continue
+            if 'error' in response:
+                raise ScraperWorkerError(
+                    response['error'],
+                    response.get('error_type'),
+                    response.get('retry_after'),
+                    response.get('queue_depth'),
+                    response.get('queue_position')
+                )
+            return response
+        raise last_error
+
+
+def create_scraper():
+    """設定に応じてワーカークライアント（SCRAPER_WORKER_SOCKETS指定時）またはプロセス内のスクレイパーを返す"""
+    if settings.SCRAPER_WORKER_SOCKETS:
+        return ScraperWorkerClient()
+    return DungeonScraper()
+
+
+async def run_worker(socket_path: str):
+    """ブラウザプール・ページプールを立ち上げてワーカーを動かし、SIGTERM/SIGINTで停止する"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await browser_pool.start()
+    await form_page_pool.start()
+    worker = ScraperWorker(socket_path)
+    await worker.start()
+    try:
+        await stop_event.wait()
+    finally:
+        await worker.stop()
+        await form_page_pool.stop()
+        await browser_pool.stop()
+        await close_http_client()
+        await diagnostics.drain()
+        scrape_cache.close()
+
+
+def worker_socket_paths(socket_path: str, workers: int) -> List[str]:
+    """--workers指定時の各ワーカーのソケットパス"""
+    if workers <= 1:
+        return [socket_path]
+    base, ext = os.path.splitext(socket_path)
+    return [f"{base}-{i}{ext}" for i in range(workers)]
+
+
+def _run_worker_process(socket_path: str):
+    asyncio.run(run_worker(socket_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スクレイパーワーカーを起動")
+    parser.add_argument('--socket', default=settings.SCRAPER_WORKER_SOCKET_PATH)
+    parser.add_argument('--workers', type=int, default=1, help="起動するワーカープロセス数")
+    args = parser.parse_args()
+
+    paths = worker_socket_paths(args.socket, args.workers)
+    if len(paths) == 1:
+        _run_worker_process(paths[0])
+        return
+
+    # ワーカーごとに別プロセス（ブラウザ・キャッシュ接続はプロセスごとに持つ）
+    processes = [multiprocessing.Process(target=_run_worker_process, args=(path,), name=f"scraper-worker-{i}")
+                 for i, path in enumerate(paths)]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} scraper workers: {paths}")
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+同一キーの処理の合流（single-flight）
+同じキーで同時に呼ばれた処理は1回だけ実行し、全ての呼び出し元が同じ結果（または例外）を受け取る
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """キーごとに実行中の処理を1つに合流させる"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        キーに対する処理を実行（実行中なら合流して結果を待つ）
+
+        処理は独立したタスクとして実行するため、最初の呼び出し元がキャンセルされても
+        他の待機者には影響しない。例外は全ての待機者に伝わる。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight request for {key}")
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """実行中のキー数"""
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._inflight),
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+        }
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 待機者が全員キャンセルされた場合に未取得例外の警告を出さない
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,346 @@
+"""
+外部サイトのローカル代替サーバーと記録・再生モード
+外部サイトと同じ構造のフォームを返し、記録した結果欄のHTMLで応答する（標準ライブラリのHTTPサーバー）
+TARGET_URLでモードを切り替える
+- https://...          : 外部サイトにアクセスする（従来どおり）
+- record+https://...   : 外部サイトにアクセスし、取得した結果欄を記録ファイルに追記する
+- replay:[記録ファイル] : 記録ファイルを読み込んだ代替サーバーをプロセス内で起動し、そこにアクセスする
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.result_cache import make_key
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RECORD_PREFIX = 'record+'
+REPLAY_PREFIX = 'replay:'
+
+# フォームのページ（スクレイパーが操作するfieldset・select・button.buttonの構造を外部サイトに合わせる）
+# 日の選択肢は年・月の選択後に生成し、結果はfetchで取得して#resultに差し込む
+FORM_PAGE = """<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>mydungeon upstream stand-in</title></head>
+<body>
+<div id="app">
+  <section id="data-input">
+    <form onsubmit="return false">
+      <fieldset name="dateFields">
+        <select name="year"></select><select name="month"></select><select name="day" disabled></select>
+      </fieldset>
+      <fieldset name="timeFields">
+        <select name="hour"></select><select name="minute"></select>
+      </fieldset>
+      <button class="button" type="button">診断する</button>
+    </form>
+  </section>
+  <div id="result"></div>
+</div>
+<script>
+const field = name => document.querySelector(`select[name="${name}"]`);
+const fill = (select, from, to) => {
+    select.innerHTML = '';
+    for (let v = from; v <= to; v++) select.add(new Option(String(v), String(v)));
+};
+const fillDays = () => {
+    const days = new Date(+field('year').value, +field('month').value, 0).getDate();
+    fill(field('day'), 1, days);
+    field('day').disabled = false;
+};
+fill(field('year'), 1900, 2100);
+fill(field('month'), 1, 12);
+fill(field('hour'), 0, 23);
+fill(field('minute'), 0, 59);
+field('year').addEventListener('change', fillDays);
+field('month').addEventListener('change', fillDays);
+setTimeout(fillDays, 0);
+document.querySelector('button.button').addEventListener('click', async () => {
+    const body = {};
+    for (const name of ['year', 'month', 'day', 'hour', 'minute']) body[name] = field(name).value;
+    const response = await fetch('api/result', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+    });
+    const data = await response.json();
+    document.getElementById('result').innerHTML = response.ok ? data.html : '<p class="error">' + data.error + '</p>';
+});
+</script>
+</body>
+</html>
+"""
+
+
+class RecordingMissing(LookupError):
+    """再生モードで、記録に無い入力が要求された"""
+
+
+def render_result(numbers: List[int]) -> str:
+    """記録にHTMLが無い場合の結果欄（1行1セルの表）"""
+    rows = ''.join(f"<tr><td><span>{n}</span></td></tr>" for n in numbers)
+    return f'<table class="result"><tbody>{rows}</tbody></table>'
+
+
+def synthesize_numbers(key: str) -> List[int]:
+    """キーから決まる疑似的な結果（記録が無い入力でもベンチマークを回せるように）"""
+    rng = random.Random(key)
+    return sorted(rng.sample(range(1, 73), rng.randint(8, 14)))
+
+
+def values_key(values: Tuple[str, str, str, str, str]) -> str:
+    """(年, 月, 日, 時, 分)から記録のキーを作る"""
+    year, month, day, hour, minute = values
+    return make_key(f"{year}-{month}-{day}", f"{hour}:{minute}")
+
+
+class RecordingStore:
+    """記録した結果（1行1件のJSON。同じキーは後の行が優先）"""
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.UPSTREAM_RECORDINGS_FILE
+        self._records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._records
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self._records[record['key']] = record
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Skipping broken recording line: {str(e)}")
+        logger.info(f"Loaded {len(self._records)} recordings from {self.path}")
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._records.get(key)
+
+    def keys(self) -> List[str]:
+        return list(self._records)
+
+    def add(self, key: str, numbers: List[int], html: str = None):
+        """結果を記録してファイルに追記"""
+        record = {'key': key, 'numbers': numbers, 'html': html, 'recorded_at': time.time()}
+        with self._lock:
+            self._records[key] = record
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class _StandinHandler(BaseHTTPRequestHandler):
+    server: "_StandinHTTPServer"
+
+    def do_GET(self):
+        if self.path.split('?')[0] in ('/', '/index.html'):
+            self._send(200, FORM_PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/api/result':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            key = values_key(tuple(str(body[name]) for name in ('year', 'month', 'day', 'hour', 'minute')))
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': f"bad request: {str(e)}"})
+            return
+        status, payload = self.server.standin.respond(key)
+        self._send_json(status, payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: dict):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json')
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _StandinHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    standin: "UpstreamStandin"
+
+
+class UpstreamStandin:
+    """記録した応答を返す外部サイトの代替サーバー（別スレッドで動く）"""
+
+    def __init__(
+        self,
+        store: RecordingStore = None,
+        host: str = '127.0.0.1',
+        port: int = None,
+        latency_ms: float = None,
+        synthesize: bool = None
+    ):
+        self.store = store if store is not None else RecordingStore()
+        self.host = host
+        self.port = port if port is not None else settings.UPSTREAM_STANDIN_PORT
+        # 結果の応答を遅らせる時間（外部サイトの処理時間の再現用）
+        self.latency_ms = latency_ms if latency_ms is not None else settings.UPSTREAM_STANDIN_LATENCY_MS
+        # 記録に無い入力にキーから決まる疑似的な結果を返すか（Falseなら404）
+        self.synthesize = synthesize if synthesize is not None else settings.UPSTREAM_STANDIN_SYNTHESIZE
+        self._server: Optional[_StandinHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.synthesized = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    def start(self) -> str:
+        """待ち受けを開始してURLを返す（port=0なら空いているポートを使う）"""
+        if self._server is not None:
+            return self.url
+        self._server = _StandinHTTPServer((self.host, self.port), _StandinHandler)
+        self._server.standin = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='upstream-standin', daemon=True)
+        self._thread.start()
+        logger.info(f"Upstream stand-in serving {len(self.store)} recordings at {self.url}")
+        return self.url
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+    def respond(self, key: str) -> Tuple[int, dict]:
+        """結果のリクエストへの (ステータス, 応答JSON)"""
+        self.requests += 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        record = self.store.get(key)
+        if record is not None:
+            self.hits += 1
+            return 200, {'numbers': record['numbers'], 'html': record.get('html') or render_result(record['numbers'])}
+        self.misses += 1
+        if self.synthesize:
+            self.synthesized += 1
+            numbers = synthesize_numbers(key)
+            return 200, {'numbers': numbers, 'html': render_result(numbers)}
+        return 404, {'error': f"記録がありません: {key}"}
+
+    def stats(self) -> dict:
+        return {
+            'url': self.url,
+            'recordings': len(self.store),
+            'requests': self.requests,
+            'hits': self.hits,
+            'misses': self.misses,
+            'synthesized': self.synthesized,
+        }
+
+
+class UpstreamTarget(NamedTuple):
+    """TARGET_URLを解釈した結果"""
+    mode: str  # live / record / replay
+    url: str  # ブラウザで開くURL
+    recordings: Optional[RecordingStore] = None
+    standin: Optional[UpstreamStandin] = None
+
+
+def parse_target_url(target_url: str) -> Tuple[str, str]:
+    """TARGET_URLを (モード, URLまたは記録ファイルのパス) に分ける"""
+    if target_url.startswith(RECORD_PREFIX):
+        return 'record', target_url[len(RECORD_PREFIX):]
+    if target_url.startswith(REPLAY_PREFIX):
+        return 'replay', target_url[len(REPLAY_PREFIX):] or settings.UPSTREAM_RECORDINGS_FILE
+    return 'live', target_url
+
+
+_target: Optional[UpstreamTarget] = None
+_target_lock = threading.Lock()
+
+
+def upstream_target() -> UpstreamTarget:
+    """
+    プロセス内で共有する接続先（初回に解釈し、再生モードなら代替サーバーを起動する）
+
+    再生モードで代替サーバーのポートが使用中の場合は、同じポートで動いている
+    別プロセス（スクレイパーワーカーなど）の代替サーバーを使う。
+    """
+    global _target
+    with _target_lock:
+        if _target is None:
+            mode, location = parse_target_url(settings.TARGET_URL)
+            if mode == 'record':
+                _target = UpstreamTarget(mode, location, recordings=RecordingStore())
+            elif mode == 'replay':
+                standin = UpstreamStandin(RecordingStore(location))
+                try:
+                    standin.start()
+                except OSError as e:
+                    logger.warning(f"Stand-in port {standin.port} unavailable ({str(e)}), using the running one")
+                    standin = None
+                url = standin.url if standin else f"http://127.0.0.1:{settings.UPSTREAM_STANDIN_PORT}/"
+                _target = UpstreamTarget(mode, url, recordings=standin.store if standin else None, standin=standin)
+            else:
+                _target = UpstreamTarget(mode, location)
+        return _target
+
+
+# 代替サーバーを単体で起動する（python -m backend.upstream_standin）
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='外部サイトの代替サーバー（記録した結果で応答する）')
+    parser.add_argument('--recordings', default=settings.UPSTREAM_RECORDINGS_FILE, help='記録ファイル（JSON Lines）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=settings.UPSTREAM_STANDIN_PORT)
+    parser.add_argument('--latency-ms', type=float, default=settings.UPSTREAM_STANDIN_LATENCY_MS,
+                        help='結果の応答を遅らせる時間（ミリ秒）')
+    parser.add_argument('--synthesize', action='store_true', help='記録に無い入力にも疑似的な結果を返す')
+    args = parser.parse_args()
+
+    standin = UpstreamStandin(
+        RecordingStore(args.recordings), host=args.host, port=args.port,
+        latency_ms=args.latency_ms, synthesize=args.synthesize or None
+    )
+    print(f"代替サーバー: {standin.start()} （TARGET_URLに指定してください。Ctrl+Cで終了）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"統計: {standin.stats()}")
+        standin.stop()
+
+if __name__ == "__main__":
+    main()
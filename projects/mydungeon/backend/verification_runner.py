@@ -0,0 +1,169 @@
+"""
+検証ハーネス用の並列ランナー
+生年月日・時刻の入力ごとの検証を並列数を抑えて同時に実行し、
+ケースごとのレイテンシのパーセンタイルと不一致をJSONレポートにまとめる
+"""
+import asyncio
+import json
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable, List, NamedTuple, Optional, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import settings
+from backend.browser_pool import browser_pool
+from backend.page_pool import form_page_pool
+from backend.scrape_backends import close_http_client
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# レポートに載せるパーセンタイル
+REPORT_PERCENTILES = (50, 90, 95, 99)
+
+# 1ケースの検証。一致すればNone、不一致なら内容の説明を返す（例外はエラーとして記録）
+CaseCheck = Callable[[str, str], Awaitable[Optional[str]]]
+
+
+class CaseResult(NamedTuple):
+    """1ケースの検証結果"""
+    index: int
+    birthdate: str
+    birthtime: str
+    passed: bool
+    latency: float  # 秒
+    mismatch: Optional[str] = None
+    error: Optional[str] = None
+
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    """昇順のリストのpパーセンタイル（最近傍法）。空ならNone"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class ConcurrentRunner:
+    """ケースを最大concurrency件ずつ同時に検証する"""
+
+    def __init__(self, concurrency: int = None, progress_every: int = None):
+        self.concurrency = max(1, concurrency or settings.VERIFY_CONCURRENCY)
+        self.progress_every = progress_every or 10
+
+    async def run(
+        self,
+        inputs: Iterable[Tuple[str, str]],
+        check: CaseCheck,
+        on_result: Callable[[CaseResult, int], None] = None
+    ) -> Tuple[List[CaseResult], float]:
+        """
+        全ケースを検証する
+
+        Args:
+            inputs: (生年月日 YYYY-MM-DD, 時刻 HH:MM) の列
+            check: 1ケースの検証
+            on_result: 1ケース終わるごとに (結果, 完了件数) で呼ばれる
+
+        Returns:
+            (入力順の結果リスト, 全体の経過秒数)
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for case in enumerate(inputs):
+            queue.put_nowait(case)
+        results: List[Optional[CaseResult]] = [None] * queue.qsize()
+        done = 0
+
+        async def worker():
+            nonlocal done
+            while True:
+                try:
+                    index, (birthdate, birthtime) = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self._run_case(index, birthdate, birthtime, check)
+                results[index] = result
+                done += 1
+                if on_result:
+                    on_result(result, done)
+
+        start = time.monotonic()
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, len(results)) or 1)])
+        return results, time.monotonic() - start
+
+    async def _run_case(self, index: int, birthdate: str, birthtime: str, check: CaseCheck) -> CaseResult:
+        start = time.monotonic()
+        try:
+            mismatch = await check(birthdate, birthtime)
+        except Exception as e:
+            return CaseResult(index, birthdate, birthtime, False, time.monotonic() - start,
+                              error=f"{type(e).__name__}: {str(e)}")
+        return CaseResult(index, birthdate, birthtime, mismatch is None, time.monotonic() - start, mismatch=mismatch)
+
+
+@asynccontextmanager
+async def shared_browser(concurrency: int):
+    """
+    検証中はブラウザプールとフォーム準備済みページプールを共有する
+
+    ケースごとにブラウザを起動せず、並列数分のフォームを開いたページを使い回す。
+    """
+    if form_page_pool.size < concurrency:
+        form_page_pool.size = concurrency
+    await browser_pool.start()
+    await form_page_pool.start()
+    try:
+        yield
+    finally:
+        await form_page_pool.stop()
+        await browser_pool.stop()
+        await close_http_client()
+
+
+def build_report(name: str, results: List[CaseResult], elapsed: float, concurrency: int) -> dict:
+    """検証結果のレポート（レイテンシはミリ秒）"""
+    latencies = sorted(r.latency for r in results)
+    latency_ms = {
+        f"p{p}": round(percentile(latencies, p) * 1000, 1) if latencies else None for p in REPORT_PERCENTILES
+    }
+    latency_ms['max'] = round(latencies[-1] * 1000, 1) if latencies else None
+    latency_ms['mean'] = round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None
+    passed = sum(1 for r in results if r.passed)
+    return {
+        'name': name,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'target_url': settings.TARGET_URL,
+        'concurrency': concurrency,
+        'total': len(results),
+        'passed': passed,
+        'failed': len(results) - passed,
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_per_second': round(len(results) / elapsed, 2) if elapsed > 0 else None,
+        'latency_ms': latency_ms,
+        'mismatches': [
+            {'birthdate': r.birthdate, 'birthtime': r.birthtime, 'detail': r.mismatch}
+            for r in results if r.mismatch is not None
+        ],
+        'errors': [
+            {'birthdate': r.birthdate, 'birthtime': r.birthtime, 'error': r.error}
+            for r in results if r.error is not None
+        ],
+        'cases': [
+            {'birthdate': r.birthdate, 'birthtime': r.birthtime, 'passed': r.passed, 'latency_ms': round(r.latency * 1000, 1)}
+            for r in results
+        ],
+    }
+
+
+def default_report_path(name: str) -> str:
+    return os.path.join(settings.OUTPUT_DIR, f"{name}_report.json")
+
+
+def write_report(report: dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"Report written to {path}")
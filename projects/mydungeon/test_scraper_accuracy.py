@@ -3,26 +3,38 @@
 Webサイトから取得した生のテキストと、スクレイパーが抽出した数字が完全一致するかを検証
 
 100パターンのランダムな生年月日・時刻でテストを実行
+（並列数を抑えて同時に実行し、ケースごとのレイテンシと不一致をJSONレポートに出力）
+
+  python test_scraper_accuracy.py 1000 --concurrency 8 --report output/accuracy.json
+
+外部サイトにアクセスせずに実行する場合（同じシードなら同じ入力になる）
+  記録: TARGET_URL=record+https://dungeon.humanjp.com/ python test_scraper_accuracy.py 100 42
+  再生: TARGET_URL=replay: python test_scraper_accuracy.py 100 42
 """
+import argparse
 import asyncio
 import sys
 import os
 import random
-import re
 from datetime import datetime, timedelta
-from typing import List, Tuple, Set
+from typing import List, Optional, Set, Tuple
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from backend.scraper import DungeonScraper
+from backend.verification_runner import (
+    CaseResult, ConcurrentRunner, build_report, default_report_path, shared_browser, write_report
+)
 
 
 class ScraperAccuracyTester:
     """スクレイパー精度テストクラス"""
 
-    def __init__(self, num_tests: int = 100):
+    def __init__(self, num_tests: int = 100, concurrency: int = None, report_path: str = None):
         self.num_tests = num_tests
         self.scraper = DungeonScraper()
+        self.runner = ConcurrentRunner(concurrency)
+        self.report_path = report_path or default_report_path('scraper_accuracy')
         self.passed = 0
         self.failed = 0
         self.errors = []
@@ -77,67 +89,65 @@ class ScraperAccuracyTester:
 
         return numbers
 
-    async def test_single_pattern(self, test_num: int, birthdate: str, birthtime: str) -> bool:
+    async def check_case(self, birthdate: str, birthtime: str) -> Optional[str]:
         """
-        単一パターンのテスト実行
+        単一パターンの検証（スクレイパーで数字と生テキストを取得して比較）
 
-        Args:
-            test_num: テスト番号
-            birthdate: 生年月日 (YYYY-MM-DD)
-            birthtime: 時刻 (HH:MM)
+        Returns:
+            一致すればNone、不一致なら差分の説明
+        """
+        scraped_numbers, raw_text = await self.scraper.scrape_numbers(
+            birthdate, birthtime, return_raw_text=True
+        )
+        return self.compare(birthdate, birthtime, scraped_numbers, raw_text)
+
+    def compare(self, birthdate: str, birthtime: str, scraped_numbers: List[int], raw_text: str) -> Optional[str]:
+        """
+        スクレイパーの抽出結果と生テキストを比較
 
         Returns:
-            bool: テスト成功ならTrue
+            一致すればNone、不一致なら差分の説明
         """
-        try:
-            print(f"\n[テスト {test_num}/{self.num_tests}] {birthdate} {birthtime}")
-
-            # Step 1: スクレイパーで数字と生テキストを取得
-            scraped_numbers, raw_text = await self.scraper.scrape_numbers(
-                birthdate, birthtime, return_raw_text=True
-            )
-            scraped_set = set(scraped_numbers)
-
-            # Step 2: 生テキストから手動で数字を抽出
-            expected_numbers = self.extract_numbers_from_raw_text(raw_text)
-
-            print(f"  生テキストから抽出: {sorted(expected_numbers)}")
-            print(f"  スクレイパー抽出: {sorted(scraped_set)}")
-
-            # Step 3: 比較
-            if scraped_set == expected_numbers:
-                print(f"  ✅ 一致: {len(scraped_set)}個の数字が完全一致")
-                return True
-            else:
-                # 詳細な差分を表示
-                missing = expected_numbers - scraped_set
-                extra = scraped_set - expected_numbers
-
-                error_msg = f"❌ 不一致: {birthdate} {birthtime}\n"
-                error_msg += f"   期待値: {sorted(expected_numbers)}\n"
-                error_msg += f"   実際値: {sorted(scraped_set)}\n"
-
-                if missing:
-                    error_msg += f"   欠落している数字: {sorted(missing)}\n"
-                if extra:
-                    error_msg += f"   余分な数字: {sorted(extra)}\n"
-
-                error_msg += f"\n   生テキスト（最初の500文字）:\n{raw_text[:500]}\n"
-
-                print(error_msg)
-                self.errors.append(error_msg)
-                return False
-
-        except Exception as e:
-            error_msg = f"❌ エラー発生: {birthdate} {birthtime}\n   {str(e)}"
+        scraped_set = set(scraped_numbers)
+
+        # 生テキストから手動で数字を抽出
+        expected_numbers = self.extract_numbers_from_raw_text(raw_text)
+        if scraped_set == expected_numbers:
+            return None
+
+        # 詳細な差分
+        missing = expected_numbers - scraped_set
+        extra = scraped_set - expected_numbers
+
+        error_msg = f"❌ 不一致: {birthdate} {birthtime}\n"
+        error_msg += f"   期待値: {sorted(expected_numbers)}\n"
+        error_msg += f"   実際値: {sorted(scraped_set)}\n"
+
+        if missing:
+            error_msg += f"   欠落している数字: {sorted(missing)}\n"
+        if extra:
+            error_msg += f"   余分な数字: {sorted(extra)}\n"
+
+        error_msg += f"\n   生テキスト（最初の500文字）:\n{raw_text[:500]}\n"
+        return error_msg
+
+    def on_result(self, result: CaseResult, done: int):
+        """1ケース終わるごとに失敗を表示し、10件ごとに進捗を表示"""
+        if result.passed:
+            self.passed += 1
+        else:
+            self.failed += 1
+            error_msg = result.mismatch or f"❌ エラー発生: {result.birthdate} {result.birthtime}\n   {result.error}"
             print(error_msg)
             self.errors.append(error_msg)
-            return False
+
+        if done % 10 == 0:
+            print(f"--- 進捗: {done}/{self.num_tests} 完了 (成功: {self.passed}, 失敗: {self.failed}) ---")
 
     async def run_all_tests(self):
-        """全テストを実行"""
+        """全テストを並列に実行し、レポートを出力"""
         print("=" * 80)
-        print(f"スクレイパー精度テスト開始: {self.num_tests}パターン")
+        print(f"スクレイパー精度テスト開始: {self.num_tests}パターン (並列数: {self.runner.concurrency})")
         print("=" * 80)
         print("\n【テスト内容】")
         print("- Webサイトの生テキストから手動で数字を抽出")
@@ -145,31 +155,18 @@ class ScraperAccuracyTester:
         print("- 完全一致するかを検証")
         print("=" * 80)
 
-        start_time = datetime.now()
-
-        for i in range(1, self.num_tests + 1):
-            # ランダムな生年月日・時刻を生成
-            birthdate, birthtime = self.generate_random_datetime()
-
-            # テスト実行
-            success = await self.test_single_pattern(i, birthdate, birthtime)
-
-            if success:
-                self.passed += 1
-            else:
-                self.failed += 1
-
-            # 10件ごとに進捗表示
-            if i % 10 == 0:
-                print(f"\n--- 進捗: {i}/{self.num_tests} 完了 (成功: {self.passed}, 失敗: {self.failed}) ---")
+        # ランダムな生年月日・時刻を生成し、共有のブラウザ・フォーム準備済みページで同時に取得
+        inputs = [self.generate_random_datetime() for _ in range(self.num_tests)]
+        async with shared_browser(self.runner.concurrency):
+            results, elapsed_time = await self.runner.run(inputs, self.check_case, self.on_result)
 
-        end_time = datetime.now()
-        elapsed_time = (end_time - start_time).total_seconds()
+        report = build_report('scraper_accuracy', results, elapsed_time, self.runner.concurrency)
+        write_report(report, self.report_path)
 
         # 結果サマリー
-        self.print_summary(elapsed_time)
+        self.print_summary(elapsed_time, report)
 
-    def print_summary(self, elapsed_time: float):
+    def print_summary(self, elapsed_time: float, report: dict):
         """テスト結果のサマリーを表示"""
         print("\n" + "=" * 80)
         print("テスト結果サマリー")
@@ -177,7 +174,10 @@ class ScraperAccuracyTester:
         print(f"総テスト数: {self.num_tests}")
         print(f"成功: {self.passed} ({self.passed/self.num_tests*100:.1f}%)")
         print(f"失敗: {self.failed} ({self.failed/self.num_tests*100:.1f}%)")
-        print(f"実行時間: {elapsed_time:.1f}秒 (平均: {elapsed_time/self.num_tests:.2f}秒/件)")
+        print(f"実行時間: {elapsed_time:.1f}秒 (スループット: {report['throughput_per_second']}件/秒)")
+        latency = report['latency_ms']
+        print(f"レイテンシ: p50 {latency['p50']}ms / p95 {latency['p95']}ms / p99 {latency['p99']}ms / 最大 {latency['max']}ms")
+        print(f"レポート: {self.report_path}")
 
         if self.failed > 0:
             print("\n" + "=" * 80)
@@ -198,19 +198,19 @@ class ScraperAccuracyTester:
 
 async def main():
     """メイン関数"""
-    # テスト件数を指定（デフォルト: 100）
-    num_tests = 100
+    parser = argparse.ArgumentParser(description='スクレイパー精度テスト')
+    parser.add_argument('num_tests', nargs='?', type=int, default=100, help='テスト件数（デフォルト: 100）')
+    parser.add_argument('seed', nargs='?', type=int, help='乱数のシード（記録・再生で同じ入力を使う）')
+    parser.add_argument('--concurrency', type=int, default=None, help='同時に実行する件数（デフォルト: VERIFY_CONCURRENCY）')
+    parser.add_argument('--report', default=None, help='JSONレポートの出力先')
+    args = parser.parse_args()
 
-    # コマンドライン引数でテスト数を変更可能
-    if len(sys.argv) > 1:
-        try:
-            num_tests = int(sys.argv[1])
-            print(f"テスト数を{num_tests}件に設定しました")
-        except ValueError:
-            print(f"警告: 無効な引数 '{sys.argv[1]}'。デフォルトの100件でテストを実行します。")
+    if args.seed is not None:
+        random.seed(args.seed)
+        print(f"乱数のシードを{args.seed}に固定しました")
 
     # テスト実行
-    tester = ScraperAccuracyTester(num_tests=num_tests)
+    tester = ScraperAccuracyTester(num_tests=args.num_tests, concurrency=args.concurrency, report_path=args.report)
     await tester.run_all_tests()
 
 
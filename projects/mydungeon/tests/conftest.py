@@ -0,0 +1,39 @@
+import pytest
+import sys
+import os
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeFormPage:
+    """フォームの有無だけを持つページ"""
+
+    def __init__(self):
+        self.has_form = True
+
+    async def query_selector(self, selector):
+        return object() if self.has_form else None
+
+
+class FakePagePool:
+    """ブラウザを使わないページプール（払い出し・フォームの開き直しを記録する）"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.opened = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.acquired += 1
+        yield FakeFormPage()
+
+    async def open_form(self, page):
+        self.opened += 1
+        page.has_form = True
+
+
+@pytest.fixture
+def fake_page_pool():
+    """ブラウザを使わないページプール"""
+    return FakePagePool()
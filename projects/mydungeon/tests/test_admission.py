@@ -0,0 +1,102 @@
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController:
+    """取得の受付制御のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_slots_and_fifo(self):
+        """同時実行がスロット数を超えず、待った要求は並んだ順に実行されるか"""
+        admission = AdmissionController(slots=2, queue_limit=10, queue_timeout=5)
+        running = 0
+        peak = 0
+        order = []
+
+        async def job(i):
+            nonlocal running, peak
+            async with admission.slot():
+                running += 1
+                peak = max(peak, running)
+                order.append(i)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[job(i) for i in range(6)])
+        assert peak == 2
+        assert order == list(range(6))
+        assert admission.in_use == 0
+        assert admission.stats()['queued'] == 4
+
+    @pytest.mark.asyncio
+    async def test_shed_when_queue_full(self):
+        """待ち列が一杯なら並ばずにRetry-After付きで断るか"""
+        admission = AdmissionController(slots=1, queue_limit=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert admission.queue_depth == 1
+
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with admission.slot():
+                pass
+        assert excinfo.value.reason == 'queue full'
+        assert excinfo.value.retry_after >= 1
+        assert excinfo.value.queue_depth == 1
+        assert excinfo.value.queue_position == 2
+        assert len(admission.stats()['queue_wait_seconds']) == 1
+
+        release.set()
+        await asyncio.gather(*holders)
+        assert admission.in_use == 0 and admission.rejected_full == 1
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_and_cancel(self):
+        """待ち時間の上限で断られ、キャンセルされた要求がスロットを失わせないか"""
+        admission = AdmissionController(slots=1, queue_limit=5, queue_timeout=0.02)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with admission.slot():
+                pass
+        assert excinfo.value.reason == 'queue timeout'
+        assert excinfo.value.queue_position == 1
+
+        admission.queue_timeout = 5
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert admission.queue_depth == 0
+
+        release.set()
+        await holder
+        assert admission.in_use == 0
+        async with admission.slot():
+            assert admission.in_use == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """スロット数0なら制限しないか"""
+        admission = AdmissionController(slots=0, queue_limit=0, queue_timeout=0)
+        async with admission.slot():
+            async with admission.slot():
+                pass
+        assert admission.admitted == 0
@@ -0,0 +1,141 @@
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.browser_pool import BrowserPool, PooledBrowser, process_tree_rss
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+
+
+class FakePage:
+    def __init__(self, browser):
+        self.context = FakeContext(browser)
+
+
+@pytest.fixture
+def pool():
+    """Chromiumを起動しない（偽のブラウザを使う）起動済みプール"""
+    pool = BrowserPool(size=1)
+
+    async def fake_launch():
+        return PooledBrowser(FakeBrowser(), marker=None)
+
+    pool._launch = fake_launch
+    pool._browsers = [PooledBrowser(FakeBrowser())]
+    pool._started = True
+    pool.max_pages = 3
+    return pool
+
+
+class TestBrowserRecycling:
+    """ブラウザの入れ替えのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_recycle_after_max_pages(self, pool):
+        """使用回数の上限で代わりのブラウザが起動し、古いブラウザが閉じられるか"""
+        old = pool._browsers[0]
+        notified = []
+        pool.retire_listeners.append(lambda: notified.append(1))
+        page = FakePage(old.browser)
+
+        for _ in range(3):
+            pool.record_page_use(page)
+        await asyncio.gather(*pool._drain_tasks)
+
+        assert pool.recycles == 1
+        assert pool.recycle_reasons == {'pages': 1}
+        assert notified == [1]
+        assert old.browser.closed
+        assert len(pool._browsers) == 1 and pool._browsers[0] is not old
+
+    @pytest.mark.asyncio
+    async def test_retired_browser_drains_first(self, pool):
+        """使用中のコンテキストがある間は古いブラウザを閉じず、新しい払い出しは代わりのブラウザに行くか"""
+        old = await pool._checkout()
+        page = FakePage(old.browser)
+        for _ in range(3):
+            pool.record_page_use(page)
+        await asyncio.sleep(0)
+
+        assert pool.is_retired(page)
+        assert not old.browser.closed
+        replacement = await pool._checkout()
+        assert replacement is not old
+
+        await pool._checkin(old)
+        await pool._checkin(replacement)
+        await asyncio.gather(*pool._drain_tasks)
+        assert old.browser.closed
+        assert pool._browsers == [replacement]
+
+    @pytest.mark.asyncio
+    async def test_recycle_on_memory(self, pool, monkeypatch):
+        """プロセスツリーのRSSが上限を超えたら入れ替えるか"""
+        monkeypatch.setattr('backend.browser_pool.process_tree_rss', lambda marker: 2 * 1024 * 1024 * 1024)
+        pool._browsers[0].marker = '--mydungeon-browser=test'
+        pool.max_rss_bytes = 1024 * 1024 * 1024
+
+        await pool.recycle_check()
+        await asyncio.gather(*pool._drain_tasks)
+
+        assert pool.recycle_reasons == {'memory': 1}
+
+    @pytest.mark.asyncio
+    async def test_checkout_not_blocked_by_launch(self, pool):
+        """入れ替え・再起動で代わりのブラウザを起動している間も払い出しが待たされないか"""
+        launching = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_launch():
+            launching.set()
+            await release.wait()
+            return PooledBrowser(FakeBrowser(), marker=None)
+
+        pool._launch = slow_launch
+        old = pool._browsers[0]
+        recycle = asyncio.create_task(pool.recycle(old, 'pages'))
+        await launching.wait()
+        checked_out = await asyncio.wait_for(pool._checkout(), timeout=1)
+        assert checked_out is old
+        # 起動中の入れ替えを重ねて始めない
+        await pool.recycle(old, 'pages')
+        await pool._checkin(old)
+        release.set()
+        await recycle
+        assert pool.recycles == 1 and old.browser.closed
+
+        launching.clear()
+        release.clear()
+        broken = pool._browsers[0]
+        broken.browser.closed = True
+        health = asyncio.create_task(pool.health_check())
+        await launching.wait()
+        await asyncio.wait_for(pool._checkout(), timeout=1)
+        release.set()
+        await health
+        assert pool.relaunches == 1 and pool._browsers[0] is not broken
+
+    @pytest.mark.skipif(not os.path.isdir('/proc'), reason="/procが無い環境")
+    def test_process_tree_rss(self):
+        """コマンドラインの目印から自プロセスのRSSを測れるか"""
+        with open('/proc/self/cmdline', 'rb') as f:
+            marker = f.read().split(b'\0')[-2].decode()
+        assert process_tree_rss(marker) > 0
+        assert process_tree_rss('--no-such-marker') is None
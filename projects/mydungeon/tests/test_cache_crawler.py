@@ -0,0 +1,117 @@
+import pytest
+import sys
+import os
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.cache_crawler import CacheCrawler, CrawlCheckpoint, crawl_inputs, crawl_times
+from backend.key_buckets import TimeBucketTable
+from backend.result_cache import ScrapeResultCache
+from backend.scraper import DungeonScraper
+
+
+@pytest.fixture
+def scraper(tmp_path, fake_page_pool):
+    """外部サイトにアクセスしないスクレイパー（失敗させる入力を指定できる）"""
+    cache = ScrapeResultCache(path=str(tmp_path / 'cache.sqlite3'))
+    scraper = DungeonScraper(page_pool=fake_page_pool, backend='browser', cache=cache, key_table=TimeBucketTable())
+    scraper.calls = []
+    scraper.failing = set()
+
+    async def fake_submit(page, values, return_raw_text=False, resubmit=False):
+        scraper.calls.append(values)
+        if values in scraper.failing:
+            raise RuntimeError("upstream error")
+        return [1, 2, 3], ''
+
+    scraper._submit_and_extract = fake_submit
+    yield scraper
+    cache.close()
+
+
+class TestCrawlInputs:
+    """取得対象の列挙のテスト"""
+
+    def test_hourly_inputs(self):
+        """日付×1時間ごとの入力が列挙されるか"""
+        inputs = list(crawl_inputs(date(1990, 1, 1), date(1990, 1, 2), crawl_times(60)))
+        assert len(inputs) == 48
+        assert inputs[0] == ('1990-01-01 00:00', '1990-01-01', '00:00')
+        assert inputs[-1] == ('1990-01-02 23:00', '1990-01-02', '23:00')
+
+    def test_bucketed_inputs(self):
+        """バケット表の先頭時刻だけを取得し、時刻に依存しない日付は1件にまとまるか"""
+        table = TimeBucketTable([0, 360, 720], ['1990-01-02'])
+        times = crawl_times(60, table)
+        inputs = list(crawl_inputs(date(1990, 1, 1), date(1990, 1, 2), times, table))
+        assert times == ['00:00', '06:00', '12:00']
+        assert [key for key, _, _ in inputs] == [
+            '1990-01-01 00:00', '1990-01-01 06:00', '1990-01-01 12:00', '1990-01-02 00:00'
+        ]
+
+
+class TestCacheCrawler:
+    """CacheCrawlerのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_fills_cache_and_skips_cached(self, scraper):
+        """全入力がキャッシュに入り、キャッシュ済みの入力は取得しないか"""
+        inputs = list(crawl_inputs(date(1990, 1, 1), date(1990, 1, 1), crawl_times(240)))
+        scraper.cache.put('1990-01-01 00:00', [9])
+
+        stats = await CacheCrawler(scraper, concurrency=3, rate=0, batch_size=2).run(inputs)
+
+        assert stats['fetched'] == 5
+        assert stats['skipped'] == 1
+        assert len(scraper.calls) == 5
+        assert all(scraper.cache.contains(key) for key, _, _ in inputs)
+
+    @pytest.mark.asyncio
+    async def test_checkpoint_resume(self, scraper, tmp_path):
+        """失敗した位置でチェックポイントが止まり、再開時に再取得されるか"""
+        inputs = list(crawl_inputs(date(1990, 1, 1), date(1990, 1, 1), crawl_times(240)))
+        path = str(tmp_path / 'checkpoint.json')
+        scraper.failing.add(('1990', '1', '1', '8', '0'))
+
+        checkpoint = CrawlCheckpoint(path, {'job': 1})
+        stats = await CacheCrawler(scraper, concurrency=2, rate=0, batch_size=2).run(inputs, checkpoint)
+        assert stats['failed'] == 1
+        assert checkpoint.position == 2
+        assert checkpoint.failed == ['1990-01-01 08:00']
+
+        scraper.failing.clear()
+        scraper.calls.clear()
+        resumed = CrawlCheckpoint(path, {'job': 1})
+        assert resumed.load()
+        assert resumed.failed == ['1990-01-01 08:00']
+        stats = await CacheCrawler(scraper, concurrency=2, rate=0, batch_size=2).run(inputs, resumed)
+        assert scraper.calls == [('1990', '1', '1', '8', '0')]
+        assert resumed.position == len(inputs)
+        assert resumed.failed == []
+
+        # 条件が違うチェックポイントは使わない
+        assert not CrawlCheckpoint(path, {'job': 2}).load()
+
+    @pytest.mark.asyncio
+    async def test_resume_retries_failed_keys_first(self, scraper, tmp_path):
+        """チェックポイントの失敗したキーを、位置より前でも先に取得し直すか"""
+        inputs = list(crawl_inputs(date(1990, 1, 1), date(1990, 1, 1), crawl_times(240)))
+        path = str(tmp_path / 'checkpoint.json')
+        checkpoint = CrawlCheckpoint(path, {'job': 1})
+        checkpoint.position = 4
+        checkpoint.failed = ['1990-01-01 04:00', '1990-01-01 16:00']
+        checkpoint.save()
+
+        resumed = CrawlCheckpoint(path, {'job': 1})
+        assert resumed.load()
+        stats = await CacheCrawler(scraper, concurrency=1, rate=0, batch_size=2).run(inputs, resumed)
+
+        assert scraper.calls[:2] == [('1990', '1', '1', '4', '0'), ('1990', '1', '1', '16', '0')]
+        assert sorted(scraper.calls) == sorted([
+            ('1990', '1', '1', '4', '0'), ('1990', '1', '1', '16', '0'), ('1990', '1', '1', '20', '0')
+        ])
+        assert stats['fetched'] == 3
+        assert stats['skipped'] == 3
+        assert resumed.failed == []
+        assert resumed.position == len(inputs)
@@ -0,0 +1,126 @@
+import pytest
+import asyncio
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.result_cache import ScrapeResultCache
+from backend.scraper import DungeonScraper, _refresh_tasks
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    """直近4回のうち半分失敗で開くブレーカー"""
+    options = dict(enabled=True, window=4, min_calls=4, failure_rate=0.5, slow_call_seconds=10,
+                   slow_call_rate=0.8, open_seconds=0.05, half_open_probes=1)
+    options.update(kwargs)
+    return CircuitBreaker('test', **options)
+
+
+async def succeed():
+    return 'ok'
+
+
+async def fail():
+    raise TimeoutError("upstream timed out")
+
+
+class TestCircuitBreaker:
+    """CircuitBreakerのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_trips_and_recovers(self):
+        """エラー率で開き、開いている間は呼ばずに失敗し、半開の試行が成功すれば閉じるか"""
+        breaker = make_breaker()
+        for fn in (succeed, fail, succeed, fail):
+            try:
+                await breaker.call(fn)
+            except TimeoutError:
+                pass
+        assert breaker.state == 'open'
+        assert breaker.trips == 1
+
+        called = []
+
+        async def tracked():
+            called.append(1)
+            return 'ok'
+
+        with pytest.raises(CircuitOpenError) as excinfo:
+            await breaker.call(tracked)
+        assert excinfo.value.retry_after > 0
+        assert called == []
+        assert not breaker.allows_calls()
+
+        await asyncio.sleep(0.06)
+        assert breaker.allows_calls()
+        assert await breaker.call(tracked) == 'ok'
+        assert breaker.state == 'closed'
+
+    @pytest.mark.asyncio
+    async def test_failed_probe_reopens(self):
+        """半開の試行が失敗したら再び開くか"""
+        breaker = make_breaker()
+        breaker._trip('test')
+        await asyncio.sleep(0.06)
+        with pytest.raises(TimeoutError):
+            await breaker.call(fail)
+        assert breaker.state == 'open'
+        assert breaker.trips == 2
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """無効なら失敗が続いても開かないか"""
+        breaker = make_breaker(enabled=False)
+        for _ in range(8):
+            with pytest.raises(TimeoutError):
+                await breaker.call(fail)
+        assert breaker.state == 'closed'
+
+
+class TestStaleWhileRevalidate:
+    """期限切れキャッシュの返却と裏での更新のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_stale_hit_refreshes_in_background(self, tmp_path):
+        """期限切れの結果をすぐ返し、裏で取り直してキャッシュを更新するか"""
+        cache = ScrapeResultCache(path=str(tmp_path / 'cache.db'), ttl=60, stale_ttl=3600)
+        scraper = DungeonScraper(cache=cache, breaker=make_breaker())
+        key = scraper.key_table.canonical_key('1990-01-01', '12:30')
+        cache.put(key, [1, 2, 3])
+        cache._remember(key, bytes([1, 2, 3]), time.time() - 120)
+
+        fetched = []
+
+        async def fake_fetch(values, return_raw_text=False):
+            fetched.append(values)
+            return [4, 5, 6], ''
+
+        scraper._fetch = fake_fetch
+        assert await scraper.scrape_numbers('1990-01-01', '12:30') == [1, 2, 3]
+        assert cache.stale_hits == 1
+        await asyncio.gather(*_refresh_tasks)
+
+        assert len(fetched) == 1
+        assert cache.get(key) == [4, 5, 6]
+
+    @pytest.mark.asyncio
+    async def test_no_refresh_while_open(self, tmp_path):
+        """ブレーカーが開いている間は期限切れの結果を返すだけで取り直さないか"""
+        cache = ScrapeResultCache(path=str(tmp_path / 'cache.db'), ttl=60, stale_ttl=3600)
+        breaker = make_breaker(open_seconds=60)
+        breaker._trip('test')
+        scraper = DungeonScraper(cache=cache, breaker=breaker)
+        key = scraper.key_table.canonical_key('1990-01-01', '12:30')
+        cache._remember(key, bytes([1, 2, 3]), time.time() - 120)
+
+        assert await scraper.scrape_numbers('1990-01-01', '12:30') == [1, 2, 3]
+        assert not _refresh_tasks
+
+    def test_too_old_is_miss(self, tmp_path):
+        """stale_ttlより古い結果は返さないか"""
+        cache = ScrapeResultCache(path=str(tmp_path / 'cache.db'), ttl=60, stale_ttl=60)
+        cache._remember('k', bytes([1]), time.time() - 600)
+        assert cache.get_entry('k') is None
@@ -1,10 +1,13 @@
+import dataclasses
+import random
 import pytest
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.data_processor import DataProcessor
+from backend.config import settings
+from backend.data_processor import DataProcessor, scan_image_dir
 
 
 class TestDataProcessor:
@@ -125,6 +128,127 @@ class TestDataProcessor:
                 assert os.path.exists(item.image_path), f"Image not found: {item.image_path}"
                 print(f"✓ No.{item.no}: {os.path.basename(item.image_path)}")
 
+    def test_indexes_cover_multi_pair_items(self, processor):
+        """複数の対Noを持つ特殊アイテムも索引にすべての行が入るテスト"""
+        multi_pair_nos = processor.item_df['No'][processor.item_df['No'].duplicated()].astype(int).unique()
+        assert len(multi_pair_nos) > 0
+
+        for number in multi_pair_nos:
+            expected = len(processor.item_df[processor.item_df['No'] == number])
+            assert len(processor.item_rows_by_no[number]) == expected
+            assert len(processor.pairs_by_no[number]) == expected
+
+        assert set(processor.hissatsu_row_by_no) == set(processor.hissatsu_df['必殺No'].astype(int))
+
+    def test_lookups_do_not_touch_dataframes(self, processor):
+        """読み込み後の検索がDataFrameを使わず索引だけで完結するテスト"""
+        test_numbers = [1, 6, 8, 59]
+        expected_pairs = processor.get_hissatsu_pair_numbers(test_numbers)
+
+        processor.item_df = None
+        processor.hissatsu_df = None
+        processor.color_meaning_df = None
+        processor.action_df = None
+
+        items = processor.get_items_by_numbers(test_numbers)
+        assert len(items) == 4
+        assert {h.hissatsu_no for h in processor.detect_hissatsuwaza(test_numbers)} == {1, 6}
+        assert processor.get_hissatsu_pair_numbers(test_numbers) == expected_pairs
+        assert processor.get_color_counts(items)['color_systems']
+        assert processor.get_all_actions()
+
+    def test_catalog_records_are_shared_and_immutable(self, processor):
+        """リクエストごとにレコードを作らず、読み込み時のレコードを共有するテスト"""
+        first = processor.get_items_by_numbers([1, 8])
+        second = processor.get_items_by_numbers([8, 1])
+        assert first[0] is second[1]
+        assert processor.detect_hissatsuwaza([1, 8])[0] is processor.hissatsus_by_no[1]
+
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            first[0].name = "変更"
+
+    def test_as_dict_includes_image_url(self, processor):
+        """レスポンス用の辞書に画像URLが入り、呼び出し側で変更しても共有レコードに影響しないテスト"""
+        item = processor.items_by_no[1]
+        data = item.as_dict()
+        assert data['no'] == 1
+        assert data['image_path'] == item.image_path
+        assert data['image_url'] == item.image_url
+        if item.image_path:
+            assert item.image_url.startswith('/images/item/')
+
+        public = item.as_dict(with_image_path=False)
+        assert 'image_path' not in public
+        assert list(public)[-1] == 'image_url'
+
+        data['name'] = "変更"
+        assert item.as_dict()['name'] == "タレント"
+
+    def test_every_catalog_entry_has_image(self, processor):
+        """起動時の画像の走査で全カタログエントリの画像が見つかるテスト"""
+        assert processor.missing_images == []
+        assert all(item.image_path for item in processor.items_by_no.values())
+        assert all(h.image_path for h in processor.hissatsus_by_no.values())
+
+    def test_find_image_path_does_not_stat(self, processor, monkeypatch):
+        """画像パスの検索が索引だけで完結しファイルシステムに触れないテスト"""
+        def fail(*args, **kwargs):
+            raise AssertionError("filesystem access on lookup")
+        monkeypatch.setattr(os.path, 'exists', fail)
+        monkeypatch.setattr(os, 'listdir', fail)
+
+        assert processor._find_image_path(1, settings.ITEM_IMAGES_DIR).startswith(settings.ITEM_IMAGES_DIR)
+        assert processor._find_image_path(1, settings.HISSATSU_IMAGES_DIR, suffix='_h')
+        assert processor._find_image_path(999, settings.ITEM_IMAGES_DIR) == ""
+
+    def test_scan_image_dir(self, tmp_path):
+        """拡張子の優先順位・サフィックス・対象外のファイルの扱いのテスト"""
+        for filename in ['1.png', '1.jpg', '2_h.JPEG', '3.txt', '4.gif']:
+            (tmp_path / filename).write_bytes(b'')
+
+        index = scan_image_dir(str(tmp_path))
+
+        assert index['1'] == str(tmp_path / '1.jpg')
+        assert index['2_h'] == str(tmp_path / '2_h.JPEG')
+        assert index['4'] == str(tmp_path / '4.gif')
+        assert '3' not in index
+        assert scan_image_dir(str(tmp_path / 'missing')) == {}
+
+    def test_analyze_matches_separate_lookups(self, processor):
+        """analyzeの結果が個別のメソッドを順に呼んだ結果と同じになるテスト"""
+        rng = random.Random(0)
+        cases = [[1, 4, 6, 11, 12, 33, 36, 38, 40, 41, 48, 53, 54, 59, 60], [], [1, 6, 8, 59, 999]]
+        cases += [rng.sample(range(1, 73), rng.randint(1, 40)) for _ in range(200)]
+
+        for numbers in cases:
+            result = processor.analyze(numbers)
+            items = processor.get_items_by_numbers(numbers)
+            pairs = processor.get_hissatsu_pair_numbers(numbers)
+
+            assert list(result.numbers) == numbers
+            assert list(result.items) == items
+            assert list(result.hissatsus) == processor.detect_hissatsuwaza(numbers)
+            assert result.pairs_dict() == pairs
+            assert list(result.pairs_dict()) == list(pairs)
+            assert result.hissatsu_numbers == {n for pair in pairs.values() for n in pair}
+            assert result.color_counts_dict() == processor.get_color_counts(items)
+
+    def test_analyze_result_is_immutable(self, processor):
+        """analyzeの結果が変更できないテスト"""
+        result = processor.analyze([1, 6, 8, 59])
+
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            result.items = ()
+        with pytest.raises(TypeError):
+            result.hissatsu_pairs[99] = (1, 2)
+        assert isinstance(result.items, tuple)
+        assert result.hissatsu_numbers == frozenset({1, 8, 6, 59})
+
+        # レスポンス用の辞書は呼び出しごとに新しく作られる
+        counts = result.color_counts_dict()
+        counts['color_systems'].clear()
+        assert result.color_counts_dict()['color_systems']
+
 
 # スタンドアロン実行用
 if __name__ == "__main__":
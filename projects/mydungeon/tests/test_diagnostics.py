@@ -0,0 +1,89 @@
+import pytest
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.diagnostics import Diagnostics, current_request_id, new_request_id
+from backend.scraper import DungeonScraper
+
+
+class FakePage:
+    async def screenshot(self):
+        return b'png'
+
+    async def content(self):
+        return '<html></html>'
+
+
+def captures(directory):
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+class TestDiagnostics:
+    """診断情報の記録のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_only_sampled_or_failed(self, tmp_path):
+        """サンプリング対象外の成功は記録せず、失敗はリクエストIDのディレクトリに記録するか"""
+        diagnostics = Diagnostics(directory=str(tmp_path), sample_rate=0, on_failure=True, max_captures=10)
+        capture = diagnostics.begin()
+        await capture.snapshot(FakePage(), 'before_submit.png')
+        capture.finish(numbers=[1])
+        await diagnostics.drain()
+        assert captures(str(tmp_path)) == []
+
+        token = current_request_id.set('req-1')
+        try:
+            capture = diagnostics.begin(values=['1990', '1', '1', '12', '30'])
+        finally:
+            current_request_id.reset(token)
+        await capture.fail(FakePage(), 'TimeoutError: timed out')
+        capture.finish()
+        await diagnostics.drain()
+
+        [entry] = captures(str(tmp_path))
+        assert '-req-1-' in entry
+        with open(os.path.join(str(tmp_path), entry, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        assert meta['request_id'] == 'req-1'
+        assert meta['error'] == 'TimeoutError: timed out'
+        assert meta['artifacts'] == ['error.png', 'page_content.html']
+        assert diagnostics.written == 1
+
+    @pytest.mark.asyncio
+    async def test_ring_buffer(self, tmp_path):
+        """記録の件数が上限を超えたら古いものから消えるか"""
+        diagnostics = Diagnostics(directory=str(tmp_path), sample_rate=1, max_captures=3)
+        for i in range(5):
+            capture = diagnostics.begin(index=i)
+            await capture.snapshot(FakePage(), 'after_submit.png')
+            capture.finish()
+            await diagnostics.drain()
+
+        entries = captures(str(tmp_path))
+        assert len(entries) == 3
+        with open(os.path.join(str(tmp_path), entries[0], 'meta.json'), encoding='utf-8') as f:
+            assert json.load(f)['index'] == 2
+
+    def test_request_id_sanitized(self):
+        """ディレクトリ名に使えないリクエストIDは引き継がないか"""
+        assert new_request_id('abc-123') == 'abc-123'
+        assert new_request_id('../../etc') != '../../etc'
+        assert len(new_request_id(None)) == 16
+
+    @pytest.mark.asyncio
+    async def test_scraper_failure_is_captured(self, tmp_path):
+        """スクレイピングの失敗時に画面とHTMLが記録されるか"""
+        diagnostics = Diagnostics(directory=str(tmp_path), sample_rate=0, on_failure=True, max_captures=10)
+        scraper = DungeonScraper(backend='browser', diagnostics=diagnostics)
+
+        async def broken(page, values, capture, return_raw_text, resubmit):
+            raise RuntimeError("form changed")
+
+        scraper._submit_and_extract_once = broken
+        with pytest.raises(RuntimeError):
+            await scraper._submit_and_extract(FakePage(), ('1990', '1', '1', '12', '30'))
+        await diagnostics.drain()
+        assert len(captures(str(tmp_path))) == 1
@@ -0,0 +1,123 @@
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playwright.async_api import TimeoutError as PlaywrightTimeout
+from backend.hedging import HedgeBudget, HedgedExecutor, LatencyTracker
+
+
+def make_executor(**kwargs) -> HedgedExecutor:
+    """待ち時間なしで再試行し、サンプル5件からヘッジするエグゼキューター"""
+    options = dict(retries=2, base_delay=0, max_delay=0, hedge_enabled=True, hedge_min_samples=5,
+                   budget=HedgeBudget(ratio=1, burst=5))
+    options.update(kwargs)
+    return HedgedExecutor(**options)
+
+
+class TestLatencyTracker:
+    """LatencyTrackerのテスト"""
+
+    def test_percentile(self):
+        """最近傍法のパーセンタイル"""
+        tracker = LatencyTracker(window=100)
+        assert tracker.percentile(95) is None
+        for i in range(1, 101):
+            tracker.record(i / 1000)
+        assert tracker.percentile(95) == 0.095
+        assert tracker.percentile(100) == 0.1
+
+
+class TestHedgedExecutor:
+    """HedgedExecutorのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_retry_transient_errors(self):
+        """一時的なエラーは再試行され、それ以外はすぐに伝わるか"""
+        executor = make_executor(hedge_enabled=False)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise PlaywrightTimeout("timed out")
+            return 'ok'
+
+        assert await executor.run(flaky) == 'ok'
+        assert executor.retried == 2
+
+        async def broken():
+            attempts.append(1)
+            raise ValueError("bad input")
+
+        attempts.clear()
+        with pytest.raises(ValueError):
+            await executor.run(broken)
+        assert len(attempts) == 1
+
+        attempts.clear()
+        with pytest.raises(PlaywrightTimeout):
+            await executor.run(lambda: flaky_forever(attempts))
+        assert len(attempts) == 3
+
+    @pytest.mark.asyncio
+    async def test_hedge_after_percentile(self):
+        """p95を過ぎた取得に2本目が並走し、先に終わった方が使われるか"""
+        executor = make_executor()
+        for _ in range(5):
+            executor.latency.record(0.01)
+        delays = [1.0, 0.01]
+        cancelled = []
+
+        async def fetch():
+            delay = delays.pop(0)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        assert await executor.run(fetch) == 0.01
+        assert executor.hedges == 1
+        assert executor.hedge_wins == 1
+        assert cancelled == [1.0]
+
+    @pytest.mark.asyncio
+    async def test_hedge_budget(self):
+        """予算が無ければヘッジせず1本目を待つか"""
+        executor = make_executor(budget=HedgeBudget(ratio=0.1, burst=5))
+        executor.budget.tokens = 0
+        for _ in range(5):
+            executor.latency.record(0.001)
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return 'slow'
+
+        assert await executor.run(slow) == 'slow'
+        assert executor.hedges == 0
+        assert executor.hedges_denied == 1
+
+
+    @pytest.mark.asyncio
+    async def test_retries_share_budget(self):
+        """再試行も予算を使い、予算が無ければすぐに失敗し、失敗した試行で予算が増えないか"""
+        executor = make_executor(hedge_enabled=False, budget=HedgeBudget(ratio=0.5, burst=5))
+        executor.budget.tokens = 1
+        attempts = []
+
+        with pytest.raises(PlaywrightTimeout):
+            await executor.run(lambda: flaky_forever(attempts))
+        # 呼び出し時に0.5貯まり、1回目の再試行で1使う。残り0.5では2回目を再試行しない
+        assert len(attempts) == 2
+        assert executor.retried == 1
+        assert executor.retries_denied == 1
+        assert executor.budget.tokens == 0.5
+
+
+async def flaky_forever(attempts):
+    attempts.append(1)
+    raise PlaywrightTimeout("timed out")
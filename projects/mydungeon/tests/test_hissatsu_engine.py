@@ -0,0 +1,120 @@
+import random
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from backend.data_processor import DataProcessor
+from backend.hissatsu_engine import HissatsuEngine
+from backend.number_mask import numbers_to_mask
+
+
+def dataframe_detect_hissatsuwaza(processor, numbers):
+    """従来の detect_hissatsuwaza（item_dfを数字ごとに絞り込む判定）の必殺Noのリスト"""
+    hissatsu_nos = []
+    activated_hissatsu_nos = set()
+    number_set = set(numbers)
+    for number in numbers:
+        item_rows = processor.item_df[processor.item_df['No'] == number]
+        for _, item in item_rows.iterrows():
+            pair_no = item['対No']
+            hissatsu_no = item['必殺No']
+            if (pd.notna(pair_no) and
+                int(pair_no) in number_set and
+                pd.notna(hissatsu_no)):
+                hissatsu_no = int(hissatsu_no)
+                if hissatsu_no not in activated_hissatsu_nos:
+                    activated_hissatsu_nos.add(hissatsu_no)
+                    hissatsu_row = processor.hissatsu_df[processor.hissatsu_df['必殺No'] == hissatsu_no]
+                    if not hissatsu_row.empty:
+                        hissatsu_nos.append(hissatsu_no)
+    return hissatsu_nos
+
+
+def dataframe_get_hissatsu_pair_numbers(processor, numbers):
+    """従来の get_hissatsu_pair_numbers（item_dfを数字ごとに絞り込む判定）"""
+    hissatsu_pairs = {}
+    number_set = set(numbers)
+    processed_pairs = set()
+    for number in numbers:
+        item_rows = processor.item_df[processor.item_df['No'] == number]
+        for _, item in item_rows.iterrows():
+            pair_no = item['対No']
+            hissatsu_no = item['必殺No']
+            if (pd.notna(pair_no) and
+                int(pair_no) in number_set and
+                pd.notna(hissatsu_no)):
+                hissatsu_no = int(hissatsu_no)
+                pair_no = int(pair_no)
+                pair_tuple = tuple(sorted([number, pair_no]))
+                if pair_tuple not in processed_pairs:
+                    processed_pairs.add(pair_tuple)
+                    hissatsu_pairs[hissatsu_no] = list(pair_tuple)
+    return hissatsu_pairs
+
+
+class TestHissatsuEngine:
+    """HissatsuEngineのテスト"""
+
+    @pytest.fixture
+    def processor(self):
+        """データプロセッサーのインスタンスを作成"""
+        return DataProcessor()
+
+    def test_rule_masks_share_cache_convention(self, processor):
+        """行のマスクが結果キャッシュと同じビット（数字nはビットn-1）を使うテスト"""
+        for rule in processor.hissatsu_engine.rules:
+            assert rule.mask == numbers_to_mask([rule.no, rule.pair_no])
+        assert numbers_to_mask([0, 1, 99], strict=False) == numbers_to_mask([1])
+
+    def test_known_result(self, processor):
+        """既知の結果で必殺技とペアを判定するテスト"""
+        engine = processor.hissatsu_engine
+        assert engine.detect([1, 6, 8, 59]) == [1, 6]
+        assert engine.pairs([1, 6, 8, 59]) == {1: [1, 8], 6: [6, 59]}
+        assert engine.detect([1, 2, 3, 5, 7, 9]) == []
+
+    def test_order_follows_input(self):
+        """出力の順序が数字リストの順序に従うテスト"""
+        engine = HissatsuEngine([(1, 8, 1), (6, 59, 6), (8, 1, 1)])
+        assert engine.detect([59, 6, 8, 1]) == [6, 1]
+        assert list(engine.pairs([8, 1, 6, 59])) == [1, 6]
+
+    def test_multi_pair_rows_keep_csv_order(self):
+        """同じNoの複数の対Noは CSV の行順に判定されるテスト"""
+        engine = HissatsuEngine([(10, 20, 5), (10, 30, 3), (20, 10, 5)])
+        assert engine.detect([10, 20, 30]) == [5, 3]
+        assert engine.pairs([30, 20, 10]) == {5: [10, 20], 3: [10, 30]}
+
+    def test_identical_to_dataframe_detection(self, processor):
+        """ランダムな数字リストでitem_dfを使う従来の判定と完全に同じ出力になるテスト"""
+        engine = processor.hissatsu_engine
+        rng = random.Random(0)
+        for _ in range(300):
+            numbers = rng.sample(range(1, 73), rng.randint(0, 40))
+            # 重複やカタログに無い数字が混ざっても同じ結果になること
+            if rng.random() < 0.2:
+                numbers += rng.sample(numbers, min(3, len(numbers))) + [0, 99]
+            expected_nos = dataframe_detect_hissatsuwaza(processor, numbers)
+            expected_pairs = dataframe_get_hissatsu_pair_numbers(processor, numbers)
+
+            assert engine.detect(numbers) == expected_nos
+            pairs = engine.pairs(numbers)
+            assert pairs == expected_pairs
+            assert list(pairs) == list(expected_pairs)
+
+            result = processor.analyze(numbers)
+            assert [h.hissatsu_no for h in result.hissatsus] == expected_nos
+            assert {no: list(pair) for no, pair in result.hissatsu_pairs.items()} == expected_pairs
+
+    def test_activated_unordered_matches_activated(self, processor):
+        """マスクだけからの判定が順序を除いて同じ行を返すテスト"""
+        engine = processor.hissatsu_engine
+        rng = random.Random(1)
+        for _ in range(200):
+            numbers = rng.sample(range(1, 73), rng.randint(0, 40))
+            mask = numbers_to_mask(numbers)
+            assert set(engine.activated_unordered(mask)) == set(engine.activated(numbers, mask))
@@ -0,0 +1,145 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.key_buckets import TimeBucketTable
+from backend.result_cache import ScrapeResultCache
+from backend.scraper import DungeonScraper
+
+
+class TestTimeBucketTable:
+    """TimeBucketTableのテスト"""
+
+    def test_identity_table(self):
+        """境界が無いテーブルは表記ゆれの吸収だけを行うか"""
+        table = TimeBucketTable()
+        assert not table.active
+        assert table.canonical_key('1990-1-5', '9:07') == '1990-01-05 09:07'
+
+    def test_bucket_start(self):
+        """境界でまとめられた時刻がバケットの先頭になるか"""
+        table = TimeBucketTable([120, 600])
+        assert table.bucket_start(0) == 0
+        assert table.bucket_start(119) == 0
+        assert table.bucket_start(120) == 120
+        assert table.bucket_start(1439) == 600
+        assert table.canonical_key('1990-01-05', '01:59') == '1990-01-05 00:00'
+        assert table.canonical_key('1990-01-05', '10:30') == '1990-01-05 10:00'
+
+    def test_time_independent_dates(self):
+        """時刻に依存しない日付は1つのキーにまとまるか"""
+        table = TimeBucketTable(time_independent_dates=['1990-01-05'])
+        assert table.canonical_key('1990-01-05', '23:59') == '1990-01-05 00:00'
+        assert table.canonical_key('1990-01-06', '23:59') == '1990-01-06 23:59'
+
+    def test_save_and_load(self, tmp_path):
+        """保存したテーブルを読み込めるか（ファイルが無ければ正規化しない）"""
+        path = str(tmp_path / 'key_buckets.json')
+        TimeBucketTable([0, 360], ['2000-02-29'], {'step_minutes': 15}).save(path)
+
+        table = TimeBucketTable.load(path)
+        assert table.boundaries == [0, 360]
+        assert table.time_independent_dates == {'2000-02-29'}
+        assert table.metadata['step_minutes'] == 15
+        assert not TimeBucketTable.load(str(tmp_path / 'missing.json')).active
+
+
+class TestScraperKeyBuckets:
+    """スクレイパーのキー正規化のテスト"""
+
+    @pytest.mark.asyncio
+    async def test_equivalent_inputs_share_cache(self, tmp_path, monkeypatch):
+        """同じバケットの入力が1回のスクレイピングで済むか"""
+        cache = ScrapeResultCache(path=str(tmp_path / 'cache.sqlite3'))
+        scraper = DungeonScraper(cache=cache, key_table=TimeBucketTable([0, 720]))
+        calls = []
+
+        async def fake_fetch(values, return_raw_text=False):
+            calls.append(values)
+            return [5, 1, 3], None
+
+        monkeypatch.setattr(scraper, '_fetch', fake_fetch)
+
+        assert await scraper.scrape_numbers('1990-01-05', '13:00') == [5, 1, 3]
+        assert await scraper.scrape_numbers('1990-01-05', '20:45') == [5, 1, 3]
+        assert len(calls) == 1
+        cache.close()
+
+
+class TestEquivalenceAnalyzer:
+    """EquivalenceAnalyzerのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_does_not_share_production_cache(self, monkeypatch):
+        """本番のキャッシュ・合流先を使わず、1分ごとに実際の取得結果を見るか"""
+        from backend.equivalence_analyzer import EquivalenceAnalyzer
+        from backend.result_cache import scrape_cache
+        from backend.scraper import scrape_flights
+
+        analyzer = EquivalenceAnalyzer()
+        assert analyzer.scraper.cache is not scrape_cache
+        assert analyzer.scraper.flights is not scrape_flights
+
+        async def fake_fetch(values, return_raw_text=False):
+            return [int(values[4]) + 1], None
+
+        monkeypatch.setattr(analyzer.scraper, '_fetch', fake_fetch)
+        memo = {}
+        assert await analyzer.numbers_at('1990-01-05', 0, memo) == (1,)
+        assert await analyzer.numbers_at('1990-01-05', 1, memo) == (2,)
+        analyzer.close()
+
+    @pytest.mark.asyncio
+    async def test_order_change_is_boundary(self, monkeypatch):
+        """同じ数字でも表示順が変われば境界として扱うか"""
+        from backend.equivalence_analyzer import EquivalenceAnalyzer
+
+        analyzer = EquivalenceAnalyzer(step=60)
+
+        async def fake_fetch(values, return_raw_text=False):
+            minute = int(values[3]) * 60 + int(values[4])
+            return ([1, 2] if minute < 100 else [2, 1]), None
+
+        monkeypatch.setattr(analyzer.scraper, '_fetch', fake_fetch)
+        assert await analyzer.find_boundaries('1990-01-05') == [100]
+        analyzer.close()
+
+    @pytest.mark.asyncio
+    async def test_empty_result_not_memoized(self, monkeypatch):
+        """空の結果は取り直し、取り直しても空なら境界を作らずに失敗するか"""
+        from backend.equivalence_analyzer import EMPTY_RESULT_RETRIES, EquivalenceAnalyzer
+
+        analyzer = EquivalenceAnalyzer()
+        results = [[], [3]]
+
+        async def fake_fetch(values, return_raw_text=False):
+            return (results.pop(0) if results else []), None
+
+        monkeypatch.setattr(analyzer.scraper, '_fetch', fake_fetch)
+        memo = {}
+        assert await analyzer.numbers_at('1990-01-05', 0, memo) == (3,)
+        with pytest.raises(RuntimeError):
+            await analyzer.numbers_at('1990-01-05', 1, memo)
+        assert 1 not in memo
+        assert analyzer.scrapes == 2 + EMPTY_RESULT_RETRIES + 1
+        analyzer.close()
+
+    @pytest.mark.asyncio
+    async def test_no_boundaries_does_not_collapse_times(self, monkeypatch):
+        """どの日付にも境界が無ければ時刻を正規化せず、サンプルした日付だけをまとめるか"""
+        from backend.equivalence_analyzer import EquivalenceAnalyzer
+
+        analyzer = EquivalenceAnalyzer(step=240)
+
+        async def fake_fetch(values, return_raw_text=False):
+            return [int(values[2])], None
+
+        monkeypatch.setattr(analyzer.scraper, '_fetch', fake_fetch)
+        table = await analyzer.analyze(['1990-01-05'])
+        analyzer.close()
+
+        assert table.boundaries is None
+        assert table.canonical_key('1990-01-05', '13:45') == '1990-01-05 00:00'
+        assert table.canonical_key('1991-02-03', '13:45') == '1991-02-03 13:45'
@@ -0,0 +1,119 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.admission import AdmissionController
+from backend.circuit_breaker import CircuitBreaker
+from backend.local_engine import LocalEngineBackend, load_engine, verify_against_recordings
+from backend.result_cache import ScrapeResultCache
+from backend.scrape_backends import BackendUnavailable
+from backend.scraper import DungeonScraper
+from backend.upstream_standin import RecordingStore
+
+ENGINE_SOURCE = '''
+ENGINE_VERSION = "test-1"
+
+def compute(year, month, day, hour, minute):
+    return [minute % 72 + 1, day, month]
+'''
+
+
+@pytest.fixture
+def engine_path(tmp_path):
+    path = tmp_path / 'engine.py'
+    path.write_text(ENGINE_SOURCE, encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def scraper(tmp_path, engine_path):
+    """計算モジュールを使い、ブラウザの代わりに固定の結果を返すスクレイパー"""
+    cache = ScrapeResultCache(path=str(tmp_path / 'cache.sqlite3'))
+    scraper = DungeonScraper(
+        backend='browser', cache=cache, breaker=CircuitBreaker(enabled=False),
+        admission=AdmissionController(slots=1, queue_limit=1, queue_timeout=1)
+    )
+    scraper.backend = LocalEngineBackend(scraper, load_engine(engine_path), crosscheck_rate=0, disable_on_mismatch=True)
+    scraper.browser_calls = []
+
+    async def fake_browser(values, return_raw_text=False):
+        scraper.browser_calls.append(values)
+        return [31, 1], 'raw'
+
+    scraper.browser_backend.fetch = fake_browser
+    yield scraper
+    cache.close()
+
+
+class TestLocalEngine:
+    """ローカル計算モジュールのテスト"""
+
+    def test_load_engine(self, engine_path, tmp_path):
+        """ENGINE_VERSIONとcompute()を持つモジュールだけを読み込むか"""
+        engine = load_engine(engine_path)
+        assert engine.version == 'test-1'
+        assert engine.compute(('1990', '1', '1', '12', '30')) == [31, 1]
+        assert load_engine(str(tmp_path / 'missing.py')) is None
+
+        broken = tmp_path / 'broken.py'
+        broken.write_text('VALUE = 1\n', encoding='utf-8')
+        assert load_engine(str(broken)) is None
+
+    @pytest.mark.asyncio
+    async def test_scrape_without_browser(self, scraper):
+        """計算モジュールで数字を求め、ブラウザも受付制御も使わないか"""
+        assert await scraper.scrape_numbers('1990-01-01', '12:30') == [31, 1]
+        assert scraper.browser_calls == []
+        assert scraper.admission.admitted == 0
+
+        # 生テキストは外部サイトにしか無いのでブラウザで取得する
+        assert await scraper.scrape_numbers('1990-01-01', '12:31', return_raw_text=True) == ([31, 1], 'raw')
+        assert len(scraper.browser_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_cross_check_mismatch_disables(self, scraper):
+        """突き合わせで食い違えば計算を止め、以降はブラウザで取得するか"""
+        backend = scraper.backend
+        assert await backend.cross_check(('1990', '1', '1', '12', '30'), [31, 1]) is True
+        assert await backend.cross_check(('1990', '1', '1', '12', '31'), [32, 1]) is False
+        assert backend.mismatches == 1
+        assert backend.disabled_reason
+
+        with pytest.raises(BackendUnavailable):
+            await backend.fetch(('1990', '1', '1', '12', '32'))
+        assert await scraper.scrape_numbers('1990-01-01', '12:32') == [31, 1]
+        assert len(scraper.browser_calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_cross_check_compares_order(self, scraper):
+        """同じ集合でも順序が違えば食い違いとみなすか"""
+        assert await scraper.backend.cross_check(('1990', '1', '1', '12', '30'), [1, 31]) is False
+
+    @pytest.mark.asyncio
+    async def test_mismatch_purges_cached_results(self, scraper):
+        """食い違ったら計算結果のキャッシュだけを消し、外部サイトから取得した結果は残すか"""
+        cache = scraper.cache
+        cache.put('1990-01-01 00:00', [5], source=None)
+        assert await scraper.scrape_numbers('1990-01-01', '12:30') == [31, 1]
+        assert await scraper.scrape_numbers('1990-01-01', '12:40') == [41, 1]
+
+        assert await scraper.backend.cross_check(('1990', '1', '1', '12', '31'), [32, 1]) is False
+        assert scraper.backend.purged == 2
+        assert cache.get('1990-01-01 12:30') is None
+        assert cache.get('1990-01-01 00:00') == [5]
+
+        # 計算を止めた後はブラウザの結果を出所なしで保存する
+        assert await scraper.scrape_numbers('1990-01-01', '12:30') == [31, 1]
+        assert cache.invalidate_source('local:test-1') == 0
+        assert cache.get('1990-01-01 12:30') == [31, 1]
+
+    def test_verify_against_recordings(self, engine_path, tmp_path):
+        """記録した結果との突き合わせで食い違いを数えるか"""
+        store = RecordingStore(str(tmp_path / 'recordings.jsonl'))
+        store.add('1990-01-01 12:30', [31, 1])
+        store.add('1990-01-01 12:31', [5])
+        checked, mismatches = verify_against_recordings(load_engine(engine_path), store)
+        assert checked == 2
+        assert [m['key'] for m in mismatches] == ['1990-01-01 12:31']
@@ -0,0 +1,26 @@
+import time
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import readiness
+from backend.readiness import ReadinessWaiter
+
+
+class TestReadinessWaiter:
+    """準備完了の判定のテスト"""
+
+    def test_option_ready_records_signal(self, monkeypatch):
+        """選択肢待ちが終わったときにoptionフェーズのシグナルを記録するか"""
+        monkeypatch.setattr(readiness, 'signal_counts', readiness.Counter())
+        waiter = ReadinessWaiter(page=None)
+
+        present = waiter.option_ready(time.monotonic(), 0)
+        appeared = waiter.option_ready(time.monotonic() - 0.2, 3)
+
+        assert (present.phase, present.name) == ('option', 'options_present')
+        assert (appeared.phase, appeared.name) == ('option', 'options_appeared')
+        assert appeared.elapsed_ms >= 200
+        assert readiness.signal_counts == {'option:options_present': 1, 'option:options_appeared': 1}
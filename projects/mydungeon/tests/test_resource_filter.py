@@ -0,0 +1,62 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.resource_filter import ResourceFilter
+
+
+class FakeRequest:
+    def __init__(self, resource_type, url):
+        self.resource_type = resource_type
+        self.url = url
+
+
+class FakeRoute:
+    def __init__(self, resource_type, url):
+        self.request = FakeRequest(resource_type, url)
+        self.aborted = False
+        self.continued = False
+
+    async def abort(self, error_code=None):
+        self.aborted = True
+
+    async def continue_(self):
+        self.continued = True
+
+
+class TestResourceFilter:
+    """ResourceFilterのテスト"""
+
+    @pytest.fixture
+    def resource_filter(self):
+        return ResourceFilter(
+            allowed_types=['document', 'script', 'xhr', 'fetch'],
+            blocked_url_patterns=['google-analytics.com']
+        )
+
+    def test_should_block(self, resource_filter):
+        """許可されていない種別と解析スクリプトが遮断されるか"""
+        assert not resource_filter.should_block('document', 'https://dungeon.humanjp.com/')
+        assert not resource_filter.should_block('script', 'https://dungeon.humanjp.com/app.js')
+        assert resource_filter.should_block('image', 'https://dungeon.humanjp.com/logo.png')
+        assert resource_filter.should_block('font', 'https://fonts.example.com/a.woff2')
+        assert resource_filter.should_block('script', 'https://www.google-analytics.com/analytics.js')
+
+    @pytest.mark.asyncio
+    async def test_counters(self, resource_filter):
+        """遮断数と許可数が種別ごとに集計されるか"""
+        image = FakeRoute('image', 'https://dungeon.humanjp.com/logo.png')
+        document = FakeRoute('document', 'https://dungeon.humanjp.com/')
+
+        await resource_filter._handle(image)
+        await resource_filter._handle(document)
+
+        assert image.aborted and not image.continued
+        assert document.continued and not document.aborted
+
+        stats = resource_filter.stats()
+        assert stats['blocked_requests'] == 1
+        assert stats['allowed_requests'] == 1
+        assert stats['blocked_by_type'] == {'image': 1}
@@ -0,0 +1,125 @@
+import pytest
+import sqlite3
+import sys
+import threading
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.result_cache import ScrapeResultCache, make_key, mask_to_numbers, numbers_to_mask
+from backend.scraper import DungeonScraper
+
+
+class TestScrapeResultCache:
+    """ScrapeResultCacheのテスト"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        cache = ScrapeResultCache(path=str(tmp_path / 'cache.sqlite3'), ttl=0, version='1', lru_size=2)
+        yield cache
+        cache.close()
+
+    def test_mask_roundtrip(self):
+        """数字リストと72ビットマスクの相互変換"""
+        numbers = [1, 4, 6, 11, 12, 33, 36, 38, 40, 41, 48, 53, 54, 59, 60, 72]
+        mask = numbers_to_mask(numbers)
+        assert mask.bit_length() <= 72
+        assert mask_to_numbers(mask) == numbers
+
+        with pytest.raises(ValueError):
+            numbers_to_mask([73])
+
+    def test_make_key_normalizes(self):
+        """先頭ゼロの有無を吸収するか"""
+        assert make_key('1991-9-16', '3:5') == make_key('1991-09-16', '03:05') == '1991-09-16 03:05'
+
+    def test_put_and_get(self, cache):
+        """保存した結果が保存時の順序のまま取得できるか"""
+        key = make_key('1991-09-16', '13:50')
+        assert cache.get(key) is None
+
+        cache.put(key, [59, 6, 1])
+
+        assert cache.get(key) == [59, 6, 1]
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_persists_beyond_lru(self, cache, tmp_path):
+        """LRUから追い出されてもSQLiteから読めるか"""
+        for minute in range(5):
+            cache.put(make_key('2000-01-01', f'00:{minute:02d}'), [minute + 1])
+
+        assert len(cache._lru) == 2
+        assert cache.get(make_key('2000-01-01', '00:00')) == [1]
+
+        reopened = ScrapeResultCache(path=cache.path, ttl=0, version='1')
+        assert reopened.get(make_key('2000-01-01', '00:03')) == [4]
+        reopened.close()
+
+    def test_version_and_ttl(self, cache, tmp_path):
+        """バージョン違い・期限切れのエントリはヒットしないか"""
+        key = make_key('2000-01-01', '12:00')
+        cache.put(key, [1, 2, 3])
+
+        other_version = ScrapeResultCache(path=cache.path, ttl=0, version='2')
+        assert other_version.get(key) is None
+        other_version.close()
+
+        expired = ScrapeResultCache(path=cache.path, ttl=1e-9, version='1')
+        assert expired.get(key) is None
+        expired.close()
+
+    @pytest.mark.asyncio
+    async def test_async_api(self, cache, monkeypatch):
+        """async版はLRUに無い場合だけSQLiteをスレッドで読み書きするか"""
+        threads = []
+        original = cache._lookup
+
+        def lookup(key):
+            threads.append(threading.current_thread() is threading.main_thread())
+            return original(key)
+
+        monkeypatch.setattr(cache, '_lookup', lookup)
+        key = make_key('2000-01-01', '12:00')
+        await cache.put_async(key, [9, 3])
+        assert await cache.get_async(key) == [9, 3]
+        assert threads == []
+
+        cache._lru.clear()
+        assert await cache.get_entry_async(key) == ([9, 3], False)
+        assert await cache.contains_async(key)
+        assert threads == [False]
+
+    def test_legacy_rows_without_order(self, tmp_path):
+        """順序を持たない旧形式のテーブルに列を追加し、旧エントリは取り直す対象になるか"""
+        path = str(tmp_path / 'legacy.sqlite3')
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE scrape_results (key TEXT PRIMARY KEY, mask BLOB NOT NULL, version TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO scrape_results VALUES ('k', ?, '1', 0)", (numbers_to_mask([1, 2]).to_bytes(9, 'big'),))
+        conn.commit()
+        conn.close()
+
+        cache = ScrapeResultCache(path=path, ttl=0, version='1')
+        assert cache.get('k') is None
+        cache.put('k', [2, 1])
+        assert cache.get('k') == [2, 1]
+        cache.close()
+
+    @pytest.mark.asyncio
+    async def test_scraper_uses_cache(self, cache):
+        """キャッシュヒット時は外部サイトにアクセスしないか"""
+        scraper = DungeonScraper(cache=cache)
+        calls = []
+
+        async def fake_fetch(values, return_raw_text=False):
+            calls.append(values)
+            return [60, 1, 4], ''
+
+        scraper._fetch = fake_fetch
+
+        # キャッシュの有無で外部サイトの表示順が変わらない
+        assert await scraper.scrape_numbers('1991-09-16', '13:50') == [60, 1, 4]
+        assert await scraper.scrape_numbers('1991-09-16', '13:50') == [60, 1, 4]
+        assert len(calls) == 1
@@ -0,0 +1,182 @@
+import pytest
+import sys
+import os
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import scrape_backends
+from backend.scraper import DungeonScraper
+from backend.scrape_backends import (
+    BackendUnavailable,
+    LearnedRequest,
+    LearnedRequestStore,
+    LEARN_SAMPLE,
+    RequestReplayBackend,
+    ResponseShapeChanged,
+    _find_numbers_path,
+    _numbers_at,
+    _render,
+    _renderings,
+    _templatize,
+    _templatize_pairs,
+    extract_numbers_from_html,
+)
+
+
+def make_learned() -> LearnedRequest:
+    return LearnedRequest({
+        'method': 'POST',
+        'url': 'https://example.com/api/result',
+        'query': [],
+        'headers': {'content-type': 'application/json'},
+        'body_kind': 'json',
+        'body': _templatize({'year': '1987', 'month': '3'}, _renderings(LEARN_SAMPLE)),
+        'response_kind': 'json',
+        'json_path': ['numbers', '*'],
+    })
+
+
+class FakeClient:
+    """指定した応答（または例外）を返すHTTPクライアント"""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    async def request(self, **kwargs):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+class TestRequestReplay:
+    """学習したリクエストの再送に関するテスト"""
+
+    def test_templatize_roundtrip(self):
+        """学習時の入力値がプレースホルダーになり、別の入力値で組み立て直せるか"""
+        body = {'birth': {'y': 1987, 'm': '3', 'd': '07'}, 'time': 'at 05:09', 'lang': 'ja'}
+        template = _templatize(body, _renderings(LEARN_SAMPLE))
+
+        rendered = _render(template, _renderings(('1991', '9', '16', '13', '50')))
+
+        assert rendered == {'birth': {'y': 1991, 'm': '9', 'd': '16'}, 'time': 'at 13:50', 'lang': 'ja'}
+
+    def test_templatize_pairs_only_values(self):
+        """クエリ文字列はキーを変えずに値だけ置き換えるか"""
+        pairs = _templatize_pairs([('year', '1987'), ('3', 'x')], _renderings(LEARN_SAMPLE))
+        assert pairs == [['year', {'$str': 'year'}], ['3', 'x']]
+
+    def test_find_numbers_path(self):
+        """JSON内の数字リストのパスを探せるか"""
+        payload = {'status': 'ok', 'result': {'cards': [{'no': 4, 'label': 'a'}, {'no': 11, 'label': 'b'}]}}
+
+        path = _find_numbers_path(payload, [11, 4])
+
+        assert path == ['result', 'cards', '*', 'no']
+        assert _numbers_at(payload, path) == [4, 11]
+
+    def test_extract_numbers_from_html(self):
+        """select/optionの数字を除外して結果セルだけを取り出すか"""
+        html = """
+        <select><option>1</option><option>2</option></select>
+        <table><tr><td>4</td><td><span>11</span></td><td>名前</td><td>99</td></tr></table>
+        """
+        assert extract_numbers_from_html(html) == [4, 11]
+
+    def test_learned_request_build_and_parse(self):
+        """学習結果からリクエストを組み立て、応答の形が変わったら検知するか"""
+        learned = LearnedRequest({
+            'method': 'POST',
+            'url': 'https://example.com/api/result',
+            'query': [],
+            'headers': {'content-type': 'application/json'},
+            'body_kind': 'json',
+            'body': _templatize({'year': '1987', 'month': '3'}, _renderings(LEARN_SAMPLE)),
+            'response_kind': 'json',
+            'json_path': ['numbers', '*'],
+        })
+
+        request = learned.build(('2000', '12', '31', '23', '59'))
+        assert request['json'] == {'year': '2000', 'month': '12'}
+
+        ok = httpx.Response(200, json={'numbers': [4, 11, 11]})
+        assert learned.parse(ok) == [4, 11]
+
+        with pytest.raises(BackendUnavailable):
+            learned.parse(httpx.Response(200, json={'items': []}))
+        with pytest.raises(BackendUnavailable):
+            learned.parse(httpx.Response(500))
+
+    def test_parse_distinguishes_transient_errors(self):
+        """5xx・429は一時的な障害、それ以外の非200は形の変化として区別するか"""
+        learned = make_learned()
+        for status in (500, 503, 429):
+            with pytest.raises(BackendUnavailable) as excinfo:
+                learned.parse(httpx.Response(status))
+            assert not isinstance(excinfo.value, ResponseShapeChanged)
+        with pytest.raises(ResponseShapeChanged):
+            learned.parse(httpx.Response(404))
+
+    @pytest.mark.asyncio
+    async def test_fetch_keeps_learned_on_transient_errors(self, tmp_path, monkeypatch):
+        """通信エラー・5xxはフォールバックさせるだけで学習結果を捨てず、形の変化では捨てるか"""
+        store = LearnedRequestStore(path=str(tmp_path / 'learned.json'))
+        store.save(make_learned())
+        backend = RequestReplayBackend(scraper=None, store=store)
+        values = ('2000', '12', '31', '23', '59')
+
+        for outcome in (httpx.ConnectError("refused"), httpx.Response(502)):
+            monkeypatch.setattr(scrape_backends, 'get_http_client', lambda: FakeClient(outcome))
+            with pytest.raises(BackendUnavailable):
+                await backend.fetch(values)
+            assert store.learned is not None
+        assert os.path.exists(store.path)
+
+        monkeypatch.setattr(scrape_backends, 'get_http_client', lambda: FakeClient(httpx.Response(200, json={'items': []})))
+        with pytest.raises(ResponseShapeChanged):
+            await backend.fetch(values)
+        assert store.learned is None
+        assert not os.path.exists(store.path)
+        assert backend.fallbacks == 3
+
+    @pytest.mark.asyncio
+    async def test_learn_retries_after_cooldown(self, tmp_path, monkeypatch):
+        """学習の失敗後は一定時間ブラウザにフォールバックし、時間が経てば学習し直すか"""
+        monkeypatch.setattr(scrape_backends.settings, 'SCRAPER_LEARN_RETRY_SECONDS', 60)
+        store = LearnedRequestStore(path=str(tmp_path / 'learned.json'))
+        backend = RequestReplayBackend(scraper=None, store=store)
+        attempts = []
+
+        async def failing_learn():
+            attempts.append(1)
+            raise RuntimeError("browser crashed")
+
+        backend.learn = failing_learn
+        for _ in range(2):
+            with pytest.raises(BackendUnavailable):
+                await backend._ensure_learned()
+        assert len(attempts) == 1
+
+        async def learn():
+            attempts.append(1)
+            store.save(make_learned())
+            return store.learned
+
+        backend.learn = learn
+        store.learn_retry_at = 0.0
+        assert await backend._ensure_learned() is store.learned
+        assert len(attempts) == 2
+
+
+class TestCreateBackend:
+    """バックエンドの作成に関するテスト"""
+
+    def test_browser_backend_is_shared(self):
+        """ブラウザ（と不明な名前）はフォールバック用と同じインスタンスを使うか"""
+        for name in ('browser', 'unknown'):
+            scraper = DungeonScraper(backend=name)
+            assert scraper.backend is scraper.browser_backend
+
+        scraper = DungeonScraper(backend='replay')
+        assert isinstance(scraper.backend, RequestReplayBackend)
+        assert scraper.backend is not scraper.browser_backend
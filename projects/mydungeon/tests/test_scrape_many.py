@@ -0,0 +1,138 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.admission import AdmissionController, AdmissionRejected
+from backend.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.hedging import HedgedExecutor
+from backend.key_buckets import TimeBucketTable
+from backend.result_cache import ScrapeResultCache
+from backend.scraper import DungeonScraper
+
+
+@pytest.fixture
+def scraper(tmp_path, fake_page_pool):
+    """送信を記録し、指定した入力で失敗するスクレイパー"""
+    cache = ScrapeResultCache(path=str(tmp_path / 'cache.sqlite3'))
+    scraper = DungeonScraper(
+        page_pool=fake_page_pool,
+        backend='browser',
+        cache=cache,
+        key_table=TimeBucketTable(),
+        executor=HedgedExecutor(retries=0, hedge_enabled=False),
+        breaker=CircuitBreaker(min_calls=100),
+        admission=AdmissionController(slots=1, queue_limit=0, queue_timeout=1)
+    )
+    scraper.submits = []
+    scraper.failing = set()
+
+    async def fake_submit(page, values, return_raw_text=False, resubmit=False):
+        scraper.submits.append((values, resubmit))
+        if values in scraper.failing:
+            raise RuntimeError("upstream error")
+        return [int(values[4]) + 2, int(values[4]) + 1], 'raw'
+
+    scraper._submit_and_extract = fake_submit
+    yield scraper
+    cache.close()
+
+
+class TestScrapeMany:
+    """DungeonScraper.scrape_manyのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_one_page_for_batch(self, scraper):
+        """1つのページで続けて送信し、2件目以降は再送信として扱われるか"""
+        inputs = [('1990-01-01', '10:01'), ('1990-01-01', '10:02'), ('1990-01-01', '10:03')]
+        items = [item async for item in scraper.scrape_many(inputs)]
+
+        assert [item.numbers for item in items] == [[3, 2], [4, 3], [5, 4]]
+        assert [resubmit for _, resubmit in scraper.submits] == [False, True, True]
+        assert scraper.page_pool.acquired == 1
+        assert scraper.page_pool.opened == 0
+        assert scraper.cache.get('1990-01-01 10:02') == [4, 3]
+
+    @pytest.mark.asyncio
+    async def test_cached_inputs_first(self, scraper):
+        """キャッシュにある入力は送信せずに先に返るか"""
+        scraper.cache.put('1990-01-01 10:02', [9])
+        inputs = [('1990-01-01', '10:01'), ('1990-01-01', '10:02')]
+        items = [item async for item in scraper.scrape_many(inputs)]
+
+        assert [(item.birthtime, item.numbers) for item in items] == [('10:02', [9]), ('10:01', [3, 2])]
+        assert len(scraper.submits) == 1
+
+    @pytest.mark.asyncio
+    async def test_error_isolation(self, scraper):
+        """1件の失敗が他の入力に影響せず、失敗後はフォームを開き直すか"""
+        scraper.failing.add(('1990', '1', '1', '10', '2'))
+        inputs = [('1990-01-01', '10:01'), ('1990-01-01', '10:02'), ('1990-01-01', '10:03'), ('bad', '10:00')]
+        items = [item async for item in scraper.scrape_many(inputs)]
+
+        errors = {item.birthtime: item.error for item in items}
+        assert isinstance(errors['10:00'], ValueError)
+        assert isinstance(errors['10:02'], RuntimeError)
+        assert errors['10:01'] is None and errors['10:03'] is None
+        assert scraper.page_pool.opened == 1
+        assert scraper.submits[-1] == (('1990', '1', '1', '10', '3'), False)
+
+    @pytest.mark.asyncio
+    async def test_raw_text_skips_cache(self, scraper):
+        """生テキストを要求した場合はキャッシュを使わないか"""
+        scraper.cache.put('1990-01-01 10:01', [9])
+        items = [item async for item in scraper.scrape_many([('1990-01-01', '10:01')], return_raw_text=True)]
+
+        assert items[0].numbers == [3, 2]
+        assert items[0].raw_text == 'raw'
+
+    @pytest.mark.asyncio
+    async def test_batch_holds_one_admission_slot(self, scraper):
+        """バッチ全体で受付制御のスロットを1つ使い、空きが無ければ断られるか"""
+        inputs = [('1990-01-01', '10:01'), ('1990-01-01', '10:02')]
+        in_use = []
+        async for _ in scraper.scrape_many(inputs):
+            in_use.append(scraper.admission.in_use)
+        assert in_use == [1, 1]
+        assert scraper.admission.in_use == 0
+
+        async with scraper.admission.slot():
+            with pytest.raises(AdmissionRejected):
+                [item async for item in scraper.scrape_many([('1990-01-01', '10:03')])]
+        assert len(scraper.submits) == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_goes_through_breaker(self, scraper):
+        """ブレーカーが開いていればバッチの入力を送信しないか"""
+        scraper.breaker._trip('test')
+        items = [item async for item in scraper.scrape_many([('1990-01-01', '10:01')])]
+
+        assert isinstance(items[0].error, CircuitOpenError)
+        assert scraper.submits == []
+
+    @pytest.mark.asyncio
+    async def test_retry_uses_another_page(self, scraper):
+        """一時的なエラーの再試行はバッチのページではなく別のページで行い、次の入力の前にフォームを開き直すか"""
+        scraper.executor.retries = 1
+        scraper.executor.base_delay = 0
+        fetched = []
+
+        async def flaky_submit(page, values, return_raw_text=False, resubmit=False):
+            scraper.submits.append((values, resubmit))
+            if len(scraper.submits) == 1:
+                raise ConnectionError("reset")
+            return [1], 'raw'
+
+        async def fresh_page_fetch(values, return_raw_text=False):
+            fetched.append(values)
+            return [2], 'raw'
+
+        scraper._submit_and_extract = flaky_submit
+        scraper.browser_backend.fetch = fresh_page_fetch
+        inputs = [('1990-01-01', '10:01'), ('1990-01-01', '10:02')]
+        items = [item async for item in scraper.scrape_many(inputs)]
+
+        assert [item.numbers for item in items] == [[2], [1]]
+        assert fetched == [('1990', '1', '1', '10', '1')]
+        assert scraper.page_pool.opened == 1
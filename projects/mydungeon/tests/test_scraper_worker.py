@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+import sys
+import os
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.scraper_worker import (
+    ScraperWorker, ScraperWorkerClient, ScraperWorkerError, ScraperWorkerUnavailable, worker_socket_paths
+)
+
+
+class FakeBackend:
+    def stats(self):
+        return {'name': 'fake'}
+
+
+class FakeScraper:
+    """ブラウザを使わないスクレイパー（時刻の分が0なら失敗する）"""
+
+    def __init__(self):
+        self.backend = FakeBackend()
+        self.calls = []
+
+    async def scrape_numbers(self, birthdate, birthtime, return_raw_text=False):
+        self.calls.append((birthdate, birthtime))
+        await asyncio.sleep(0.01)
+        if birthtime.endswith(':00'):
+            raise TimeoutError("upstream timed out")
+        numbers = [int(birthtime[-2:]), 1]
+        return (numbers, 'raw') if return_raw_text else numbers
+
+
+@asynccontextmanager
+async def running_worker(tmp_path):
+    """一時ソケットでワーカーを動かす"""
+    worker = ScraperWorker(str(tmp_path / 'worker.sock'), scraper=FakeScraper())
+    await worker.start()
+    try:
+        yield worker
+    finally:
+        await worker.stop()
+
+
+class TestScraperWorker:
+    """スクレイパーワーカーとクライアントのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_scrape_through_worker(self, tmp_path):
+        """クライアント経由でワーカーのスクレイパーの結果が返るか（1接続で同時に複数要求）"""
+        async with running_worker(tmp_path) as worker:
+            client = ScraperWorkerClient([worker.socket_path], timeout=5)
+            try:
+                results = await asyncio.gather(*[
+                    client.scrape_numbers('1990-01-01', f'12:{m:02d}') for m in range(1, 6)
+                ])
+                assert results == [[m, 1] for m in range(1, 6)]
+                assert await client.scrape_numbers('1990-01-01', '12:30', return_raw_text=True) == ([30, 1], 'raw')
+                assert worker.requests == 6
+            finally:
+                await client.close()
+
+    @pytest.mark.asyncio
+    async def test_error_is_forwarded(self, tmp_path):
+        """ワーカー側の例外が種類付きでクライアントに伝わるか"""
+        async with running_worker(tmp_path) as worker:
+            client = ScraperWorkerClient([worker.socket_path], timeout=5)
+            try:
+                with pytest.raises(ScraperWorkerError) as excinfo:
+                    await client.scrape_numbers('1990-01-01', '12:00')
+                assert excinfo.value.error_type == 'TimeoutError'
+                assert not isinstance(excinfo.value, ScraperWorkerUnavailable)
+                stats = await client.stats()
+                assert stats[0]['failures'] == 1
+            finally:
+                await client.close()
+
+    @pytest.mark.asyncio
+    async def test_failover_to_next_worker(self, tmp_path):
+        """接続できないワーカーを飛ばして次のワーカーに送るか"""
+        async with running_worker(tmp_path) as worker:
+            client = ScraperWorkerClient([str(tmp_path / 'missing.sock'), worker.socket_path], timeout=5)
+            try:
+                for m in range(1, 5):
+                    assert await client.scrape_numbers('1990-01-01', f'12:{m:02d}') == [m, 1]
+                assert client.failovers >= 1
+            finally:
+                await client.close()
+
+            client = ScraperWorkerClient([str(tmp_path / 'missing.sock')], timeout=5)
+            with pytest.raises(ScraperWorkerUnavailable):
+                await client.scrape_numbers('1990-01-01', '12:01')
+            await client.close()
+
+    def test_worker_socket_paths(self):
+        """--workers指定時のソケットパス"""
+        assert worker_socket_paths('/run/a.sock', 1) == ['/run/a.sock']
+        assert worker_socket_paths('/run/a.sock', 2) == ['/run/a-0.sock', '/run/a-1.sock']
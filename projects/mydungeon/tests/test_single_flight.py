@@ -0,0 +1,90 @@
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.single_flight import SingleFlight
+from backend.result_cache import ScrapeResultCache
+from backend.scraper import DungeonScraper
+
+
+class TestSingleFlight:
+    """SingleFlightのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_coalesces_concurrent_calls(self):
+        """同じキーの同時呼び出しが1回の実行にまとまるか"""
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return [1, 2, 3]
+
+        results = await asyncio.gather(*[flight.do('key', work) for _ in range(10)])
+
+        assert results == [[1, 2, 3]] * 10
+        assert len(calls) == 1
+        assert flight.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 9}
+
+    @pytest.mark.asyncio
+    async def test_error_propagates_to_all_waiters(self):
+        """例外が全ての待機者に伝わり、次の呼び出しは再実行されるか"""
+        flight = SingleFlight()
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*[flight.do('key', fail) for _ in range(3)], return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight.in_flight() == 0
+
+        with pytest.raises(RuntimeError):
+            await flight.do('key', fail)
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_leader_cancellation_does_not_cancel_waiters(self):
+        """最初の呼び出し元がキャンセルされても他の待機者は結果を受け取れるか"""
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return 'done'
+
+        leader = asyncio.ensure_future(flight.do('key', work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do('key', work))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == 'done'
+
+    @pytest.mark.asyncio
+    async def test_scraper_does_not_cache_failures(self, tmp_path):
+        """取得に失敗した場合はキャッシュに保存しないか"""
+        cache = ScrapeResultCache(path=str(tmp_path / 'cache.sqlite3'), ttl=0, version='1')
+        scraper = DungeonScraper(cache=cache)
+
+        async def failing_fetch(values, return_raw_text=False):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("timeout")
+
+        scraper._fetch = failing_fetch
+
+        results = await asyncio.gather(
+            scraper.scrape_numbers('1991-09-16', '13:50'),
+            scraper.scrape_numbers('1991-9-16', '13:50'),
+            return_exceptions=True
+        )
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.stats()['stores'] == 0
+        cache.close()
@@ -0,0 +1,109 @@
+import pytest
+import httpx
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import upstream_standin
+from backend.page_pool import FormPagePool
+from backend.scrape_backends import extract_numbers_from_html
+from backend.scraper import DungeonScraper
+from backend.upstream_standin import (
+    RecordingMissing, RecordingStore, UpstreamStandin, UpstreamTarget, parse_target_url, synthesize_numbers
+)
+
+
+@pytest.fixture
+def standin(tmp_path):
+    """空いているポートで動かした代替サーバー（1件記録済み）"""
+    store = RecordingStore(str(tmp_path / 'recordings.jsonl'))
+    store.add('1990-01-01 12:30', [5, 12, 40], '<table><tr><td>5</td><td>12</td><td>40</td></tr></table>')
+    standin = UpstreamStandin(store, port=0, latency_ms=0, synthesize=False)
+    standin.start()
+    yield standin
+    standin.stop()
+
+
+def post_result(standin, **values):
+    return httpx.post(standin.url + 'api/result', json=values, timeout=5)
+
+
+class TestUpstreamStandin:
+    """外部サイトの代替サーバーのテスト"""
+
+    def test_form_page(self, standin):
+        """スクレイパーが操作する要素を持つフォームを返すか"""
+        html = httpx.get(standin.url, timeout=5).text
+        assert 'fieldset name="dateFields"' in html
+        assert 'fieldset name="timeFields"' in html
+        assert 'class="button"' in html
+
+    def test_recorded_result(self, standin):
+        """記録した結果欄のHTMLを返し、先頭ゼロなしの入力でも同じ記録に当たるか"""
+        response = post_result(standin, year='1990', month='1', day='1', hour='12', minute='30')
+        assert response.status_code == 200
+        assert extract_numbers_from_html(response.json()['html']) == [5, 12, 40]
+        assert standin.hits == 1
+
+    def test_missing_and_synthesized(self, standin):
+        """記録に無い入力は404、疑似結果を有効にするとキーから決まる結果を返すか"""
+        assert post_result(standin, year='1990', month='1', day='2', hour='0', minute='0').status_code == 404
+
+        standin.synthesize = True
+        first = post_result(standin, year='1990', month='1', day='2', hour='0', minute='0').json()
+        second = post_result(standin, year='1990', month='1', day='2', hour='0', minute='0').json()
+        assert first['numbers'] == second['numbers'] == synthesize_numbers('1990-01-02 00:00')
+        assert extract_numbers_from_html(first['html']) == first['numbers']
+        assert standin.synthesized == 2
+
+
+class TestRecordReplay:
+    """記録・再生モードのテスト"""
+
+    def test_parse_target_url(self):
+        """TARGET_URLからモードを判定するか"""
+        assert parse_target_url('https://example.com/') == ('live', 'https://example.com/')
+        assert parse_target_url('record+https://example.com/') == ('record', 'https://example.com/')
+        assert parse_target_url('replay:/tmp/r.jsonl') == ('replay', '/tmp/r.jsonl')
+
+    def test_recordings_reload(self, tmp_path):
+        """追記した記録を読み直せ、同じキーは後の記録が優先されるか"""
+        path = str(tmp_path / 'recordings.jsonl')
+        store = RecordingStore(path)
+        store.add('1990-01-01 12:30', [1, 2])
+        store.add('1990-01-01 12:30', [3, 4])
+        reloaded = RecordingStore(path)
+        assert len(reloaded) == 1
+        assert reloaded.get('1990-01-01 12:30')['numbers'] == [3, 4]
+
+    @pytest.mark.asyncio
+    async def test_replay_missing_fails_fast(self, standin):
+        """再生モードで記録に無い入力はページを操作せずにすぐ失敗するか"""
+        target = UpstreamTarget('replay', standin.url, recordings=standin.store, standin=standin)
+        scraper = DungeonScraper(backend='browser', target=target)
+        with pytest.raises(RecordingMissing):
+            await scraper._submit_and_extract(object(), ('1990', '1', '2', '0', '0'))
+
+    def test_target_resolved_lazily(self, monkeypatch):
+        """ページプールとスクレイパーを作っただけでは接続先を解決しない（代替サーバーを起動しない）か"""
+        monkeypatch.setattr(upstream_standin, '_target', None)
+        pool = FormPagePool(size=0)
+        DungeonScraper(page_pool=pool, backend='browser')
+        assert upstream_standin._target is None
+
+        monkeypatch.setattr(upstream_standin.settings, 'TARGET_URL', 'https://example.com/')
+        assert pool.url == 'https://example.com/'
+        assert upstream_standin._target.mode == 'live'
+
+    def test_cache_disabled_in_replay(self, monkeypatch):
+        """再生モードではSCRAPE_CACHE_IN_REPLAYを有効にした場合だけキャッシュを使うか"""
+        monkeypatch.setattr(upstream_standin.settings, 'SCRAPE_CACHE_ENABLED', True)
+        monkeypatch.setattr(upstream_standin.settings, 'SCRAPE_CACHE_IN_REPLAY', False)
+        replay = DungeonScraper(backend='browser', target=UpstreamTarget('replay', 'http://127.0.0.1:1/'))
+        live = DungeonScraper(backend='browser', target=UpstreamTarget('live', 'https://example.com/'))
+        assert not replay.cache_enabled
+        assert live.cache_enabled
+
+        monkeypatch.setattr(upstream_standin.settings, 'SCRAPE_CACHE_IN_REPLAY', True)
+        assert replay.cache_enabled
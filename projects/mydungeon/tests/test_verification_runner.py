@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.verification_runner import CaseResult, ConcurrentRunner, build_report, percentile, write_report
+
+
+class TestConcurrentRunner:
+    """検証ハーネスの並列ランナーのテスト"""
+
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency(self):
+        """同時実行数が上限を超えず、結果が入力順に並ぶか"""
+        running = 0
+        peak = 0
+
+        async def check(birthdate, birthtime):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return None
+
+        inputs = [('1990-01-01', f'12:{m:02d}') for m in range(10)]
+        results, elapsed = await ConcurrentRunner(concurrency=3).run(inputs, check)
+
+        assert peak == 3
+        assert [r.birthtime for r in results] == [t for _, t in inputs]
+        assert all(r.passed for r in results)
+
+    @pytest.mark.asyncio
+    async def test_mismatch_and_error(self):
+        """不一致と例外がケースごとに記録され、他のケースを止めないか"""
+        async def check(birthdate, birthtime):
+            if birthtime == '12:01':
+                return "mismatch"
+            if birthtime == '12:02':
+                raise TimeoutError("upstream timed out")
+            return None
+
+        inputs = [('1990-01-01', f'12:{m:02d}') for m in range(4)]
+        seen = []
+        results, _ = await ConcurrentRunner(concurrency=2).run(inputs, check, lambda r, done: seen.append(done))
+
+        assert [r.passed for r in results] == [True, False, False, True]
+        assert results[1].mismatch == "mismatch"
+        assert results[2].error == "TimeoutError: upstream timed out"
+        assert seen == [1, 2, 3, 4]
+
+
+class TestReport:
+    """レポートのテスト"""
+
+    def test_build_report(self, tmp_path):
+        """パーセンタイル・不一致・エラーがレポートに載るか"""
+        results = [CaseResult(i, '1990-01-01', f'12:{i:02d}', True, (i + 1) / 1000) for i in range(100)]
+        results[5] = results[5]._replace(passed=False, mismatch="diff")
+        results[6] = results[6]._replace(passed=False, error="TimeoutError: x")
+
+        report = build_report('accuracy', results, elapsed=2.0, concurrency=4)
+        assert report['total'] == 100 and report['passed'] == 98 and report['failed'] == 2
+        assert report['latency_ms']['p50'] == 50.0
+        assert report['latency_ms']['p99'] == 99.0
+        assert report['latency_ms']['max'] == 100.0
+        assert report['throughput_per_second'] == 50.0
+        assert report['mismatches'] == [{'birthdate': '1990-01-01', 'birthtime': '12:05', 'detail': 'diff'}]
+        assert report['errors'][0]['birthtime'] == '12:06'
+
+        path = str(tmp_path / 'report.json')
+        write_report(report, path)
+        with open(path, encoding='utf-8') as f:
+            assert json.load(f)['total'] == 100
+
+    def test_percentile(self):
+        """最近傍法のパーセンタイル"""
+        assert percentile([], 95) is None
+        assert percentile([0.1, 0.2, 0.3, 0.4], 50) == 0.2